@@ -0,0 +1,386 @@
+"""
+Vectorized time-series analytics for the Smart Agri Investment platform
+Loads a farm's performance history as columnar NumPy arrays, decoded from its
+packed yearly segments (see segments.py), and computes the
+series behind the /api/* chart endpoints without per-row Python loops. Chart
+payloads take an optional resolution (points) and are downsampled once computed,
+so derived figures still see the whole history
+
+Elementwise work is vectorized, but totals the previous per-row code took with
+Python's sum() are still added up left to right (NumPy sums pairwise, which can
+differ in the last bit), so payloads match it exactly
+"""
+
+import json
+import math
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+from app import db
+from models import FarmSeriesSegment
+from downsample import downsample_indices, take
+from segments import DAY_DTYPE, VALUE_DTYPE
+
+
+# Weather impact scores on yield (simplified)
+WEATHER_IMPACT = {
+    'Sunny': 1.1,
+    'Cloudy': 0.9,
+    'Rainy': 0.8,
+    'Storm': 0.6,
+    'Drought': 0.5,
+    'Ideal': 1.2,
+    'Cold': 0.7,
+    'Hot': 0.85
+}
+
+# Weather risk mapping
+WEATHER_RISK = {
+    'Sunny': 10,
+    'Cloudy': 25,
+    'Rainy': 40,
+    'Storm': 75,
+    'Drought': 90,
+    'Ideal': 5,
+    'Cold': 50,
+    'Hot': 60
+}
+
+# Base risk by opportunity risk level ("High" and unknown levels use 75)
+BASE_RISK = {
+    'Low': 20,
+    'Medium': 50
+}
+
+SEGMENT_COLUMNS = (
+    FarmSeriesSegment.days,
+    FarmSeriesSegment.yields,
+    FarmSeriesSegment.revenues,
+    FarmSeriesSegment.expenses,
+    FarmSeriesSegment.profits,
+    FarmSeriesSegment.weather_conditions
+)
+
+
+def _decode(blobs, dtype):
+    """One array over packed blobs; a single blob is decoded without copying"""
+    arrays = [np.frombuffer(blob, dtype=dtype) for blob in blobs]
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+
+class FarmHistory:
+    """Columnar performance history for a single farm, ordered by date"""
+
+    def __init__(self, dates, yields, revenues, expenses, profits, weather_conditions):
+        self.dates = list(dates)
+        self.yields = np.asarray(yields, dtype=float)
+        self.revenues = np.asarray(revenues, dtype=float)
+        self.expenses = np.asarray(expenses, dtype=float)
+        self.profits = np.asarray(profits, dtype=float)
+        self.weather_conditions = list(weather_conditions)
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Build a history from (days, yields, revenues, expenses, profits, weather) segments in year order"""
+        days, yields, revenues, expenses, profits, weather = zip(*segments) if segments else ([],) * 6
+        return cls(
+            _decode(days, DAY_DTYPE).astype('datetime64[D]').tolist(),
+            _decode(yields, VALUE_DTYPE),
+            _decode(revenues, VALUE_DTYPE),
+            _decode(expenses, VALUE_DTYPE),
+            _decode(profits, VALUE_DTYPE),
+            chain.from_iterable(json.loads(labels) for labels in weather)
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def date_labels(self):
+        return [d.strftime('%Y-%m-%d') for d in self.dates]
+
+    def downsampled(self, points, method='lttb'):
+        """The periods that keep the shape of the profit, revenue and expense lines within `points`"""
+        indices = downsample_indices([self.profits, self.revenues, self.expenses], points, method)
+        if indices is None:
+            return self
+        return FarmHistory(
+            take(self.dates, indices), self.yields[indices], self.revenues[indices],
+            self.expenses[indices], self.profits[indices], take(self.weather_conditions, indices)
+        )
+
+
+def load_farm_history(farm_id):
+    """Load a farm's performance history from its packed yearly segments"""
+    segments = db.session.execute(
+        db.select(*SEGMENT_COLUMNS)
+        .where(FarmSeriesSegment.farm_id == farm_id)
+        .order_by(FarmSeriesSegment.year)
+    ).all()
+    return FarmHistory.from_segments(segments)
+
+
+def load_farm_histories(farm_ids):
+    """Load the histories of several farms with one query, keyed by farm id"""
+    farm_ids = set(farm_ids)
+    if not farm_ids:
+        return {}
+    segments = db.session.execute(
+        db.select(FarmSeriesSegment.farm_id, *SEGMENT_COLUMNS)
+        .where(FarmSeriesSegment.farm_id.in_(farm_ids))
+        .order_by(FarmSeriesSegment.farm_id, FarmSeriesSegment.year)
+    ).all()
+
+    grouped = {farm_id: [] for farm_id in farm_ids}
+    for segment in segments:
+        grouped[segment[0]].append(segment[1:])
+    return {farm_id: FarmHistory.from_segments(farm_segments) for farm_id, farm_segments in grouped.items()}
+
+
+def _thin(data, series_keys, aligned_keys, points, method):
+    """Downsample the listed series of a payload, and the lists aligned with them, in place"""
+    indices = downsample_indices([data[key] for key in series_keys], points, method)
+    if indices is not None:
+        for key in series_keys + aligned_keys:
+            data[key] = take(data[key], indices)
+    return data
+
+
+def json_values(values):
+    """The values of an array or list, with the NaN of missing values as None (null in JSON)"""
+    if isinstance(values, np.ndarray):
+        values = values.tolist()
+    return [None if isinstance(value, float) and math.isnan(value) else value for value in values]
+
+
+def _rounded(values, ndigits=2):
+    # Python's round() is used so the JSON matches the previous per-row output exactly
+    return [round(value, ndigits) for value in values.tolist()]
+
+
+def _map_conditions(conditions, table, default):
+    """Map weather condition labels to scores, looking up each distinct label once"""
+    if not conditions:
+        return np.empty(0, dtype=float)
+    labels, inverse = np.unique(np.asarray(conditions, dtype=object).astype(str), return_inverse=True)
+    scores = np.array([table.get(label, default) for label in labels], dtype=float)
+    return scores[inverse]
+
+
+def _safe_ratio(numerator, denominator, mask):
+    """Elementwise numerator / denominator where mask is set, NaN elsewhere"""
+    out = np.full(numerator.shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=mask)
+    return out
+
+
+def roi_series(history, target_roi):
+    """Per-period ROI scaled to the target ROI, plus the cumulative ROI"""
+    has_revenue = history.revenues > 0
+    period_roi = _safe_ratio(history.profits, history.revenues, has_revenue) * 100
+    adjusted_roi = period_roi * (target_roi / 15)  # Scaling factor
+
+    rounded = _rounded(adjusted_roi)
+    roi_values = [value if positive else 0 for value, positive in zip(rounded, has_revenue.tolist())]
+
+    # Periods with revenue but no recorded profit add nothing
+    earned = adjusted_roi[has_revenue & ~np.isnan(adjusted_roi)]
+    cumulative_roi = sum(earned.tolist())
+    return roi_values, cumulative_roi
+
+
+def average_yield(history):
+    """Mean of the recorded yields, summed in row order; 0 without any"""
+    yields = history.yields[np.isfinite(history.yields)].tolist()
+    return sum(yields) / len(yields) if yields else 0
+
+
+def weather_yield_series(history, base_yield):
+    """Weather-adjusted predicted yields around a farm's average yield"""
+    impact = _map_conditions(history.weather_conditions, WEATHER_IMPACT, 1.0)
+    return _rounded(base_yield * impact)
+
+
+def price_series(history):
+    """Historical price per unit and the average period-over-period change
+
+    Periods without yield or revenue carry the previous price forward (10.0 if none yet).
+    """
+    n = len(history)
+    if n == 0:
+        return [], 0
+
+    has_yield = (history.yields > 0) & ~np.isnan(history.revenues)
+    prices = np.array(_rounded(_safe_ratio(history.revenues, history.yields, has_yield)))
+
+    # Forward-fill periods without yield from the last priced period
+    last_priced = np.where(has_yield, np.arange(n), -1)
+    np.maximum.accumulate(last_priced, out=last_priced)
+    prices = np.where(last_priced >= 0, prices[np.maximum(last_priced, 0)], 10.0)
+
+    avg_change = sum(np.diff(prices).tolist()) / (n - 1) if n >= 2 else 0
+    return prices.tolist(), avg_change
+
+
+def risk_series(history, risk_level):
+    """Volatility, weather, financial and overall risk scores per period"""
+    base_risk = BASE_RISK.get(risk_level, 75)
+    n = len(history)
+    profits = history.profits
+
+    # Volatility risk based on profit variability
+    previous = np.concatenate(([np.nan], profits[:-1])) if n else profits
+    has_previous = previous > 0
+    profit_change = np.abs(_safe_ratio(profits - previous, previous, has_previous))
+    volatility = np.where(has_previous, np.minimum(np.trunc(profit_change * 100), 100), base_risk)
+    volatility = np.nan_to_num(volatility).astype(np.int64)
+
+    # Weather risk based on conditions
+    weather = _map_conditions(history.weather_conditions, WEATHER_RISK, 30).astype(np.int64)
+
+    # Financial risk based on profit margin
+    has_revenue = history.revenues > 0
+    profit_margin = _safe_ratio(profits, history.revenues, has_revenue)
+    financial = np.where(has_revenue, np.clip(np.trunc((1 - profit_margin) * 100), 0, 100), base_risk)
+    financial = np.nan_to_num(financial).astype(np.int64)
+
+    # Weighted overall risk
+    overall = np.trunc(0.3 * volatility + 0.3 * weather + 0.4 * financial).astype(np.int64)
+    categories = np.where(overall < 30, 'Low', np.where(overall < 60, 'Medium', 'High'))
+
+    return {
+        'volatility_risks': volatility.tolist(),
+        'weather_risks': weather.tolist(),
+        'financial_risks': financial.tolist(),
+        'overall_risks': overall.tolist(),
+        'risk_categories': categories.tolist()
+    }
+
+
+# Series served by the analytics bundle endpoint, by what they are computed for
+FARM_SERIES = ('weather_yield', 'market_price_prediction')
+OPPORTUNITY_SERIES = ('roi_trends', 'risk_levels')
+
+
+def roi_trends_data(opportunity, farm, history, points=None, method='lttb'):
+    """ROI trends chart payload of an opportunity"""
+    dates = history.date_labels()
+    
+    # Calculate monthly ROI values based on profit margins
+    target_roi = opportunity.expected_roi
+    roi_values, cumulative_roi = roi_series(history, target_roi)
+    
+    # Project future ROI if needed to extend the chart
+    if len(dates) < 12:
+        # Calculate simple trend for projection
+        for i in range(len(dates), 12):
+            projected_date = datetime.strptime(dates[-1], '%Y-%m-%d')
+            projected_date = projected_date.replace(month=projected_date.month + (i - len(dates) + 1))
+            dates.append(projected_date.strftime('%Y-%m-%d'))
+            roi_values.append(round(roi_values[-1] * 1.05, 2))  # 5% growth each period
+    
+    data = {
+        'opportunity_name': opportunity.title,
+        'farm_name': farm.name,
+        'target_roi': target_roi,
+        'dates': dates,
+        'roi_values': json_values(roi_values),
+        'cumulative_roi': round(cumulative_roi, 2)
+    }
+    return _thin(data, ['roi_values'], ['dates'], points, method)
+
+
+def weather_yield_data(farm, history, points=None, method='lttb'):
+    """Weather vs. yield chart payload of a farm, around its average yield"""
+    dates = history.date_labels()
+    
+    # Generate predicted yields based on weather correlation
+    base_yield = average_yield(history)
+    yields_predicted = weather_yield_series(history, base_yield)
+    
+    # Project future yields based on seasonal patterns
+    # This would use more sophisticated models in a real application
+    future_dates = []
+    future_predictions = []
+    
+    # For demo purposes, project 3 months ahead
+    if dates:
+        last_date = history.dates[-1]
+        for i in range(1, 4):
+            future_date = last_date.replace(month=last_date.month + i)
+            future_dates.append(future_date.strftime('%Y-%m-%d'))
+            
+            # Simple yield prediction based on seasonality
+            month_factor = 1 + (0.1 * ((future_date.month % 12) / 12))
+            future_yield = base_yield * month_factor
+            future_predictions.append(round(future_yield, 2))
+    
+    data = {
+        'farm_name': farm.name,
+        'dates': dates,
+        'future_dates': future_dates,
+        'yields_actual': json_values(history.yields),
+        'yields_predicted': yields_predicted,
+        'future_predictions': future_predictions,
+        'weather_conditions': history.weather_conditions
+    }
+    return _thin(data, ['yields_actual', 'yields_predicted'], ['dates', 'weather_conditions'], points, method)
+
+
+def market_price_data(farm, history, points=None, method='lttb'):
+    """Market price prediction chart payload of a farm"""
+    dates = history.date_labels()
+    
+    # Calculate historical price per unit and its average trend
+    prices, avg_change = price_series(history)
+    
+    # For prediction, we'll use a simple time series forecast
+    # In a real app, this would use a more sophisticated model
+    future_dates = []
+    future_prices = []
+    
+    if prices:
+        # Add seasonality factor
+        last_date = history.dates[-1]
+        last_price = prices[-1]
+        
+        # Project 6 months ahead
+        for i in range(1, 7):
+            projected_date = last_date.replace(month=((last_date.month - 1 + i) % 12) + 1)
+            if projected_date.month == 1:
+                projected_date = projected_date.replace(year=projected_date.year + 1)
+                
+            future_dates.append(projected_date.strftime('%Y-%m-%d'))
+            
+            # Seasonal factor (highest in summer, lowest in winter)
+            month = projected_date.month
+            seasonal_factor = 1 + 0.1 * math.sin(math.pi * (month - 3) / 6)
+            
+            # Project price with trend and seasonality
+            projected_price = last_price + (avg_change * i * seasonal_factor)
+            future_prices.append(round(max(projected_price, 0.1), 2))  # Ensure no negative prices
+    
+    data = {
+        'farm_name': farm.name,
+        'farm_type': farm.farm_type,
+        'dates': dates,
+        'historical_prices': prices,
+        'future_dates': future_dates,
+        'predicted_prices': future_prices
+    }
+    return _thin(data, ['historical_prices'], ['dates'], points, method)
+
+
+def risk_levels_data(opportunity, farm, history, points=None, method='lttb'):
+    """Risk levels chart payload of an opportunity"""
+    data = {
+        'opportunity_name': opportunity.title,
+        'farm_name': farm.name,
+        'dates': history.date_labels(),
+        'base_risk_level': opportunity.risk_level
+    }
+    data.update(risk_series(history, opportunity.risk_level))
+    risks = ['volatility_risks', 'weather_risks', 'financial_risks', 'overall_risks']
+    return _thin(data, risks, ['dates', 'risk_categories'], points, method)
@@ -7,6 +7,9 @@ from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 
+import database
+import passwords
+
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -16,40 +19,97 @@ class Base(DeclarativeBase):
 
 
 db = SQLAlchemy(model_class=Base)
-# create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "agri-investment-default-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
-
-# Configure the database
-# Use SQLite as the default database for now
-database_url = "sqlite:///agri_investment.db"
-app.logger.info(f"Using database: {database_url}")
-
-app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # Set up Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
-# initialize the app with the extension, flask-sqlalchemy >= 3.0.x
-db.init_app(app)
 
-with app.app_context():
-    # Make sure to import the models here or their tables won't be created
-    import models  # noqa: F401
+@login_manager.user_loader
+def load_user(user_id):
+    # A cached snapshot of the identity fields, not the User row (see identity.py)
+    from identity import load_identity
+    return load_identity(int(user_id))
+
+
+def create_app(config=None):
+    """Create and configure the Flask app, with its views and CLI commands
+
+    Only wiring happens here: the schema is managed by migrations.py
+    (python migrations.py / flask db-upgrade) and nothing touches the database.
+    Each call builds an independent app; main.py holds the one gunicorn serves.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "agri-investment-default-key")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+
+    # Settings passed in win; everything below only fills in what they leave unset
+    app.config.update(config or {})
+
+    # Configure the database from DATABASE_URL (see database.py), SQLite by default
+    database.init_app(app)
+    app.config.setdefault("SQLALCHEMY_TRACK_MODIFICATIONS", False)
+
+    # Seconds browsers and proxies may reuse cached per-farm API responses before revalidating
+    app.config.setdefault("API_CACHE_MAX_AGE", int(os.environ.get("API_CACHE_MAX_AGE", 60)))
+
+    # Monte Carlo paths per ROI projection, and processes to simulate them in (0: in the request)
+    app.config.setdefault("PROJECTION_PATHS", int(os.environ.get("PROJECTION_PATHS", 5000)))
+    app.config.setdefault("PROJECTION_WORKERS", int(os.environ.get("PROJECTION_WORKERS", 0)))
+
+    # Password hash parameters and the per-process hashing pool (see passwords.py)
+    passwords.init_app(app)
+
+    # Seconds between funding ledger compactions in each gunicorn worker (0: only via the CLI)
+    app.config.setdefault("FUNDING_COMPACTION_INTERVAL", float(os.environ.get("FUNDING_COMPACTION_INTERVAL", 5)))
+
+    # Seconds a worker may serve a cached current_user before reloading it (0: always load)
+    app.config.setdefault("USER_CACHE_TTL", int(os.environ.get("USER_CACHE_TTL", 60)))
+
+    database_url = database.make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.logger.info(f"Using database: {database_url.render_as_string(hide_password=True)}")
+
+    login_manager.init_app(app)
+
+    # initialize the app with the extension, flask-sqlalchemy >= 3.0.x
+    db.init_app(app)
+
+    with app.app_context():
+        import models  # noqa: F401
+
+        # WAL and the other SQLite pragmas, on every connection the engine opens
+        database.configure_sqlite(db.engine, app.config["SQLITE_PRAGMAS"])
+
+        # Keeps per-farm performance rollups in sync with FarmPerformance writes
+        import rollups  # noqa: F401
+
+        # Drops cached identities when their users are updated
+        import identity  # noqa: F401
+
+        # Per-request query count and latency instrumentation, exposed on /metrics
+        import metrics
+        metrics.init_app(app, db.engine)
+
+        # The {% cache %} tag for template fragments
+        import fragments
+        fragments.init_app(app)
+
+    # Fingerprinted, precompressed static assets on /assets/ and asset_url() for templates
+    import assets
+    assets.init_app(app)
+
+    # The pages and the JSON API
+    import routes
+    app.register_blueprint(routes.bp)
 
-    db.create_all()
+    # flask db-upgrade, ingest-performance and compact-funding
+    import migrations
+    import ingestion
+    import funding
+    migrations.init_app(app)
+    ingestion.init_app(app)
+    funding.init_app(app)
 
-    # Setup user loader for Flask-Login
-    @login_manager.user_loader
-    def load_user(user_id):
-        return models.User.query.get(int(user_id))
+    return app
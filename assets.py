@@ -0,0 +1,470 @@
+"""
+Static asset pipeline for the Smart Agri Investment platform
+The build minifies the stylesheets, scripts and SVGs under static/ and writes
+every asset to static/dist/ under a name carrying a hash of its content, with a
+gzip copy of each text asset next to it (and a brotli copy when the brotli
+package is installed). Stylesheet url() references are pointed at the hashed
+names, and with Pillow installed the 1024px app icon is resized into optimized
+PNG and WebP icons. static/dist/manifest.json maps source names to built names.
+
+Templates link assets with asset_url('js/analytics.js'). Built assets are served
+from /assets/ with a one-year immutable Cache-Control, since changed content
+gets a new name, and the precompressed copy matching Accept-Encoding is sent as
+is, so nothing is compressed per request. Without a build, asset_url() falls
+back to the plain /static/ files.
+
+Bootstrap, Chart.js and Font Awesome are vendored into static/vendor/ by the
+vendor command, which needs network access once. Pages never load them from a
+CDN: the build fails while any of them is missing, and until they are vendored
+asset_url() has no URL for them. The deployment build runs vendor, then build;
+the manifest is read once per process, so restart the workers after a build.
+
+Usage:
+    python assets.py vendor         # download the third-party assets into static/vendor/
+    python assets.py build          # build static/ into static/dist/
+    flask --app main assets-build   # same as the second, via the Flask CLI
+"""
+
+import io
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+import posixpath
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import click
+from flask import request, url_for, send_from_directory, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip copies are built
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(PROJECT_ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+
+# Files taken into the build, by extension
+ASSET_EXTENSIONS = ('.css', '.js', '.svg', '.png', '.webp', '.woff2', '.ttf')
+
+# Extensions worth precompressing; woff2 and the image formats are compressed already
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.ttf')
+
+# Precompressed copies by Content-Encoding, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Hex digits of the content hash in built names
+HASH_LENGTH = 12
+
+# Built names change with their content, so browsers may keep them for good
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+
+# Third-party assets by their name under static/, and where the vendor command fetches them
+VENDOR_ASSETS = {
+    'vendor/bootstrap/bootstrap-agent-dark-theme.min.css':
+        'https://cdn.replit.com/agent/bootstrap-agent-dark-theme.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/chart.js/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.js',
+    'vendor/fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+}
+# The webfonts all.min.css loads, relative to its css/ directory
+VENDOR_ASSETS.update({
+    f'vendor/fontawesome/webfonts/{font}.{extension}': f'{FONT_AWESOME}/webfonts/{font}.{extension}'
+    for font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+    for extension in ('woff2', 'ttf')
+})
+
+# The app icon, and the square sizes built from it (favicon, apple-touch-icon, PWA icons)
+ICON_SOURCE = os.path.join(PROJECT_ROOT, 'generated-icon.png')
+ICON_SIZES = (32, 180, 192, 512)
+
+_manifest = None
+
+
+class BuildError(Exception):
+    """Raised when the build cannot produce a complete set of assets"""
+
+
+# Minification
+
+# Characters after which a slash starts a regular expression rather than a division
+_REGEX_PRECEDERS = frozenset('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = frozenset(('return', 'typeof', 'instanceof', 'case', 'do', 'else', 'in', 'of', 'new',
+                             'delete', 'void', 'throw', 'yield', 'await'))
+_TRAILING_WORD = re.compile(r'[A-Za-z_$][\w$]*$')
+
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+_CSS_PLACEHOLDER = re.compile('\x00(\\d+)\x00')
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def _string_end(source, i, quote):
+    i += 1
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 2
+        elif c == quote or c == '\n':
+            return i + 1 if c == quote else i
+        else:
+            i += 1
+    return len(source)
+
+
+def _template_end(source, i):
+    """Index past the template literal text from i, and whether it stopped at a ${ substitution"""
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 2
+        elif c == '`':
+            return i + 1, False
+        elif c == '$' and source.startswith('{', i + 1):
+            return i + 2, True
+        else:
+            i += 1
+    return len(source), False
+
+
+def _regex_end(source, i):
+    i += 1
+    in_class = False
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '\n':
+            return i
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            break
+        i += 1
+    while i < len(source) and (source[i].isalnum() or source[i] == '_'):
+        i += 1
+    return i
+
+
+def _starts_regex(out):
+    tail = ''.join(out[-8:]).rstrip()
+    if not tail or tail[-1] in _REGEX_PRECEDERS:
+        return True
+    word = _TRAILING_WORD.search(tail)
+    return word is not None and word.group() in _REGEX_KEYWORDS
+
+
+def minify_js(source):
+    """Drop comments, indentation and blank lines from a script
+
+    Line breaks are kept, so automatic semicolon insertion reads the script as
+    before; strings, template literals and regular expressions are copied as is.
+    """
+    out = []
+    substitutions = []  # open braces in each ${...} being scanned
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c == '/' and source.startswith('/', i + 1):
+            end = source.find('\n', i)
+            i = n if end < 0 else end
+        elif c == '/' and source.startswith('*', i + 1):
+            end = source.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            separator = '\n' if '\n' in source[i:end] else ' '
+            if out and not out[-1].endswith(('\n', separator)):
+                out.append(separator)
+            i = end
+        elif c in '\'"':
+            end = _string_end(source, i, c)
+            out.append(source[i:end])
+            i = end
+        elif c == '`' or (c == '}' and substitutions and substitutions[-1] == 0):
+            if c == '}':
+                substitutions.pop()
+            end, opened = _template_end(source, i + 1)
+            if opened:
+                substitutions.append(0)
+            out.append(source[i:end])
+            i = end
+        elif c == '/' and _starts_regex(out):
+            end = _regex_end(source, i)
+            out.append(source[i:end])
+            i = end
+        elif c in ' \t\r\n':
+            while out and out[-1] == ' ':
+                out.pop()
+            if c == '\n':
+                if out and not out[-1].endswith('\n'):
+                    out.append('\n')
+            elif out and not out[-1].endswith('\n'):
+                out.append(' ')
+            i += 1
+        else:
+            if substitutions and c in '{}':
+                substitutions[-1] += 1 if c == '{' else -1
+            out.append(c)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(source):
+    """Drop comments and the whitespace around braces, semicolons, commas and child combinators"""
+    strings = []
+
+    def keep_strings(match):
+        if match.group(1) is None:
+            return ' '
+        strings.append(match.group(1))
+        return f'\x00{len(strings) - 1}\x00'
+
+    css = _CSS_TOKENS.sub(keep_strings, source)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r' ?([{};,>]) ?', r'\1', css).replace(';}', '}')
+    return _CSS_PLACEHOLDER.sub(lambda match: strings[int(match.group(1))], css).strip()
+
+
+def minify_svg(source):
+    """Drop comments and the whitespace between elements"""
+    svg = re.sub(r'<!--.*?-->', '', source, flags=re.S)
+    return re.sub(r'>\s+<', '><', svg).strip()
+
+
+MINIFIERS = {'.js': minify_js, '.css': minify_css, '.svg': minify_svg}
+
+
+def minify(name, content):
+    """Minified content of an asset; third-party .min files are already minified"""
+    base, extension = posixpath.splitext(name)
+    minifier = MINIFIERS.get(extension)
+    if minifier is None or base.endswith('.min'):
+        return content
+    return minifier(content.decode('utf-8')).encode('utf-8')
+
+
+# Build
+
+def _rewrite_css_urls(name, css, manifest):
+    """Point a stylesheet's relative url() references at the built names of their targets"""
+    directory = posixpath.dirname(name)
+
+    def replace(match):
+        quote, url = match.groups()
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        if not path or '://' in path or path.startswith(('/', 'data:')):
+            return match.group(0)
+        built = manifest.get(posixpath.normpath(posixpath.join(directory, path)))
+        if built is None:
+            return match.group(0)
+        return f'url({quote}{posixpath.relpath(built, directory or ".")}{suffix}{quote})'
+
+    return _CSS_URL.sub(replace, css.decode('utf-8')).encode('utf-8')
+
+
+def fingerprint(name, content):
+    """The built name of an asset: js/analytics.js -> js/analytics.<hash>.js"""
+    base, extension = posixpath.splitext(name)
+    return f'{base}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{extension}'
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+def _write_asset(dist_dir, built, content):
+    path = os.path.join(dist_dir, *built.split('/'))
+    _write(path, content)
+    if not built.endswith(COMPRESSIBLE_EXTENSIONS):
+        return
+    copies = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        copies['.br'] = brotli.compress(content, quality=11)
+    for suffix, compressed in copies.items():
+        # Only kept when it saves something; the server falls back to the plain file
+        if len(compressed) < len(content):
+            _write(path + suffix, compressed)
+
+
+def icon_variants(source=ICON_SOURCE, sizes=ICON_SIZES):
+    """Resized PNG and WebP icons as {name: content}; empty without Pillow or the source image"""
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow is not installed; skipping the icon variants")
+        return {}
+    if not os.path.exists(source):
+        return {}
+    variants = {}
+    with Image.open(source) as image:
+        image = image.convert('RGBA')
+        for size in sizes:
+            resized = image.resize((size, size), Image.LANCZOS)
+            for extension, options in (('png', {'optimize': True}), ('webp', {'quality': 85, 'method': 6})):
+                buffer = io.BytesIO()
+                resized.save(buffer, extension.upper(), **options)
+                variants[f'img/icon-{size}.{extension}'] = buffer.getvalue()
+    return variants
+
+
+def collect_sources(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Source assets under static/ (the build output excluded) as {name: content}"""
+    sources = {}
+    for root, directories, files in os.walk(static_dir):
+        directories[:] = sorted(d for d in directories if os.path.join(root, d) != dist_dir)
+        for filename in files:
+            if filename.endswith(ASSET_EXTENSIONS):
+                path = os.path.join(root, filename)
+                with open(path, 'rb') as f:
+                    sources[os.path.relpath(path, static_dir).replace(os.sep, '/')] = f.read()
+    return sources
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Minify, fingerprint and precompress the assets into dist_dir; returns the new manifest
+
+    Files of earlier builds are left in place, so pages still open in browsers
+    keep loading the assets they were rendered with.
+    """
+    sources = collect_sources(static_dir, dist_dir)
+    missing = sorted(name for name in VENDOR_ASSETS if name not in sources)
+    if missing:
+        raise BuildError(f"{len(missing)} third-party asset(s) are not vendored, run `python assets.py vendor` "
+                         f"first: {', '.join(missing)}")
+    sources.update(icon_variants())
+
+    manifest = {}
+    # Stylesheets last, so the fonts and images they reference already have built names
+    for name in sorted(sources, key=lambda name: (name.endswith('.css'), name)):
+        content = minify(name, sources[name])
+        if name.endswith('.css'):
+            content = _rewrite_css_urls(name, content, manifest)
+        built = fingerprint(name, content)
+        _write_asset(dist_dir, built, content)
+        manifest[name] = built
+
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    global _manifest
+    _manifest = manifest
+    return manifest
+
+
+def vendor(static_dir=STATIC_DIR, force=False):
+    """Download the third-party assets into static/vendor/; returns the names fetched"""
+    fetched = []
+    for name, url in VENDOR_ASSETS.items():
+        path = os.path.join(static_dir, *name.split('/'))
+        if os.path.exists(path) and not force:
+            continue
+        with urlopen(url, timeout=30) as response:
+            _write(path, response.read())
+        fetched.append(name)
+    return fetched
+
+
+# Serving
+
+def manifest():
+    """Source name -> built name of the last build, {} if there is none"""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(DIST_DIR, MANIFEST_NAME)) as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(name):
+    """URL of a static asset: its built copy, else the source file
+
+    None for an asset only the build makes, such as the icons, before a build,
+    and for a third-party asset that is not vendored yet.
+    """
+    built = manifest().get(name)
+    if built is not None:
+        return url_for('assets', filename=built)
+    if os.path.exists(os.path.join(STATIC_DIR, *name.split('/'))):
+        return url_for('static', filename=name)
+    if name in VENDOR_ASSETS:
+        logger.error(f"{name} is not vendored; run `python assets.py vendor`")
+    return None
+
+
+def serve_asset(filename):
+    """A built asset, precompressed when the client accepts it, cacheable for good"""
+    if filename == MANIFEST_NAME:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in ENCODINGS:
+        path = safe_join(DIST_DIR, filename + suffix)
+        if request.accept_encodings[candidate] and path and os.path.isfile(path):
+            encoding = candidate
+            filename += suffix
+            break
+
+    response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@click.command('assets-build')
+def build_command():
+    """Minify, fingerprint and precompress static assets."""
+    try:
+        built = build()
+    except BuildError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Built {len(built)} asset(s) into {os.path.relpath(DIST_DIR, PROJECT_ROOT)}"
+               + ("" if brotli is not None else " (gzip only: brotli is not installed)"))
+
+
+@click.command('assets-vendor')
+@click.option('--force', is_flag=True, help='Download assets that are already vendored again.')
+def vendor_command(force):
+    """Download Bootstrap, Chart.js and Font Awesome into static/vendor/."""
+    try:
+        fetched = vendor(force=force)
+    except URLError as e:
+        raise click.ClickException(f"Could not download the vendored assets: {e.reason}")
+    click.echo(f"Vendored {len(fetched)} asset(s)" + (f": {', '.join(fetched)}" if fetched else ""))
+
+
+def init_app(app):
+    """Serve the built assets on /assets/ and give templates asset_url()"""
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.cli.add_command(build_command)
+    app.cli.add_command(vendor_command)
+
+
+if __name__ == "__main__":
+    commands = {'build': build_command, 'vendor': vendor_command}
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        sys.exit(f"usage: python {sys.argv[0]} {{{','.join(commands)}}}")
+    commands[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,46 @@
+"""
+Shared helpers for the benchmark scripts
+Benchmarks run against a throwaway database bound to their own Flask app, so the
+real application data is never touched
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+from flask import Flask
+
+# Add the project root to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db
+import database
+
+
+def create_bench_app(database_url, name="benchmark", engine_options=None, sqlite_pragmas=None):
+    """A Flask app sharing the project's db object but bound to its own database"""
+    bench_app = Flask(name)
+    bench_app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    bench_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options or {}
+    db.init_app(bench_app)
+    with bench_app.app_context():
+        database.configure_sqlite(db.engine, sqlite_pragmas)
+    return bench_app
+
+
+@contextmanager
+def database_url_or_temp(database_url, filename="bench.db"):
+    """Yield the given URL, or a temporary SQLite file that is removed afterwards"""
+    if database_url:
+        yield database_url
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield f"sqlite:///{os.path.join(tmpdir, filename)}"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
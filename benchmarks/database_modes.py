@@ -0,0 +1,180 @@
+"""
+Concurrent read/write throughput of the database modes
+Reader and writer processes (standing in for gunicorn workers) run for a fixed
+time: readers page through farm listings and load performance histories while
+writers record investments. Modes: SQLite with its default rollback journal,
+SQLite with the tuned pragmas of database.py (WAL, mmap, ...), and optionally a
+pooled server database from --database-url
+
+Usage:
+    python benchmarks/database_modes.py --readers 6 --writers 2 --duration 10
+    python benchmarks/database_modes.py --database-url postgresql://... --pool-size 10
+"""
+
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+from datetime import date, datetime, timedelta
+
+from common import create_bench_app, database_url_or_temp, percentile
+from app import db
+import database
+from models import User, Farm, InvestmentOpportunity, FarmPerformance
+from funding import fund_opportunity
+
+
+BATCH_SIZE = 10000
+
+
+def seed(farms, months, users, rng):
+    """Farms with monthly history, one roomy open opportunity each, and investors"""
+    db.drop_all()
+    db.create_all()
+    engine = db.engine
+    created = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(Farm.__table__.insert(), [
+            {"id": i, "name": f"Farm {i}", "farm_type": rng.choice(["Crop", "Livestock", "Mixed"]),
+             "total_funding_needed": 1e9, "current_funding": 0.0, "expected_roi": rng.uniform(5, 25),
+             "risk_level": "Low", "created_at": created + timedelta(minutes=i), "data_version": 0}
+            for i in range(1, farms + 1)
+        ])
+        connection.execute(InvestmentOpportunity.__table__.insert(), [
+            {"id": i, "farm_id": i, "title": f"Opportunity {i}", "amount_needed": 1e9, "amount_raised": 0.0,
+             "minimum_investment": 0.0, "expected_roi": 12.0, "duration_months": 12, "risk_level": "Low",
+             "status": "Open", "created_at": created + timedelta(minutes=i)}
+            for i in range(1, farms + 1)
+        ])
+        connection.execute(User.__table__.insert(), [
+            {"id": i, "username": f"bench{i}", "email": f"bench{i}@example.com", "password_hash": "x",
+             "total_investment": 0.0}
+            for i in range(1, users + 1)
+        ])
+        rows = [
+            {"farm_id": farm_id, "date": date(2022 + month // 12, month % 12 + 1, 1),
+             "yield_amount": rng.uniform(50, 150), "revenue": rng.uniform(1e4, 5e4),
+             "expenses": rng.uniform(5e3, 3e4), "profit": rng.uniform(-5e3, 2e4)}
+            for farm_id in range(1, farms + 1) for month in range(months)
+        ]
+        for i in range(0, len(rows), BATCH_SIZE):
+            connection.execute(FarmPerformance.__table__.insert(), rows[i:i + BATCH_SIZE])
+
+
+def read_once(rng, farms):
+    """A listing page with exact funding totals, then one farm's history"""
+    page = db.session.execute(
+        db.select(Farm).order_by(Farm.created_at.desc(), Farm.id.desc()).limit(12)
+    ).scalars().all()
+    [farm.funding_percentage() for farm in page]
+    db.session.execute(
+        db.select(FarmPerformance.date, FarmPerformance.revenue, FarmPerformance.profit)
+        .where(FarmPerformance.farm_id == rng.randint(1, farms))
+        .order_by(FarmPerformance.date)
+    ).all()
+
+
+def write_once(rng, farms, users):
+    fund_opportunity(rng.randint(1, farms), rng.randint(1, users), 100.0)
+
+
+def run_worker(task):
+    """One worker process: its own app and engine, looping until the shared deadline"""
+    kind, index, database_url, engine_options, pragmas, start_at, args = task
+    bench_app = create_bench_app(database_url, f"database_modes_{kind}_{index}", engine_options, pragmas)
+    rng = random.Random(f"{args.seed}:{kind}:{index}")
+    samples, errors = [], 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        with bench_app.app_context():
+            started = time.perf_counter()
+            try:
+                if kind == "read":
+                    read_once(rng, args.farms)
+                else:
+                    write_once(rng, args.farms, args.users)
+                samples.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+            finally:
+                db.session.remove()
+    return kind, samples, errors
+
+
+def run_mode(name, database_url, engine_options, pragmas, args):
+    bench_app = create_bench_app(database_url, f"database_modes_{name}", engine_options, pragmas)
+    with bench_app.app_context():
+        seed(args.farms, args.months, args.users, random.Random(args.seed))
+        db.engine.dispose()
+
+    # Every process starts at the same moment, once all of them are up
+    start_at = time.time() + 1.0 + 0.05 * (args.readers + args.writers)
+    tasks = [("read", i, database_url, engine_options, pragmas, start_at, args) for i in range(args.readers)]
+    tasks += [("write", i, database_url, engine_options, pragmas, start_at, args) for i in range(args.writers)]
+    with multiprocessing.Pool(len(tasks)) as pool:
+        outcomes = pool.map(run_worker, tasks)
+
+    results = {}
+    for kind in ("read", "write"):
+        samples = [sample for outcome in outcomes if outcome[0] == kind for sample in outcome[1]]
+        errors = sum(outcome[2] for outcome in outcomes if outcome[0] == kind)
+        results[kind] = summarize(samples, errors, args.duration)
+    return results
+
+
+def summarize(samples, errors, elapsed):
+    return {
+        "ops": len(samples),
+        "per_sec": len(samples) / elapsed,
+        "errors": errors,
+        "p50": percentile(samples, 50) * 1000,
+        "p95": percentile(samples, 95) * 1000,
+        "p99": percentile(samples, 99) * 1000,
+    }
+
+
+def report(results):
+    print(f"{'mode':<16} {'op':<6} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, kinds in results.items():
+        for kind, row in kinds.items():
+            print(f"{name:<16} {kind:<6} {row['per_sec']:9.1f} {row['p50']:8.2f} {row['p95']:8.2f} "
+                  f"{row['p99']:8.2f} {row['errors']:7d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--readers", type=int, default=6, help="reader processes")
+    parser.add_argument("--writers", type=int, default=2, help="writer processes")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--farms", type=int, default=2000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pool-size", type=int, default=database.DEFAULT_POOL_SIZE,
+                        help="connection pool size per process")
+    parser.add_argument("--database-url", default=None, help="also benchmark this server database")
+    args = parser.parse_args()
+
+    pool = {"pool_size": args.pool_size, "max_overflow": database.DEFAULT_MAX_OVERFLOW, "pool_pre_ping": True}
+
+    print(f"{args.readers} readers + {args.writers} writers for {args.duration:.0f}s per mode, "
+          f"{args.farms} farms x {args.months} months")
+    results = {}
+    with database_url_or_temp(None, "default.db") as url:
+        # An empty pragma set keeps SQLite's defaults: rollback journal, synchronous=FULL
+        results["sqlite-default"] = run_mode("sqlite_default", url, pool, {}, args)
+    with database_url_or_temp(None, "tuned.db") as url:
+        results["sqlite-tuned"] = run_mode("sqlite_tuned", url, pool, database.SQLITE_PRAGMAS, args)
+    if args.database_url:
+        url = database.database_url({"DATABASE_URL": args.database_url})
+        results["server"] = run_mode("server", url, dict(pool, pool_recycle=300), {}, args)
+
+    print()
+    report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Concurrency benchmark for the investment funding path
+N parallel investors hammer a single hot opportunity; the benchmark reports
+throughput and checks that the opportunity is never oversubscribed and that no
+increments to the opportunity, farm or investor totals are lost, both in the exact
+totals (compacted column plus pending ledger events) and after compaction
+
+Usage:
+    python benchmarks/funding_contention.py --investors 32 --attempts 20
+    python benchmarks/funding_contention.py --mode naive   # previous read-modify-write path
+    python benchmarks/funding_contention.py --database-url postgresql://...
+"""
+
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common import create_bench_app, database_url_or_temp, percentile
+from app import db
+from models import User, Farm, InvestmentOpportunity, Investment
+from funding import fund_opportunity, compact_funding, FundingError
+
+
+def seed(investors, amount_needed):
+    """Create one hot opportunity and the investor accounts"""
+    db.drop_all()
+    db.create_all()
+
+    farm = Farm(name="Hot Farm", farm_type="Crop", total_funding_needed=amount_needed, current_funding=0.0)
+    db.session.add(farm)
+    db.session.flush()
+
+    opportunity = InvestmentOpportunity(
+        farm_id=farm.id,
+        title="Hot Opportunity",
+        amount_needed=amount_needed,
+        amount_raised=0.0,
+        minimum_investment=0.0,
+        expected_roi=12.0,
+        duration_months=12,
+        risk_level="Low",
+        status="Open"
+    )
+    db.session.add(opportunity)
+
+    users = []
+    for i in range(investors):
+        user = User(username=f"bench{i}", email=f"bench{i}@example.com", password_hash="x", total_investment=0.0)
+        db.session.add(user)
+        users.append(user)
+
+    db.session.commit()
+    return opportunity.id, [user.id for user in users]
+
+
+def naive_invest(opportunity_id, user_id, amount):
+    """The previous invest() logic: check in Python, then read-modify-write"""
+    opportunity = db.session.get(InvestmentOpportunity, opportunity_id)
+    user = db.session.get(User, user_id)
+    try:
+        if opportunity.status != "Open":
+            raise FundingError('This investment opportunity is no longer open')
+        remaining = opportunity.amount_needed - opportunity.amount_raised
+        if amount > remaining:
+            raise FundingError(f'Maximum available investment is ${remaining:.2f}')
+
+        opportunity.amount_raised += amount
+        opportunity.farm.current_funding += amount
+        user.total_investment += amount
+        if opportunity.amount_raised >= opportunity.amount_needed:
+            opportunity.status = "Closed"
+
+        db.session.add(Investment(user_id=user_id, opportunity_id=opportunity_id, amount=amount))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def run_investor(bench_app, invest, opportunity_id, user_id, attempts, amount, start_barrier):
+    """Worker loop for one investor; returns (successes, rejections, errors, latencies)"""
+    successes = rejections = errors = 0
+    latencies = []
+    start_barrier.wait()
+    for _ in range(attempts):
+        with bench_app.app_context():
+            started = time.perf_counter()
+            try:
+                invest(opportunity_id, user_id, amount)
+                successes += 1
+            except FundingError:
+                rejections += 1
+            except Exception:
+                errors += 1
+            finally:
+                latencies.append(time.perf_counter() - started)
+                db.session.remove()
+    return successes, rejections, errors, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--investors", type=int, default=32, help="parallel investors")
+    parser.add_argument("--attempts", type=int, default=20, help="investment attempts per investor")
+    parser.add_argument("--amount", type=float, default=1000.0, help="amount per investment")
+    parser.add_argument("--capacity", type=float, default=None,
+                        help="amount needed on the hot opportunity (default: half the total demand)")
+    parser.add_argument("--mode", choices=["atomic", "naive"], default="atomic")
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    with database_url_or_temp(args.database_url, "funding_bench.db") as database_url:
+        return run_benchmark(args, database_url)
+
+
+def run_benchmark(args, database_url):
+    demand = args.investors * args.attempts * args.amount
+    capacity = args.capacity if args.capacity is not None else demand / 2
+    invest = fund_opportunity if args.mode == "atomic" else naive_invest
+
+    bench_app = create_bench_app(database_url, "funding_benchmark",
+                                 {"pool_size": args.investors, "max_overflow": args.investors})
+    with bench_app.app_context():
+        opportunity_id, user_ids = seed(args.investors, capacity)
+
+    print(f"Mode: {args.mode}  Database: {database_url}")
+    print(f"{args.investors} investors x {args.attempts} attempts x {args.amount:.2f} "
+          f"against capacity {capacity:.2f} (demand {demand:.2f})")
+
+    barrier = threading.Barrier(args.investors)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.investors) as pool:
+        futures = [
+            pool.submit(run_investor, bench_app, invest, opportunity_id, user_id,
+                        args.attempts, args.amount, barrier)
+            for user_id in user_ids
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    successes = sum(r[0] for r in results)
+    rejections = sum(r[1] for r in results)
+    errors = sum(r[2] for r in results)
+    latencies = [latency for r in results for latency in r[3]]
+
+    with bench_app.app_context():
+        opportunity = db.session.get(InvestmentOpportunity, opportunity_id)
+        invested = db.session.scalar(
+            db.select(db.func.coalesce(db.func.sum(Investment.amount), 0.0))
+            .where(Investment.opportunity_id == opportunity_id)
+        )
+        farm_funding = opportunity.farm.funded
+        user_totals = db.session.scalar(db.select(db.func.sum(User.invested)))
+        amount_raised = opportunity.raised
+        status = opportunity.status
+        db.session.remove()
+
+        compacted = compact_funding()
+        opportunity = db.session.get(InvestmentOpportunity, opportunity_id)
+        compacted_totals = (
+            opportunity.amount_raised,
+            opportunity.farm.current_funding,
+            db.session.scalar(db.select(db.func.sum(User.total_investment)))
+        )
+
+    oversubscribed = max(invested - capacity, 0.0)
+    lost_updates = abs(invested - amount_raised) + abs(invested - farm_funding) + abs(invested - user_totals)
+    lost_updates += sum(abs(invested - total) for total in compacted_totals)
+
+    print()
+    print(f"Elapsed:            {elapsed:.3f}s")
+    print(f"Attempts/sec:       {len(latencies) / elapsed:.1f}")
+    print(f"Investments/sec:    {successes / elapsed:.1f}")
+    print(f"Successful:         {successes}")
+    print(f"Rejected:           {rejections}")
+    print(f"Errors:             {errors}")
+    print(f"Latency p50/p95/p99: {percentile(latencies, 50) * 1000:.1f} / "
+          f"{percentile(latencies, 95) * 1000:.1f} / {percentile(latencies, 99) * 1000:.1f} ms")
+    print()
+    print(f"Sum of investments: {invested:.2f}")
+    print(f"amount_raised:      {amount_raised:.2f}  (status {status})")
+    print(f"Farm funding:       {farm_funding:.2f}")
+    print(f"Investor totals:    {user_totals:.2f}")
+    print(f"Compacted:          {compacted} ledger event(s) into {compacted_totals[0]:.2f} / "
+          f"{compacted_totals[1]:.2f} / {compacted_totals[2]:.2f}")
+    print(f"Oversubscribed by:  {oversubscribed:.2f}")
+    print(f"Lost updates:       {lost_updates:.2f}")
+
+    return 0 if oversubscribed == 0 and lost_updates == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
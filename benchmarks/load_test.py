@@ -0,0 +1,345 @@
+"""
+End-to-end concurrent load test of the web app under gunicorn
+Copies the project into a scratch directory, generates a synthetic dataset there,
+boots gunicorn with several workers, logs in as many synthetic investors and
+replays a weighted mix of page, analytics API and invest traffic. Reports
+per-route throughput, p50/p95/p99 latency and error rates. Runs offline on one
+machine and never touches the real instance database
+
+Usage:
+    python benchmarks/load_test.py --scale 200 --workers 4 --users 32 --duration 60
+    python benchmarks/load_test.py --json results.json --max-error-rate 0.01
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, HTTPRedirectHandler
+
+from common import percentile
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Synthetic investors created by generate_sample_data.py all use this password
+PASSWORD = "password"
+
+SANDBOX_IGNORE = shutil.ignore_patterns(".git", "instance", "__pycache__", "attached_assets", "*.db")
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Report redirects as responses so each request is timed on its own"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Dataset:
+    """Ids the traffic mix draws from, read from the generated database"""
+
+    def __init__(self, path):
+        connection = sqlite3.connect(path)
+        try:
+            self.farm_ids = [row[0] for row in connection.execute("SELECT id FROM farm")]
+            self.opportunities = connection.execute(
+                "SELECT id, minimum_investment FROM investment_opportunity WHERE status = 'Open'"
+            ).fetchall()
+            self.usernames = [row[0] for row in connection.execute(
+                "SELECT username FROM user WHERE is_investor = 1 "
+                "AND (username = 'investor' OR username LIKE 'loadtest-investor-%')"
+            )]
+        finally:
+            connection.close()
+
+
+class VirtualUser:
+    """One logged-in investor with its own cookie jar"""
+
+    def __init__(self, base_url, username, dataset, rng, timeout):
+        self.base_url = base_url
+        self.username = username
+        self.dataset = dataset
+        self.rng = rng
+        self.timeout = timeout
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect())
+
+    def request(self, method, path, data=None):
+        """Return (status, seconds, redirect location); status 0 for connection errors"""
+        body = urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        location = None
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except HTTPError as e:
+            e.read()
+            status = e.code
+            location = e.headers.get("Location")
+        except (URLError, OSError):
+            status = 0
+        return status, time.perf_counter() - started, location
+
+    def login(self):
+        """Return (succeeded, status, seconds); failed logins redirect back to /login"""
+        status, seconds, location = self.request("POST", "/login",
+                                                 {"username": self.username, "password": PASSWORD})
+        succeeded = status in (301, 302, 303) and "/login" not in (location or "")
+        return succeeded, status, seconds
+
+    # Traffic mix: each returns (method, path, form data)
+
+    def index(self):
+        return "GET", "/", None
+
+    def farms(self):
+        return "GET", "/farms", None
+
+    def opportunities(self):
+        filters = {}
+        if self.rng.random() < 0.5:
+            filters["farm_type"] = self.rng.choice(["Crop", "Livestock", "Mixed"])
+        if self.rng.random() < 0.3:
+            filters["risk_level"] = self.rng.choice(["Low", "Medium", "High"])
+        if self.rng.random() < 0.3:
+            filters["min_roi"] = self.rng.choice([10, 12, 14])
+        return "GET", "/opportunities" + (f"?{urlencode(filters)}" if filters else ""), None
+
+    def farm_detail(self):
+        return "GET", f"/farm/{self.rng.choice(self.dataset.farm_ids)}", None
+
+    def dashboard(self):
+        return "GET", "/dashboard", None
+
+    def roi_trends(self):
+        return "GET", f"/api/roi-trends/{self.rng.choice(self.dataset.opportunities)[0]}", None
+
+    def weather_yield(self):
+        return "GET", f"/api/weather-yield/{self.rng.choice(self.dataset.farm_ids)}", None
+
+    def market_price_prediction(self):
+        return "GET", f"/api/market-price-prediction/{self.rng.choice(self.dataset.farm_ids)}", None
+
+    def risk_levels(self):
+        return "GET", f"/api/risk-levels/{self.rng.choice(self.dataset.opportunities)[0]}", None
+
+    def invest(self):
+        opportunity_id, minimum = self.rng.choice(self.dataset.opportunities)
+        amount = round(minimum * self.rng.uniform(1.0, 1.5), 2)
+        return "POST", f"/invest/{opportunity_id}", {"amount": amount}
+
+
+# (route label, weight) of the replayed traffic; labels are VirtualUser methods
+TRAFFIC_MIX = [
+    ("index", 10),
+    ("farms", 8),
+    ("opportunities", 12),
+    ("farm_detail", 15),
+    ("dashboard", 12),
+    ("roi_trends", 8),
+    ("weather_yield", 8),
+    ("market_price_prediction", 8),
+    ("risk_levels", 8),
+    ("invest", 5),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sandbox_env(sandbox):
+    """Environment pinning the sandboxed app to its own SQLite file, whatever DATABASE_URL says"""
+    env = dict(os.environ)
+    env["DATABASE_URL"] = "sqlite:///" + os.path.join(sandbox, "instance", "agri_investment.db")
+    return env
+
+
+def prepare_sandbox(directory, args):
+    """Copy the project and generate the dataset inside the copy"""
+    sandbox = os.path.join(directory, "app")
+    shutil.copytree(PROJECT_ROOT, sandbox, ignore=SANDBOX_IGNORE)
+    os.makedirs(os.path.join(sandbox, "instance"), exist_ok=True)
+    command = [sys.executable, "generate_sample_data.py", "--scale", str(args.scale),
+               "--seed", str(args.seed), "--workers", str(args.generator_workers)]
+    started = time.perf_counter()
+    subprocess.run(command, cwd=sandbox, env=sandbox_env(sandbox), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    print(f"Generated dataset (scale {args.scale}) in {time.perf_counter() - started:.1f}s")
+    return sandbox
+
+
+def start_server(sandbox, port, args, log_file):
+    command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+               "--workers", str(args.workers), "--threads", str(args.threads),
+               "--timeout", "120", "main:app"]
+    return subprocess.Popen(command, cwd=sandbox, env=sandbox_env(sandbox), stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(server, base_url, timeout):
+    probe = build_opener()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            with probe.open(base_url + "/", timeout=5) as response:
+                response.read()
+                return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not answer within {timeout}s")
+
+
+def run_user(user, measure_from, deadline, think_time, samples):
+    """Log in, then replay the weighted traffic mix until the deadline"""
+    labels = [label for label, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+
+    succeeded, status, seconds = user.login()
+    samples.append(("login", status, seconds, succeeded))
+
+    while time.monotonic() < deadline:
+        label = user.rng.choices(labels, weights)[0]
+        method, path, data = getattr(user, label)()
+        started = time.monotonic()
+        status, seconds, _ = user.request(method, path, data)
+        if started >= measure_from:
+            samples.append((label, status, seconds, 0 < status < 400))
+        if think_time:
+            time.sleep(user.rng.expovariate(1 / think_time))
+
+
+def summarize(samples, elapsed):
+    """{label: stats} plus a "total" entry; latencies in milliseconds"""
+    grouped = defaultdict(list)
+    for sample in samples:
+        grouped[sample[0]].append(sample)
+    grouped["total"] = [sample for sample in samples if sample[0] != "login"]
+
+    results = {}
+    for label, group in grouped.items():
+        latencies = [sample[2] * 1000 for sample in group]
+        errors = sum(1 for sample in group if not sample[3])
+        statuses = defaultdict(int)
+        for sample in group:
+            statuses[str(sample[1])] += 1
+        results[label] = {
+            "requests": len(group),
+            "throughput": len(group) / elapsed if label != "login" else None,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "errors": errors,
+            "error_rate": errors / len(group) if group else 0.0,
+            "statuses": dict(statuses)
+        }
+    return results
+
+
+def report(results, elapsed):
+    print(f"\nMeasured for {elapsed:.1f}s")
+    print(f"{'route':26s} {'requests':>9s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'errors':>8s}")
+    order = [label for label, _ in TRAFFIC_MIX] + ["login", "total"]
+    for label in order:
+        stats = results.get(label)
+        if not stats:
+            continue
+        throughput = f"{stats['throughput']:8.1f}" if stats["throughput"] is not None else f"{'-':>8s}"
+        print(f"{label:26s} {stats['requests']:9d} {throughput} {stats['p50_ms']:8.1f} "
+              f"{stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f} {stats['error_rate'] * 100:7.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", type=int, default=200, help="generate_sample_data.py scale factor")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--generator-workers", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="threads per gunicorn worker")
+    parser.add_argument("--users", type=int, default=32, help="concurrent virtual investors")
+    parser.add_argument("--duration", type=float, default=60.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between requests (s)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout (s)")
+    parser.add_argument("--boot-timeout", type=float, default=60.0)
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="exit with status 1 above this overall error rate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        sandbox = prepare_sandbox(directory, args)
+        dataset = Dataset(os.path.join(sandbox, "instance", "agri_investment.db"))
+        print(f"Dataset: {len(dataset.farm_ids)} farms, {len(dataset.opportunities)} open opportunities, "
+              f"{len(dataset.usernames)} investors")
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(directory, "gunicorn.log")
+        with open(log_path, "wb") as log_file:
+            server = start_server(sandbox, port, args, log_file)
+            try:
+                wait_until_ready(server, base_url, args.boot_timeout)
+                print(f"gunicorn: {args.workers} worker(s) x {args.threads} thread(s) on {base_url}")
+                print(f"Running {args.users} virtual investors for {args.warmup:.0f}s warmup "
+                      f"+ {args.duration:.0f}s")
+
+                measure_from = time.monotonic() + args.warmup
+                deadline = measure_from + args.duration
+                samples = [[] for _ in range(args.users)]
+                threads = []
+                for i in range(args.users):
+                    user = VirtualUser(base_url, dataset.usernames[i % len(dataset.usernames)], dataset,
+                                       random.Random(args.seed + i), args.timeout)
+                    thread = threading.Thread(target=run_user, daemon=True,
+                                              args=(user, measure_from, deadline, args.think_time, samples[i]))
+                    thread.start()
+                    threads.append(thread)
+                for thread in threads:
+                    thread.join()
+            except RuntimeError as e:
+                log_file.flush()
+                with open(log_path, "rb") as log:
+                    print(log.read()[-4000:].decode("utf-8", "replace"))
+                print(f"Error: {e}")
+                return 1
+            finally:
+                server.terminate()
+                try:
+                    server.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+
+    results = summarize([sample for user_samples in samples for sample in user_samples], args.duration)
+    report(results, args.duration)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+    error_rate = results.get("total", {}).get("error_rate", 0.0)
+    if error_rate > args.max_error_rate:
+        print(f"\nError rate {error_rate * 100:.2f}% exceeds {args.max_error_rate * 100:.2f}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Login throughput alongside page traffic
+Boots gunicorn against a throwaway SQLite database with a set of users, then for
+a fixed time runs clients that log in over and over next to clients browsing the
+opportunity listing. Compares sync workers hashing on the request thread with
+gthread workers handing hashes to the bounded pool of passwords.py, and reports
+logins per second, rejected (busy) logins and the page latency under the burst.
+
+Usage:
+    python benchmarks/login_throughput.py --login-clients 16 --page-clients 4 --duration 10
+    python benchmarks/login_throughput.py --hash-method pbkdf2:sha256:600000 --workers 4
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPRedirectHandler
+
+from werkzeug.security import generate_password_hash
+
+from serving import free_port, first_answer
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = "bench-password"
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """A successful login answers 302; count it rather than following it"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def prepare_database(env, database_path, users, hash_method):
+    """Migrated database with `users` accounts sharing one password hash"""
+    subprocess.run([sys.executable, "migrations.py"], cwd=PROJECT_ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    password_hash = generate_password_hash(PASSWORD, hash_method)
+    with sqlite3.connect(database_path) as connection:
+        connection.executemany(
+            "INSERT INTO user (username, email, password_hash, is_investor, total_investment) VALUES (?, ?, ?, 1, 0)",
+            [(f"bench{i}", f"bench{i}@example.com", password_hash) for i in range(users)]
+        )
+
+
+def login_client(base_url, index, users, deadline, results):
+    opener = build_opener(NoRedirect)
+    i = index
+    while time.perf_counter() < deadline:
+        body = urlencode({"username": f"bench{i % users}", "password": PASSWORD}).encode()
+        started = time.perf_counter()
+        try:
+            with opener.open(base_url + "/login", data=body, timeout=60) as response:
+                response.read()
+            status = response.status
+        except HTTPError as e:
+            status = e.code
+        except (URLError, OSError):
+            status = None
+        elapsed = time.perf_counter() - started
+        if status == 302:
+            results["logins"].append(elapsed)
+        elif status == 503:
+            results["busy"] += 1
+        else:
+            results["errors"] += 1
+        i += 1
+
+
+def page_client(base_url, deadline, results):
+    opener = build_opener()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with opener.open(base_url + "/opportunities", timeout=60) as response:
+                response.read()
+            results["pages"].append(time.perf_counter() - started)
+        except (HTTPError, URLError, OSError):
+            results["errors"] += 1
+
+
+def run_mode(env, args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers),
+               "main:app"]
+    server = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_answer(build_opener(), base_url + "/login", time.perf_counter() + args.boot_timeout)
+        results = {"logins": [], "pages": [], "busy": 0, "errors": 0}
+        deadline = time.perf_counter() + args.duration
+        clients = [threading.Thread(target=login_client, args=(base_url, i, args.users, deadline, results))
+                   for i in range(args.login_clients)]
+        clients += [threading.Thread(target=page_client, args=(base_url, deadline, results))
+                    for _ in range(args.page_clients)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="request threads per gthread worker")
+    parser.add_argument("--hash-workers", type=int, default=1, help="hashing threads per worker")
+    parser.add_argument("--hash-method", default="scrypt:32768:8:1")
+    parser.add_argument("--login-clients", type=int, default=16)
+    parser.add_argument("--page-clients", type=int, default=4)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--boot-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    modes = {
+        "sync, inline": {"GUNICORN_WORKER_CLASS": "sync", "PASSWORD_HASH_WORKERS": "0"},
+        "gthread, pool": {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": str(args.threads),
+                          "PASSWORD_HASH_WORKERS": str(args.hash_workers)},
+    }
+
+    print(f"{args.login_clients} login clients + {args.page_clients} page clients for {args.duration:.0f}s "
+          f"per mode, {args.workers} workers, {args.hash_method}")
+    print(f"{'mode':<15} {'logins/s':>9} {'login p95':>10} {'busy':>6} {'pages/s':>8} {'page p50':>9} "
+          f"{'page p95':>9} {'errors':>7}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_path = os.path.join(tmpdir, "login.db")
+        base_env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}",
+                        PASSWORD_HASH_METHOD=args.hash_method, USER_CACHE_TTL="0")
+        base_env.pop("GUNICORN_PRELOAD", None)
+        prepare_database(base_env, database_path, args.users, args.hash_method)
+
+        for name, overrides in modes.items():
+            results = run_mode(dict(base_env, **overrides), args)
+            logins, pages = results["logins"], results["pages"]
+            print(f"{name:<15} {len(logins) / args.duration:9.1f} {percentile(logins, 95) * 1000:8.0f}ms "
+                  f"{results['busy']:6d} {len(pages) / args.duration:8.1f} {percentile(pages, 50) * 1000:7.0f}ms "
+                  f"{percentile(pages, 95) * 1000:7.0f}ms {results['errors']:7d}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Query plan and latency benchmark for the hot query shapes
+Builds a large synthetic dataset without the composite indexes, measures each hot
+query, applies the index migration and measures again
+
+Usage:
+    python benchmarks/query_indexes.py --farms 20000 --months 36
+    python benchmarks/query_indexes.py --database-url postgresql://...
+"""
+
+import sys
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+import sqlalchemy as sa
+
+from common import create_bench_app, database_url_or_temp, percentile
+from app import db
+from models import User, Farm, InvestmentOpportunity, Investment, FarmPerformance
+from migrations import hot_query_indexes
+
+
+BATCH_SIZE = 10000
+
+# (label, SQL, parameter factory) for each hot query shape
+HOT_QUERIES = [
+    (
+        "farm history by date",
+        "SELECT date, yield_amount, revenue, expenses, profit, weather_conditions "
+        "FROM farm_performance WHERE farm_id = :farm_id ORDER BY date",
+        lambda scale: {"farm_id": random.randint(1, scale["farms"])}
+    ),
+    (
+        "open opportunities, newest first",
+        "SELECT * FROM investment_opportunity WHERE status = :status "
+        "ORDER BY created_at DESC LIMIT 4",
+        lambda scale: {"status": "Open"}
+    ),
+    (
+        "open opportunities of a farm",
+        "SELECT * FROM investment_opportunity WHERE farm_id = :farm_id AND status = :status",
+        lambda scale: {"farm_id": random.randint(1, scale["farms"]), "status": "Open"}
+    ),
+    (
+        "investments of a user",
+        "SELECT * FROM investment WHERE user_id = :user_id",
+        lambda scale: {"user_id": random.randint(1, scale["users"])}
+    ),
+]
+
+
+def insert_batches(connection, table, rows):
+    """executemany in fixed-size batches"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            connection.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(table.insert(), batch)
+
+
+def build_dataset(engine, scale):
+    """Create the tables without the hot query indexes and fill them"""
+    metadata = db.metadata
+    with engine.begin() as connection:
+        metadata.drop_all(connection)
+        metadata.create_all(connection)
+        for model in (InvestmentOpportunity, Investment, FarmPerformance):
+            for index in model.__table__.indexes:
+                index.drop(connection)
+
+        now = datetime(2025, 1, 1)
+        start = date(2022, 1, 1)
+        statuses = ["Open", "Closed", "Completed"]
+
+        insert_batches(connection, User.__table__, (
+            {"id": i, "username": f"user{i}", "email": f"user{i}@example.com",
+             "password_hash": "x", "total_investment": 0.0}
+            for i in range(1, scale["users"] + 1)
+        ))
+        insert_batches(connection, Farm.__table__, (
+            {"id": i, "name": f"Farm {i}", "farm_type": random.choice(["Crop", "Livestock", "Mixed"]),
+             "created_at": now - timedelta(minutes=i), "total_funding_needed": 1e6,
+             "current_funding": 0.0, "risk_level": "Medium"}
+            for i in range(1, scale["farms"] + 1)
+        ))
+        opportunities = scale["farms"] * scale["opportunities_per_farm"]
+        insert_batches(connection, InvestmentOpportunity.__table__, (
+            {"id": i, "farm_id": (i - 1) % scale["farms"] + 1, "title": f"Opportunity {i}",
+             "amount_needed": 1e5, "amount_raised": 0.0, "minimum_investment": 1000.0,
+             "expected_roi": 12.0, "duration_months": 12, "risk_level": "Medium",
+             "created_at": now - timedelta(minutes=random.randint(0, 10 ** 6)),
+             "status": random.choice(statuses)}
+            for i in range(1, opportunities + 1)
+        ))
+        insert_batches(connection, Investment.__table__, (
+            {"user_id": random.randint(1, scale["users"]),
+             "opportunity_id": random.randint(1, opportunities),
+             "amount": 1000.0, "status": "Active"}
+            for _ in range(scale["investments"])
+        ))
+        # Rows arrive month by month across all farms, as they would from monthly feeds
+        insert_batches(connection, FarmPerformance.__table__, (
+            {"farm_id": farm_id, "date": start + timedelta(days=30 * month),
+             "yield_amount": 10.0, "revenue": 1000.0, "expenses": 500.0, "profit": 500.0,
+             "weather_conditions": "Sunny"}
+            for month in range(scale["months"])
+            for farm_id in range(1, scale["farms"] + 1)
+        ))
+        connection.execute(sa.text("ANALYZE"))
+
+
+def explain(connection, sql, params):
+    if connection.dialect.name == "sqlite":
+        rows = connection.execute(sa.text(f"EXPLAIN QUERY PLAN {sql}"), params).all()
+        return [row[-1] for row in rows]
+    rows = connection.execute(sa.text(f"EXPLAIN {sql}"), params).all()
+    return [row[0] for row in rows]
+
+
+def measure(engine, scale, iterations):
+    """Return {label: (plan, p50, p95, mean)} with latencies in milliseconds"""
+    results = {}
+    with engine.connect() as connection:
+        for label, sql, make_params in HOT_QUERIES:
+            statement = sa.text(sql)
+            plan = explain(connection, sql, make_params(scale))
+            latencies = []
+            for _ in range(iterations):
+                params = make_params(scale)
+                started = time.perf_counter()
+                connection.execute(statement, params).all()
+                latencies.append((time.perf_counter() - started) * 1000)
+            results[label] = (plan, percentile(latencies, 50), percentile(latencies, 95),
+                              sum(latencies) / len(latencies))
+    return results
+
+
+def report(title, results):
+    print(f"\n== {title} ==")
+    for label, (plan, p50, p95, mean) in results.items():
+        print(f"\n{label}: p50 {p50:.3f} ms  p95 {p95:.3f} ms  mean {mean:.3f} ms")
+        for line in plan:
+            print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--farms", type=int, default=20000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--opportunities-per-farm", type=int, default=2)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--investments", type=int, default=200000)
+    parser.add_argument("--iterations", type=int, default=200, help="executions per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    scale = {
+        "farms": args.farms,
+        "months": args.months,
+        "opportunities_per_farm": args.opportunities_per_farm,
+        "users": args.users,
+        "investments": args.investments,
+    }
+
+    with database_url_or_temp(args.database_url, "index_bench.db") as database_url:
+        bench_app = create_bench_app(database_url, "index_benchmark")
+        with bench_app.app_context():
+            engine = db.engine
+            print(f"Database: {database_url}")
+            print(f"Building dataset: {args.farms} farms x {args.months} months, "
+                  f"{args.farms * args.opportunities_per_farm} opportunities, "
+                  f"{args.users} users, {args.investments} investments")
+            started = time.perf_counter()
+            build_dataset(engine, scale)
+            print(f"Built in {time.perf_counter() - started:.1f}s")
+
+            before = measure(engine, scale, args.iterations)
+            report("Before (primary keys only)", before)
+
+            with engine.begin() as connection:
+                hot_query_indexes(connection)
+                connection.execute(sa.text("ANALYZE"))
+            after = measure(engine, scale, args.iterations)
+            report("After (composite indexes)", after)
+
+            print("\n== Summary (mean ms) ==")
+            for label in before:
+                old, new = before[label][3], after[label][3]
+                print(f"{label:36s} {old:10.3f} -> {new:8.3f}  ({old / new if new else 0:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
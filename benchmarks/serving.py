@@ -0,0 +1,28 @@
+"""
+Helpers for the benchmarks that run the app under gunicorn
+Kept apart from common.py so these scripts do not import the app themselves
+"""
+
+import time
+import socket
+from urllib.error import HTTPError, URLError
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_answer(opener, url, deadline):
+    """Poll until the URL answers with any HTTP status; returns that moment"""
+    while time.perf_counter() < deadline:
+        try:
+            with opener.open(url, timeout=5) as response:
+                response.read()
+            return time.perf_counter()
+        except HTTPError:
+            return time.perf_counter()
+        except (URLError, OSError):
+            time.sleep(0.01)
+    raise RuntimeError(f"{url} did not answer in time")
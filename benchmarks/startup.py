@@ -0,0 +1,135 @@
+"""
+Worker startup benchmark
+Measures how long a fresh interpreter takes to import the app (with the slowest
+imports from -X importtime), then boots gunicorn with and without --preload and
+reports the time to the first answered request and the latency of the first
+analytics request, which pays for the deferred numpy import unless preloaded.
+Runs against a throwaway SQLite database
+
+Usage:
+    python benchmarks/startup.py --runs 5 --workers 4
+    python benchmarks/startup.py --top 15
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+import subprocess
+from urllib.error import HTTPError
+from urllib.request import build_opener
+
+from serving import free_port, first_answer
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def prepare_database(env, database_path):
+    """Migrated database with the one farm the analytics request asks for"""
+    subprocess.run([sys.executable, "migrations.py"], cwd=PROJECT_ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO farm (id, name, total_funding_needed, current_funding, data_version) "
+                           "VALUES (1, 'Startup Farm', 0, 0, 0)")
+
+
+def bench_env(database_path):
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{database_path}"
+    env.pop("GUNICORN_PRELOAD", None)
+    return env
+
+
+def import_times(env, runs):
+    """Seconds to `import main` in fresh interpreters"""
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=PROJECT_ROOT, env=env,
+                                check=True, capture_output=True, text=True)
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def slowest_imports(env, top):
+    """(cumulative seconds, module) of the modules that dominate `import main`, packages included"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=PROJECT_ROOT,
+                            env=env, check=True, capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() != "main":
+            modules.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def timed_get(opener, url):
+    started = time.perf_counter()
+    try:
+        with opener.open(url, timeout=30) as response:
+            response.read()
+    except HTTPError:
+        pass
+    return time.perf_counter() - started
+
+
+def boot_gunicorn(env, workers, preload, timeout):
+    """(seconds to the first answered request, seconds of the first analytics request)"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+               "main:app"] + (["--preload"] if preload else [])
+    opener = build_opener()
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        answered = first_answer(opener, base_url + "/login", started + timeout)
+        analytics = timed_get(opener, base_url + "/api/market-price-prediction/1")
+        return answered - started, analytics
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def milliseconds(values):
+    return f"median {statistics.median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5, help="repetitions of each measurement")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--boot-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_path = os.path.join(tmpdir, "startup.db")
+        env = bench_env(database_path)
+        prepare_database(env, database_path)
+
+        print(f"import main:            {milliseconds(import_times(env, args.runs))}")
+        print()
+        print("Slowest imports (cumulative):")
+        for seconds, name in slowest_imports(env, args.top):
+            print(f"  {seconds * 1000:8.1f} ms  {name}")
+        print()
+
+        for preload in (False, True):
+            boots = [boot_gunicorn(env, args.workers, preload, args.boot_timeout) for _ in range(args.runs)]
+            label = "preload" if preload else "no preload"
+            print(f"gunicorn {label:<11} first request    {milliseconds([boot[0] for boot in boots])}")
+            print(f"gunicorn {label:<11} first analytics  {milliseconds([boot[1] for boot in boots])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Shape-preserving downsampling of chart series
+Charts never need more points than they have pixels, so long histories are cut
+down to a requested resolution on the server. Largest-Triangle-Three-Buckets
+keeps the points that contribute most to the visible shape; min/max bucketing
+keeps the extremes of each time bucket. Both always keep the first and last
+point, and several aligned series are thinned with one shared set of indices.
+"""
+
+import numpy as np
+
+
+METHODS = ('lttb', 'minmax')
+
+# Fewer points than this cannot keep both ends and any shape in between
+MIN_POINTS = 3
+MAX_POINTS = 10000
+
+
+def _values(series):
+    # Missing values count as zero when ranking points; the kept values are untouched
+    return np.nan_to_num(np.asarray(series, dtype=float))
+
+
+def lttb_indices(series, points):
+    """Indices kept by Largest-Triangle-Three-Buckets, first and last included
+
+    Points between the ends are split into points - 2 buckets. Each bucket keeps
+    the point forming the largest triangle with the point kept in the previous
+    bucket and the average of the next one. Bucket averages and the areas within
+    a bucket are computed with NumPy; only the walk over buckets is sequential.
+    """
+    y = _values(series)
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    x_avg = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    y_avg = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    # The last bucket looks ahead to the final point itself
+    x_next = np.append(x_avg[1:], x[-1])
+    y_next = np.append(y_avg[1:], y[-1])
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        areas = np.abs(
+            (x[previous] - x_next[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (y_next[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def minmax_indices(series, points):
+    """Indices of the minimum and maximum of each time bucket, plus the first and last point"""
+    y = _values(series)
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+
+    buckets = (points - 2) // 2
+    if buckets < 1:
+        # No room for both extremes of even one bucket next to the ends
+        return lttb_indices(series, points)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    bucket_ids = np.repeat(np.arange(buckets), np.diff(edges))
+    # Sorted by bucket, then value: each bucket's run starts at its minimum and ends at its maximum
+    order = np.lexsort((y, bucket_ids))
+    kept = np.concatenate(([0, n - 1], order[edges[:-1]], order[edges[1:] - 1]))
+    return np.unique(kept)
+
+
+def downsample_indices(series_list, points, method='lttb'):
+    """Shared indices that thin aligned series to at most `points`, or None to keep them all
+
+    Each series gets an equal share of the points and the picks are merged, so
+    the peaks of every series survive on the common x axis. When `points` cannot
+    give every series MIN_POINTS, only the leading series that fit are thinned.
+    """
+    if points is None or not series_list or len(series_list[0]) <= points:
+        return None
+    pick = lttb_indices if method == 'lttb' else minmax_indices
+    series_list = series_list[:max(points // MIN_POINTS, 1)]
+    share = points // len(series_list)
+    return np.unique(np.concatenate([pick(series, share) for series in series_list]))
+
+
+def take(values, indices):
+    """The items of a list or array at the given indices"""
+    if isinstance(values, np.ndarray):
+        return values[indices]
+    return [values[i] for i in indices.tolist()]
@@ -0,0 +1,103 @@
+"""
+Cached template fragments for the Smart Agri Investment platform
+Wrapping a block in {% cache name, version %} ... {% endcache %} keeps its
+rendered HTML per process and renders it again only when the version differs
+from the cached one. Views pass catalog_version(), which changes with every
+write to the farms or the opportunities and with every investment (the funding
+shown on the cards includes ledger events not compacted yet), and hand the
+block's rows over as DeferredRows queries, so a hit neither renders the block
+nor loads its rows.
+
+Versions are read from the database on each request, so a change made in any
+worker invalidates the fragments of every worker on its next request. They are
+built from maxima of indexed columns only, four index lookups however large the
+catalogue, and performance data changes (which the cards do not show) leave
+them alone. Farms and opportunities are never deleted by the app; deleting one
+that is not the newest needs a catalogue edit, or a restart, to show up.
+"""
+
+from datetime import datetime
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+
+from app import db
+from http_cache import ResponseCache, PAYLOAD_COLUMNS
+from models import Farm, InvestmentOpportunity, FundingEvent
+import metrics
+
+
+# Rendered fragments by name
+fragment_cache = ResponseCache(max_entries=256)
+
+
+def catalog_version():
+    """Changes whenever a farm or an investment opportunity is added or edited, or funded"""
+    latest = (
+        db.func.max(Farm.id),
+        db.func.max(Farm.updated_at),
+        # Every opportunity write stamps updated_at, compaction included
+        db.func.max(InvestmentOpportunity.updated_at),
+        # Investing only appends a ledger event, so the last id moves with every investment
+        db.func.max(FundingEvent.id)
+    )
+    return tuple(db.session.execute(db.select(*(db.select(value).scalar_subquery() for value in latest))).one())
+
+
+@event.listens_for(Farm, 'before_update')
+def _stamp_catalog_edit(mapper, connection, target):
+    # The farm cards show the same fields as the per-farm API payloads
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in PAYLOAD_COLUMNS):
+        target.updated_at = datetime.utcnow()
+
+
+class DeferredRows:
+    """Query results that are only loaded when a template first uses them"""
+
+    def __init__(self, query):
+        self._query = query
+        self._rows = None
+
+    def _load(self):
+        if self._rows is None:
+            self._rows = self._query.all()
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __bool__(self):
+        return bool(self._load())
+
+
+class FragmentCacheExtension(Extension):
+    """The {% cache name, version %} ... {% endcache %} tag"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        parser.stream.expect('comma')
+        version = parser.parse_expression()
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [name, version]), [], [], body).set_lineno(lineno)
+
+    def _render(self, name, version, caller):
+        entry = fragment_cache.get(name, version)
+        metrics.registry.record_fragment(name, entry is not None)
+        if entry is not None:
+            return Markup(entry[2])
+        body = caller()
+        fragment_cache.put(name, version, None, body, 'text/html')
+        return Markup(body)
+
+
+def init_app(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
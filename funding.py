@@ -0,0 +1,263 @@
+"""
+Contention-safe funding path for investment opportunities
+An investment appends a FundingEvent to the funding ledger instead of updating
+the farm, opportunity and investor total rows, so concurrent investors no longer
+queue on those few rows. compact_funding() folds pending events into the total
+columns; exact reads add the pending delta (see Farm.funded,
+InvestmentOpportunity.raised and User.invested in models.py).
+
+Compaction runs in the background of every gunicorn worker (gunicorn.conf.py
+starts it through start_compaction()) every FUNDING_COMPACTION_INTERVAL seconds,
+5 by default, 0 to leave it to the CLI. A database lock lets one compactor work
+at a time: a transaction-scoped advisory lock in PostgreSQL (the others skip
+their turn), the write lock in SQLite. This keeps the pending ledger, and with
+it the correlated sums of the exact reads, down to a few seconds of investments,
+and the compacted totals the listings sort on current.
+
+Investments of one opportunity still take its row lock (FOR UPDATE) before they
+append: capacity is checked against the exact raised total, and under READ
+COMMITTED two investors who did not wait for each other would both pass the
+check without seeing the other's uncommitted event, overfunding the
+opportunity. The lock is per opportunity and nothing writes the row itself, so
+investors of different opportunities, farms and accounts never wait on each
+other.
+
+Usage:
+    flask --app main compact-funding                # fold pending events once
+    flask --app main compact-funding --interval 5   # keep compacting every 5 seconds
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+
+import click
+import sqlalchemy as sa
+from flask.cli import with_appcontext
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from app import db
+from models import User, Farm, InvestmentOpportunity, Investment, FundingEvent
+
+
+DEFAULT_COMPACTION_BATCH = 5000
+
+# Seconds between background compactions in each worker
+DEFAULT_COMPACTION_INTERVAL = 5
+
+# PostgreSQL advisory lock held by the transaction compacting the ledger
+COMPACTION_LOCK_KEY = 0x46554e44
+
+# Keeps IN lists well below the bound-parameter limits of SQLite and PostgreSQL
+CHUNK_SIZE = 400
+
+event_table = FundingEvent.__table__
+
+logger = logging.getLogger(__name__)
+
+# (total table, compacted column, ledger column holding the row's id)
+TOTALS = (
+    (InvestmentOpportunity.__table__, 'amount_raised', 'opportunity_id'),
+    (Farm.__table__, 'current_funding', 'farm_id'),
+    (User.__table__, 'total_investment', 'user_id'),
+)
+
+
+class FundingError(Exception):
+    """Raised when an investment cannot be reserved against an opportunity"""
+
+
+def fund_opportunity(opportunity_id, user_id, amount):
+    """Atomically reserve `amount` on an open opportunity and record the investment
+
+    The ledger event is inserted by a single INSERT ... SELECT that only yields a
+    row while the opportunity is open and its exact raised total leaves room for
+    the amount. Capacity is a per-opportunity limit, so reservations of one
+    opportunity still take turns (on its row lock in PostgreSQL, on the write lock
+    in SQLite), but they no longer write the opportunity, farm or investor rows.
+    """
+    now = datetime.utcnow()
+
+    try:
+        # Serializes reservations of this opportunity; a no-op on SQLite
+        db.session.execute(
+            db.select(InvestmentOpportunity.id)
+            .where(InvestmentOpportunity.id == opportunity_id)
+            .with_for_update()
+        )
+        result = db.session.execute(
+            db.insert(FundingEvent).from_select(
+                ['opportunity_id', 'farm_id', 'user_id', 'amount', 'created_at'],
+                db.select(
+                    InvestmentOpportunity.id,
+                    InvestmentOpportunity.farm_id,
+                    sa.literal(user_id),
+                    sa.literal(amount, sa.Float),
+                    sa.literal(now, sa.DateTime)
+                )
+                .where(
+                    InvestmentOpportunity.id == opportunity_id,
+                    InvestmentOpportunity.status == "Open",
+                    InvestmentOpportunity.raised + amount <= InvestmentOpportunity.amount_needed
+                )
+            )
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            raise FundingError(_rejection_message(opportunity_id))
+
+        # Close the opportunity once it is fully funded; only the last investor writes its row
+        db.session.execute(
+            db.update(InvestmentOpportunity)
+            .where(
+                InvestmentOpportunity.id == opportunity_id,
+                InvestmentOpportunity.status == "Open",
+                InvestmentOpportunity.raised >= InvestmentOpportunity.amount_needed
+            )
+            .values(status="Closed")
+            .execution_options(synchronize_session=False)
+        )
+
+        investment = Investment(user_id=user_id, opportunity_id=opportunity_id, amount=amount, date_invested=now)
+        db.session.add(investment)
+        db.session.commit()
+    except OperationalError as e:
+        # Lock timeouts surface as a retryable rejection instead of a server error
+        db.session.rollback()
+        raise FundingError('This opportunity is in high demand, please try again') from e
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+    return investment
+
+
+def _rejection_message(opportunity_id):
+    opportunity = db.session.get(InvestmentOpportunity, opportunity_id)
+    if opportunity is None or opportunity.status != "Open":
+        return 'This investment opportunity is no longer open'
+    remaining = opportunity.amount_needed - opportunity.raised
+    return f'Maximum available investment is ${remaining:.2f}'
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def compact_batch(connection, batch_size=DEFAULT_COMPACTION_BATCH):
+    """Fold up to `batch_size` pending events into the totals; returns how many
+
+    Events are stamped before their amounts are added, and only if nobody else
+    stamped them first, so concurrent compactions can never count an event twice.
+    Run inside a transaction: readers see either the pending events or the totals
+    that include them, never both.
+    """
+    ids = connection.execute(
+        sa.select(event_table.c.id)
+        .where(event_table.c.compacted_at.is_(None))
+        .order_by(event_table.c.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    now = datetime.utcnow()
+    for chunk in _chunks(ids):
+        result = connection.execute(
+            event_table.update()
+            .where(event_table.c.id.in_(chunk), event_table.c.compacted_at.is_(None))
+            .values(compacted_at=now)
+        )
+        if result.rowcount != len(chunk):
+            raise FundingError('Funding events were compacted concurrently')
+
+    for table, column, key in TOTALS:
+        deltas = {}
+        for chunk in _chunks(ids):
+            rows = connection.execute(
+                sa.select(event_table.c[key], sa.func.sum(event_table.c.amount))
+                .where(event_table.c.id.in_(chunk))
+                .group_by(event_table.c[key])
+            )
+            for row_id, delta in rows:
+                deltas[row_id] = deltas.get(row_id, 0.0) + delta
+        if deltas:
+            # In id order, so total rows are always locked in the same order
+            connection.execute(
+                table.update()
+                .where(table.c.id == sa.bindparam('row_id'))
+                .values({column: sa.func.coalesce(table.c[column], 0.0) + sa.bindparam('delta')}),
+                [{'row_id': row_id, 'delta': deltas[row_id]} for row_id in sorted(deltas)]
+            )
+    return len(ids)
+
+
+def _lock_compaction(connection):
+    """Take the compaction lock for this transaction; False if another compactor holds it"""
+    if connection.dialect.name == 'postgresql':
+        return connection.execute(sa.select(sa.func.pg_try_advisory_xact_lock(COMPACTION_LOCK_KEY))).scalar()
+    # SQLite has a single writer: taking the write lock before reading the pending
+    # events waits out any other compaction and reads what it committed
+    connection.execute(event_table.update().where(sa.false()).values(compacted_at=event_table.c.compacted_at))
+    return True
+
+
+def compact_funding(engine=None, batch_size=DEFAULT_COMPACTION_BATCH):
+    """Fold every pending funding event into the totals, one transaction per batch
+
+    Returns how many events were folded; stops early while another compaction runs.
+    """
+    engine = engine or db.engine
+    compacted = 0
+    while True:
+        with engine.begin() as connection:
+            if not _lock_compaction(connection):
+                return compacted
+            count = compact_batch(connection, batch_size)
+        compacted += count
+        if count < batch_size:
+            return compacted
+
+
+def _compaction_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                compact_funding()
+        except Exception:
+            # Pending events stay pending, and exact reads still count them
+            logger.exception("Funding compaction failed; retrying in %ss", interval)
+
+
+def start_compaction(app):
+    """Compact the ledger in a daemon thread of this process; returns the thread (None when disabled)"""
+    interval = app.config.get('FUNDING_COMPACTION_INTERVAL', DEFAULT_COMPACTION_INTERVAL)
+    if not interval:
+        return None
+    thread = threading.Thread(target=_compaction_loop, args=(app, interval), name='funding-compaction',
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+@click.command('compact-funding')
+@click.option('--batch-size', type=int, default=DEFAULT_COMPACTION_BATCH, show_default=True)
+@click.option('--interval', type=float, default=None,
+              help='Keep running, compacting every INTERVAL seconds.')
+@with_appcontext
+def compact_funding_command(batch_size, interval):
+    """Fold pending funding ledger events into the funding totals."""
+    while True:
+        started = time.perf_counter()
+        compacted = compact_funding(batch_size=batch_size)
+        click.echo(f"Compacted {compacted} funding event(s) in {time.perf_counter() - started:.2f}s")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.cli.add_command(compact_funding_command)
@@ -1,289 +1,460 @@
 """
 Script to generate sample data for the Smart Agri Investment platform
 This will create farms, investment opportunities, and farm performance data for analytics
+
+The five showcase farms are always generated. A scale factor multiplies the whole
+dataset (farms, opportunities, investors, investments and performance history) in
+the same proportions for load testing, e.g. --scale 20000 gives 100k farms and
+2.4M performance rows. Every farm draws from its own random stream derived from the
+seed, so a given seed, scale and --as-of date produce the same dataset no matter
+how many worker processes generate it. Rows are written with bulk executemany
+inserts; workers only generate, the main process is the single writer.
+
+Usage:
+    python generate_sample_data.py
+    python generate_sample_data.py --scale 20000 --workers 8 --seed 7
 """
 
 import os
 import sys
+import time
 import random
-from datetime import datetime, timedelta
-import math
+import argparse
+from datetime import date, datetime, timedelta
+from multiprocessing import Pool
+
+import sqlalchemy as sa
 
 # Add the current directory to the path so we can import the app modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db
-from models import User, Farm, InvestmentOpportunity, Investment, FarmPerformance
+from app import create_app, db
+from models import User, Farm, InvestmentOpportunity, Investment, FarmPerformance, FarmPerformanceRollup, FundingEvent, \
+    FarmSeriesSegment
+from migrations import upgrade
+import rollups
+import segments
+
+
+DEFAULT_SEED = 42
+
+# Rows per executemany call, and farms generated per unit of work
+BATCH_SIZE = 5000
+FARMS_PER_CHUNK = 500
+
+# Synthetic investors are recognisable (and cleared on the next run) by this prefix
+SYNTHETIC_INVESTOR_PREFIX = "loadtest-investor-"
+
+FARM_TYPES = ["Crop", "Livestock", "Mixed"]
+RISK_LEVELS = ["Low", "Medium", "High"]
+LOCATIONS = [
+    "Coimbatore, Tamil Nadu",
+    "Ooty, Tamil Nadu",
+    "Thanjavur, Tamil Nadu",
+    "Madurai, Tamil Nadu",
+    "Tirunelveli, Tamil Nadu",
+    "Salem, Tamil Nadu",
+    "Erode, Tamil Nadu",
+    "Tiruchirappalli, Tamil Nadu"
+]
+
+WEATHER_CONDITIONS = ["Sunny", "Cloudy", "Rainy", "Storm", "Drought", "Ideal", "Cold", "Hot"]
+
+# Weather impact on yield
+WEATHER_IMPACT = {
+    "Sunny": 1.1,
+    "Cloudy": 0.9,
+    "Rainy": 0.8,
+    "Storm": 0.6,
+    "Drought": 0.5,
+    "Ideal": 1.2,
+    "Cold": 0.7,
+    "Hot": 0.85
+}
+
+# Growth factors for seasonal variations
+MONTHLY_GROWTH_FACTOR = [
+    0.8,  # January
+    0.85, # February
+    0.95, # March
+    1.1,  # April
+    1.2,  # May
+    1.3,  # June
+    1.25, # July
+    1.2,  # August
+    1.1,  # September
+    1.0,  # October
+    0.9,  # November
+    0.85  # December
+]
+
+SHOWCASE_FARMS = [
+    {
+        "name": "Green Valley Organic Farms",
+        "location": "Coimbatore, Tamil Nadu",
+        "description": "Sustainable crop farm specializing in organic vegetables and traditional rice varieties.",
+        "farm_type": "Crop",
+        "size_hectares": 120.5,
+        "established_date": date(2018, 5, 15),
+        "total_funding_needed": 5000000.0,  # 50 lakh rupees
+        "current_funding": 3200000.0,       # 32 lakh rupees
+        "expected_roi": 12.5,
+        "risk_level": "Low"
+    },
+    {
+        "name": "Nilgiri Cattle Ranch",
+        "location": "Ooty, Tamil Nadu",
+        "description": "Premium cattle farm producing high-quality dairy with sustainable practices in the hills.",
+        "farm_type": "Livestock",
+        "size_hectares": 85.0,
+        "established_date": date(2015, 3, 22),
+        "total_funding_needed": 7500000.0,  # 75 lakh rupees
+        "current_funding": 4200000.0,       # 42 lakh rupees
+        "expected_roi": 14.2,
+        "risk_level": "Medium"
+    },
+    {
+        "name": "Cauvery Delta Farm",
+        "location": "Thanjavur, Tamil Nadu",
+        "description": "Mixed farming operation with paddy crops and fish ponds. Focuses on sustainable ecosystem in the delta region.",
+        "farm_type": "Mixed",
+        "size_hectares": 35.0,
+        "established_date": date(2019, 8, 10),
+        "total_funding_needed": 6000000.0,  # 60 lakh rupees
+        "current_funding": 2500000.0,  # 25 lakh rupees
+        "expected_roi": 15.8,
+        "risk_level": "Medium"
+    },
+    {
+        "name": "Organic Harvest Farms",
+        "location": "Madurai, Tamil Nadu",
+        "description": "Family-owned organic farm specializing in traditional vegetable varieties and native crops.",
+        "farm_type": "Crop",
+        "size_hectares": 20.0,
+        "established_date": date(2017, 2, 28),
+        "total_funding_needed": 4500000.0,  # 45 lakh rupees
+        "current_funding": 3800000.0,       # 38 lakh rupees
+        "expected_roi": 11.2,
+        "risk_level": "Low"
+    },
+    {
+        "name": "Tirunelveli Agro Farms",
+        "location": "Tirunelveli, Tamil Nadu",
+        "description": "Modern farm combining poultry production with banana and coconut cultivation.",
+        "farm_type": "Mixed",
+        "size_hectares": 27.5,
+        "established_date": date(2016, 6, 5),
+        "total_funding_needed": 5500000.0,  # 55 lakh rupees
+        "current_funding": 2900000.0,       # 29 lakh rupees
+        "expected_roi": 16.5,
+        "risk_level": "High"
+    }
+]
+
+# One scale unit: the showcase farms and one investor investing in each of them
+FARMS_PER_SCALE = len(SHOWCASE_FARMS)
+
+
+def _farm_random(seed, farm_index):
+    # String seeds are hashed deterministically, unlike hash() of a tuple
+    return random.Random(f"{seed}:{farm_index}")
+
+
+def _synthetic_farm(rng, farm_index):
+    farm_type = rng.choice(FARM_TYPES)
+    total_funding_needed = round(rng.uniform(4000000.0, 8000000.0), -4)
+    return {
+        "name": f"Synthetic {farm_type} Farm {farm_index + 1}",
+        "location": rng.choice(LOCATIONS),
+        "description": f"Generated {farm_type.lower()} farm for load testing.",
+        "farm_type": farm_type,
+        "size_hectares": round(rng.uniform(15.0, 125.0), 1),
+        "established_date": date(2012, 1, 1) + timedelta(days=rng.randint(0, 3650)),
+        "total_funding_needed": total_funding_needed,
+        "current_funding": round(total_funding_needed * rng.uniform(0.4, 0.85), -4),
+        "expected_roi": round(rng.uniform(11.0, 16.5), 1),
+        "risk_level": rng.choice(RISK_LEVELS)
+    }
+
+
+def generate_farm(farm_index, seed, months, as_of, investors):
+    """Generate one farm with its opportunities, investment and monthly performance
+
+    Returns (farm, opportunities, investments, performance) as column dicts.
+    Investments refer to opportunities by position and to investors by index.
+    """
+    rng = _farm_random(seed, farm_index)
+    if farm_index < len(SHOWCASE_FARMS):
+        farm = dict(SHOWCASE_FARMS[farm_index])
+    else:
+        farm = _synthetic_farm(rng, farm_index)
+
+    # Create 1-3 opportunities per farm
+    opportunities = []
+    for i in range(rng.randint(1, 3)):
+        # Calculate amount needed as a portion of total funding
+        portion = rng.uniform(0.15, 0.4)
+        amount_needed = farm["total_funding_needed"] * portion
+        opportunities.append({
+            "title": f"{farm['name']} - Project {i+1}",
+            "description": f"Investment opportunity for {farm['name']}. Phase {i+1} of farm development.",
+            "amount_needed": amount_needed,
+            "amount_raised": amount_needed * rng.uniform(0.1, 0.8),
+            "minimum_investment": amount_needed * 0.05,
+            "expected_roi": farm["expected_roi"] + rng.uniform(-2.0, 2.0),
+            "duration_months": rng.choice([12, 24, 36, 48]),
+            "risk_level": farm["risk_level"],
+            "start_date": as_of,
+            "end_date": as_of + timedelta(days=365),
+            "status": "Open"
+        })
+
+    # Each farm's first opportunity gets one investment, spread round-robin over the investors
+    opportunity = opportunities[0]
+    amount = opportunity["minimum_investment"] * rng.uniform(1.0, 3.0)
+    opportunity["amount_raised"] += amount
+    farm["current_funding"] += amount
+    investments = [{
+        "opportunity": 0,
+        "investor": farm_index % investors,
+        "amount": amount,
+        "date_invested": datetime.combine(as_of, datetime.min.time()) - timedelta(days=rng.randint(10, 100)),
+        "status": "Active"
+    }]
+
+    base_yield = rng.uniform(10.0, 50.0)  # Base yield in tons
+    base_revenue = rng.uniform(20000.0, 100000.0)  # Base monthly revenue
+    base_expense = base_revenue * rng.uniform(0.4, 0.7)  # Base monthly expenses
+
+    # Monthly records ending around as_of (24 months span two years)
+    start_date = as_of - timedelta(days=round(months * 365 / 12))
+    performance = []
+    for i in range(months):
+        current_date = start_date + timedelta(days=30*i)
+        season_factor = MONTHLY_GROWTH_FACTOR[current_date.month - 1]
+        random_factor = rng.uniform(0.85, 1.15)
+        weather = rng.choice(WEATHER_CONDITIONS)
+
+        # Yield follows season and weather, revenue follows the season, expenses are more stable
+        current_yield = base_yield * season_factor * random_factor * WEATHER_IMPACT.get(weather, 1.0)
+        current_revenue = base_revenue * season_factor * random_factor
+        current_expenses = base_expense * rng.uniform(0.9, 1.1)
+        current_profit = current_revenue - current_expenses
+
+        performance.append({
+            "date": current_date,
+            "yield_amount": round(current_yield, 2),
+            "revenue": round(current_revenue, 2),
+            "expenses": round(current_expenses, 2),
+            "profit": round(current_profit, 2),
+            "weather_conditions": weather,
+            "notes": f"Monthly performance record for {current_date.strftime('%B %Y')}"
+        })
+
+    return farm, opportunities, investments, performance
+
+
+def generate_chunk(task):
+    """Worker entry point: generate a contiguous range of farms"""
+    first, last, seed, months, as_of, investors = task
+    return [generate_farm(farm_index, seed, months, as_of, investors) for farm_index in range(first, last)]
+
 
+def _insert_batches(connection, table, rows, batch_size=BATCH_SIZE):
+    for i in range(0, len(rows), batch_size):
+        connection.execute(table.insert(), rows[i:i + batch_size])
 
-def generate_sample_data():
+
+def _max_id(connection, model):
+    return connection.execute(sa.select(sa.func.coalesce(sa.func.max(model.id), 0))).scalar()
+
+
+def _sync_sequences(connection, models):
+    """Move PostgreSQL id sequences past the explicitly inserted ids"""
+    if connection.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__table__.name
+        connection.execute(sa.text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"(SELECT coalesce(max(id), 1) FROM \"{table}\"))"
+        ))
+
+
+def _clear_existing_data():
+    print("Clearing existing performance data...")
+    FarmPerformanceRollup.query.delete()
+    FarmSeriesSegment.query.delete()
+    FarmPerformance.query.delete()
+    FundingEvent.query.delete()
+    Investment.query.delete()
+    InvestmentOpportunity.query.delete()
+    Farm.query.delete()
+    User.query.filter(User.username.startswith(SYNTHETIC_INVESTOR_PREFIX)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _create_demo_users():
+    # Create admin user if it doesn't exist
+    admin = User.query.filter_by(username="admin").first()
+    if not admin:
+        admin = User(
+            username="admin",
+            email="admin@example.com",
+            first_name="Admin",
+            last_name="User",
+            is_investor=False
+        )
+        admin.set_password("password")
+        db.session.add(admin)
+        print("Created admin user")
+
+    # Create investor user if it doesn't exist
+    investor = User.query.filter_by(username="investor").first()
+    if not investor:
+        investor = User(
+            username="investor",
+            email="investor@example.com",
+            first_name="Test",
+            last_name="Investor",
+            is_investor=True
+        )
+        investor.set_password("password")
+        db.session.add(investor)
+        print("Created investor user")
+
+    # Investments are regenerated below
+    investor.total_investment = 0.0
+    db.session.commit()
+    return admin, investor
+
+
+def _create_synthetic_investors(connection, count, password_hash):
+    """Bulk insert investors after the demo one; returns their ids in order"""
+    first_id = _max_id(connection, User) + 1
+    rows = [
+        {
+            "id": first_id + i,
+            "username": f"{SYNTHETIC_INVESTOR_PREFIX}{i + 1}",
+            "email": f"{SYNTHETIC_INVESTOR_PREFIX}{i + 1}@example.com",
+            # Hashing is deliberately slow, so every synthetic investor shares one hash
+            "password_hash": password_hash,
+            "first_name": "Load",
+            "last_name": f"Investor {i + 1}",
+            "is_investor": True,
+            "total_investment": 0.0
+        }
+        for i in range(count)
+    ]
+    _insert_batches(connection, User.__table__, rows)
+    return [row["id"] for row in rows]
+
+
+def _write_chunk(connection, generated, owner_id, investor_ids, next_ids, investor_totals):
+    """Assign ids to one generated chunk and bulk insert it"""
+    farms, opportunities, investments, performance = [], [], [], []
+    for farm, farm_opportunities, farm_investments, farm_performance in generated:
+        next_ids["farm"] += 1
+        farm_id = next_ids["farm"]
+        farms.append(dict(farm, id=farm_id, owner_id=owner_id))
+
+        opportunity_ids = []
+        for opportunity in farm_opportunities:
+            next_ids["opportunity"] += 1
+            opportunity_ids.append(next_ids["opportunity"])
+            opportunities.append(dict(opportunity, id=next_ids["opportunity"], farm_id=farm_id))
+
+        for investment in farm_investments:
+            user_id = investor_ids[investment["investor"]]
+            investor_totals[user_id] = investor_totals.get(user_id, 0.0) + investment["amount"]
+            investments.append({
+                "user_id": user_id,
+                "opportunity_id": opportunity_ids[investment["opportunity"]],
+                "amount": investment["amount"],
+                "date_invested": investment["date_invested"],
+                "status": investment["status"]
+            })
+
+        performance.extend(dict(row, farm_id=farm_id) for row in farm_performance)
+
+    _insert_batches(connection, Farm.__table__, farms)
+    _insert_batches(connection, InvestmentOpportunity.__table__, opportunities)
+    _insert_batches(connection, Investment.__table__, investments)
+    _insert_batches(connection, FarmPerformance.__table__, performance)
+    return len(farms), len(opportunities), len(investments), len(performance)
+
+
+def generate_sample_data(scale=1, seed=DEFAULT_SEED, months=24, workers=1, investors=None, as_of=None):
     """Generate sample data for analytics and visualization"""
-    with app.app_context():
+    as_of = as_of or datetime.now().date()
+    farm_count = FARMS_PER_SCALE * scale
+    investors = investors or scale
+
+    with create_app().app_context():
         print("Generating sample data for analytics...")
-        
-        # Delete existing data
-        print("Clearing existing performance data...")
-        FarmPerformance.query.delete()
-        Investment.query.delete()
-        InvestmentOpportunity.query.delete()
-        Farm.query.delete()
-        
-        # Create admin user if it doesn't exist
-        admin = User.query.filter_by(username="admin").first()
-        if not admin:
-            admin = User(
-                username="admin",
-                email="admin@example.com",
-                first_name="Admin",
-                last_name="User",
-                is_investor=False
-            )
-            admin.set_password("password")
-            db.session.add(admin)
-            print("Created admin user")
-        
-        # Create investor user if it doesn't exist
-        investor = User.query.filter_by(username="investor").first()
-        if not investor:
-            investor = User(
-                username="investor",
-                email="investor@example.com",
-                first_name="Test",
-                last_name="Investor",
-                is_investor=True
-            )
-            investor.set_password("password")
-            db.session.add(investor)
-            print("Created investor user")
-        
-        db.session.commit()
-        
-        # Create sample farms
-        farms = []
-        farm_types = ["Crop", "Livestock", "Mixed"]
-        risk_levels = ["Low", "Medium", "High"]
-        
-        farm_data = [
-            {
-                "name": "Green Valley Organic Farms",
-                "location": "Coimbatore, Tamil Nadu",
-                "description": "Sustainable crop farm specializing in organic vegetables and traditional rice varieties.",
-                "farm_type": "Crop",
-                "size_hectares": 120.5,
-                "established_date": datetime(2018, 5, 15).date(),
-                "total_funding_needed": 5000000.0,  # 50 lakh rupees
-                "current_funding": 3200000.0,       # 32 lakh rupees
-                "expected_roi": 12.5,
-                "risk_level": "Low",
-                "owner_id": admin.id
-            },
-            {
-                "name": "Nilgiri Cattle Ranch",
-                "location": "Ooty, Tamil Nadu",
-                "description": "Premium cattle farm producing high-quality dairy with sustainable practices in the hills.",
-                "farm_type": "Livestock",
-                "size_hectares": 85.0,
-                "established_date": datetime(2015, 3, 22).date(),
-                "total_funding_needed": 7500000.0,  # 75 lakh rupees
-                "current_funding": 4200000.0,       # 42 lakh rupees
-                "expected_roi": 14.2,
-                "risk_level": "Medium",
-                "owner_id": admin.id
-            },
-            {
-                "name": "Cauvery Delta Farm",
-                "location": "Thanjavur, Tamil Nadu",
-                "description": "Mixed farming operation with paddy crops and fish ponds. Focuses on sustainable ecosystem in the delta region.",
-                "farm_type": "Mixed",
-                "size_hectares": 35.0,
-                "established_date": datetime(2019, 8, 10).date(),
-                "total_funding_needed": 6000000.0,  # 60 lakh rupees
-                "current_funding": 2500000.0,  # 25 lakh rupees
-                "expected_roi": 15.8,
-                "risk_level": "Medium",
-                "owner_id": admin.id
-            },
-            {
-                "name": "Organic Harvest Farms",
-                "location": "Madurai, Tamil Nadu",
-                "description": "Family-owned organic farm specializing in traditional vegetable varieties and native crops.",
-                "farm_type": "Crop",
-                "size_hectares": 20.0,
-                "established_date": datetime(2017, 2, 28).date(),
-                "total_funding_needed": 4500000.0,  # 45 lakh rupees
-                "current_funding": 3800000.0,       # 38 lakh rupees
-                "expected_roi": 11.2,
-                "risk_level": "Low",
-                "owner_id": admin.id
-            },
-            {
-                "name": "Tirunelveli Agro Farms",
-                "location": "Tirunelveli, Tamil Nadu",
-                "description": "Modern farm combining poultry production with banana and coconut cultivation.",
-                "farm_type": "Mixed",
-                "size_hectares": 27.5,
-                "established_date": datetime(2016, 6, 5).date(),
-                "total_funding_needed": 5500000.0,  # 55 lakh rupees
-                "current_funding": 2900000.0,       # 29 lakh rupees
-                "expected_roi": 16.5,
-                "risk_level": "High",
-                "owner_id": admin.id
+        upgrade()
+        started = time.perf_counter()
+
+        _clear_existing_data()
+        admin, investor = _create_demo_users()
+        owner_id, investor_id, password_hash = admin.id, investor.id, investor.password_hash
+        db.session.close()
+        engine = db.engine
+
+        with engine.begin() as connection:
+            investor_ids = [investor_id] + _create_synthetic_investors(connection, investors - 1, password_hash)
+            next_ids = {
+                "farm": _max_id(connection, Farm),
+                "opportunity": _max_id(connection, InvestmentOpportunity)
             }
+        print(f"Using {len(investor_ids)} investor(s)")
+
+        tasks = [
+            (first, min(first + FARMS_PER_CHUNK, farm_count), seed, months, as_of, investors)
+            for first in range(0, farm_count, FARMS_PER_CHUNK)
         ]
-        
-        for farm_info in farm_data:
-            farm = Farm(**farm_info)
-            db.session.add(farm)
-            farms.append(farm)
-        
-        db.session.commit()
-        print(f"Created {len(farms)} sample farms")
-        
-        # Create investment opportunities for each farm
-        opportunities = []
-        for farm in farms:
-            # Create 1-3 opportunities per farm
-            num_opportunities = random.randint(1, 3)
-            
-            for i in range(num_opportunities):
-                # Calculate amount needed as a portion of total funding
-                portion = random.uniform(0.15, 0.4)
-                amount_needed = farm.total_funding_needed * portion
-                amount_raised = amount_needed * random.uniform(0.1, 0.8)
-                
-                opportunity = InvestmentOpportunity(
-                    farm_id=farm.id,
-                    title=f"{farm.name} - Project {i+1}",
-                    description=f"Investment opportunity for {farm.name}. Phase {i+1} of farm development.",
-                    amount_needed=amount_needed,
-                    amount_raised=amount_raised,
-                    minimum_investment=amount_needed * 0.05,
-                    expected_roi=farm.expected_roi + random.uniform(-2.0, 2.0),
-                    duration_months=random.choice([12, 24, 36, 48]),
-                    risk_level=farm.risk_level,
-                    start_date=datetime.now().date(),
-                    end_date=(datetime.now() + timedelta(days=365)).date(),
-                    status="Open"
-                )
-                db.session.add(opportunity)
-                opportunities.append(opportunity)
-        
-        db.session.commit()
-        print(f"Created {len(opportunities)} investment opportunities")
-        
-        # Create some investments for the investor
-        for i in range(min(5, len(opportunities))):
-            opportunity = opportunities[i]
-            amount = opportunity.minimum_investment * random.uniform(1.0, 3.0)
-            
-            investment = Investment(
-                user_id=investor.id,
-                opportunity_id=opportunity.id,
-                amount=amount,
-                date_invested=datetime.now() - timedelta(days=random.randint(10, 100)),
-                status="Active"
+        totals = [0, 0, 0, 0]
+        investor_totals = {}
+        pool = Pool(workers) if workers > 1 else None
+        try:
+            # imap keeps chunk order, so ids come out the same for any worker count
+            chunks = pool.imap(generate_chunk, tasks) if pool else map(generate_chunk, tasks)
+            for generated in chunks:
+                with engine.begin() as connection:
+                    counts = _write_chunk(connection, generated, owner_id, investor_ids, next_ids, investor_totals)
+                totals = [total + count for total, count in zip(totals, counts)]
+                print(f"  {totals[0]}/{farm_count} farms, {totals[3]} performance records")
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        print(f"Created {totals[0]} farms, {totals[1]} investment opportunities and {totals[2]} investments")
+
+        with engine.begin() as connection:
+            connection.execute(
+                User.__table__.update().where(User.__table__.c.id == sa.bindparam("user_id")),
+                [{"user_id": user_id, "total_investment": total} for user_id, total in investor_totals.items()]
             )
-            
-            db.session.add(investment)
-            
-            # Update amounts
-            opportunity.amount_raised += amount
-            opportunity.farm.current_funding += amount
-            investor.total_investment += amount
-            
-        db.session.commit()
-        print(f"Created investments for the investor")
-        
-        # Generate farm performance data for each farm
-        for farm in farms:
-            # Generate 24 months of data
-            start_date = datetime.now() - timedelta(days=730)  # 2 years ago
-            
-            weather_conditions = ["Sunny", "Cloudy", "Rainy", "Storm", "Drought", "Ideal", "Cold", "Hot"]
-            
-            base_yield = random.uniform(10.0, 50.0)  # Base yield in tons
-            base_revenue = random.uniform(20000.0, 100000.0)  # Base monthly revenue
-            base_expense = base_revenue * random.uniform(0.4, 0.7)  # Base monthly expenses
-            
-            # Growth factors for seasonal variations
-            monthly_growth_factor = [
-                0.8,  # January
-                0.85, # February
-                0.95, # March
-                1.1,  # April
-                1.2,  # May
-                1.3,  # June
-                1.25, # July
-                1.2,  # August
-                1.1,  # September
-                1.0,  # October
-                0.9,  # November
-                0.85  # December
-            ]
-            
-            # Create 24 monthly performance records
-            for i in range(24):
-                current_date = (start_date + timedelta(days=30*i)).date()
-                month_index = current_date.month - 1
-                
-                # Add seasonality factor
-                season_factor = monthly_growth_factor[month_index]
-                
-                # Add some randomness
-                random_factor = random.uniform(0.85, 1.15)
-                
-                # Determine weather condition
-                weather = random.choice(weather_conditions)
-                
-                # Weather impact on yield
-                weather_impact = {
-                    "Sunny": 1.1,
-                    "Cloudy": 0.9,
-                    "Rainy": 0.8,
-                    "Storm": 0.6,
-                    "Drought": 0.5,
-                    "Ideal": 1.2,
-                    "Cold": 0.7,
-                    "Hot": 0.85
-                }.get(weather, 1.0)
-                
-                # Calculate yield with seasonal and weather effects
-                current_yield = base_yield * season_factor * random_factor * weather_impact
-                
-                # Calculate revenue based on yield
-                current_revenue = base_revenue * season_factor * random_factor
-                
-                # Expenses are more stable but still vary
-                expense_factor = random.uniform(0.9, 1.1)
-                current_expenses = base_expense * expense_factor
-                
-                # Calculate profit
-                current_profit = current_revenue - current_expenses
-                
-                # Create performance record
-                performance = FarmPerformance(
-                    farm_id=farm.id,
-                    date=current_date,
-                    yield_amount=round(current_yield, 2),
-                    revenue=round(current_revenue, 2),
-                    expenses=round(current_expenses, 2),
-                    profit=round(current_profit, 2),
-                    weather_conditions=weather,
-                    notes=f"Monthly performance record for {current_date.strftime('%B %Y')}"
-                )
-                
-                db.session.add(performance)
-            
-            # Add a trend factor for farm development over time
-            base_yield *= 1.2
-            base_revenue *= 1.25
-            base_expense *= 1.15  # Expenses grow slower than revenue
-                
-        db.session.commit()
+            _sync_sequences(connection, (User, Farm, InvestmentOpportunity, Investment, FarmPerformance))
+            # Bulk inserts bypass the ORM hooks that keep rollups and packed histories current
+            rollups.rebuild(connection)
+            segments.rebuild(connection)
         print("Generated farm performance data")
-        
-        print("Sample data generation complete!")
+
+        print(f"Sample data generation complete in {time.perf_counter() - started:.1f}s!")
 
 
 if __name__ == "__main__":
-    generate_sample_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate sample data for the Smart Agri Investment platform")
+    parser.add_argument("--scale", type=int, default=1,
+                        help=f"multiplies the dataset; each unit adds {FARMS_PER_SCALE} farms and one investor")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--months", type=int, default=24, help="performance records per farm")
+    parser.add_argument("--workers", type=int, default=1, help="generator processes")
+    parser.add_argument("--investors", type=int, default=None, help="defaults to the scale")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                        help="last day of the generated history, YYYY-MM-DD (default: today)")
+    args = parser.parse_args()
+
+    generate_sample_data(args.scale, args.seed, args.months, args.workers, args.investors, args.as_of)
@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for the Smart Agri Investment platform
+gunicorn reads this file from the working directory; command line flags win.
+
+With --preload (or GUNICORN_PRELOAD=1) the master imports the app once and forks
+workers from it, so workers boot without importing anything and share the pages
+of the heavy modules warmed below. Leave it off with --reload: a preloaded app
+is not re-imported when the code changes.
+
+Workers run several request threads (gthread), so a thread waiting on password
+hashing (see passwords.py) or on the database does not hold up page views.
+
+Each worker also compacts the funding ledger in the background (see funding.py,
+FUNDING_COMPACTION_INTERVAL).
+"""
+
+import os
+
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "").lower() in ("1", "true", "yes")
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Deferred by the routes for fast cold starts; imported once here instead
+        import analytics  # noqa: F401
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        # Pooled connections opened in the master must not be shared with the workers
+        from app import db
+        from main import app
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # After post_fork, so the thread uses this worker's connections
+    from main import app
+    import funding
+    funding.start_compaction(app)
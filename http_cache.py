@@ -0,0 +1,150 @@
+"""
+HTTP caching for the read-only per-farm APIs
+Responses are keyed by endpoint, farm, query string and the farm's data version.
+The version is bumped whenever the farm's performance data changes (see
+rollups.refresh), so every worker sees the change on its next request: stale
+entries are simply never matched again. Clients and proxies get an ETag,
+Last-Modified and Cache-Control, and conditional GETs are answered with 304
+without touching the performance history.
+"""
+
+import zlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, request, abort, Response
+from sqlalchemy import event, inspect
+
+from app import db
+from models import Farm
+
+
+# Farm columns that appear in cached payloads and template fragments (fragments.py);
+# editing them also bumps the version
+PAYLOAD_COLUMNS = ('name', 'farm_type', 'location', 'description', 'size_hectares', 'expected_roi',
+                   'risk_level')
+
+
+class ResponseCache:
+    """Bounded, thread-safe LRU of (version, last_modified, body, mimetype) entries"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, last_modified, body, mimetype):
+        with self._lock:
+            self._entries[key] = (version, last_modified, body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_farm(self, farm_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == farm_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def farm_data_version(farm_id):
+    """(data_version, data_updated_at) of a farm, or None if it does not exist"""
+    return db.session.execute(
+        db.select(Farm.data_version, Farm.data_updated_at).where(Farm.id == farm_id)
+    ).first()
+
+
+def _http_timestamp(value):
+    # HTTP dates have one-second resolution and are always UTC
+    return value.replace(microsecond=0, tzinfo=timezone.utc) if value else None
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return bool(since and last_modified and since >= last_modified)
+
+
+def _apply_cache_headers(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    max_age = current_app.config.get('API_CACHE_MAX_AGE', 60)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}, must-revalidate'
+    return response
+
+
+def farm_cached(view):
+    """Cache a public per-farm JSON view by farm data version, with conditional GET support"""
+    @wraps(view)
+    def wrapper(farm_id, **kwargs):
+        row = farm_data_version(farm_id)
+        if row is None:
+            abort(404)
+        version, updated_at = row
+        version = version or 0
+        last_modified = _http_timestamp(updated_at)
+
+        query = request.query_string.decode('utf-8', 'replace')
+        key = (request.endpoint, farm_id, query)
+        # crc32 rather than hash(): ETags must agree across worker processes
+        etag = f'{request.endpoint}-{farm_id}-{version}-{zlib.crc32(query.encode()):08x}'
+
+        if _not_modified(etag, last_modified):
+            return _apply_cache_headers(Response(status=304), etag, last_modified)
+
+        entry = response_cache.get(key, version)
+        if entry is not None:
+            response = Response(entry[2], mimetype=entry[3])
+            response.headers['X-Cache'] = 'HIT'
+            return _apply_cache_headers(response, etag, last_modified)
+
+        response = current_app.make_response(view(farm_id, **kwargs))
+        if response.status_code == 200:
+            # Streamed bodies are not kept, but clients may still revalidate them
+            if not response.is_streamed:
+                response_cache.put(key, version, last_modified, response.get_data(), response.mimetype)
+                response.headers['X-Cache'] = 'MISS'
+            _apply_cache_headers(response, etag, last_modified)
+        return response
+
+    return wrapper
+
+
+def bump_farm_data_versions(connection, farm_ids):
+    """Mark farms' data as changed; called once per batch of performance writes"""
+    if not farm_ids:
+        return
+    connection.execute(
+        db.update(Farm)
+        .where(Farm.id.in_(farm_ids))
+        .values(data_version=db.func.coalesce(Farm.data_version, 0) + 1, data_updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    for farm_id in farm_ids:
+        response_cache.invalidate_farm(farm_id)
+
+
+@event.listens_for(Farm, 'before_update')
+def _bump_version_on_payload_change(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in PAYLOAD_COLUMNS):
+        target.data_version = (target.data_version or 0) + 1
+        target.data_updated_at = datetime.utcnow()
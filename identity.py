@@ -0,0 +1,118 @@
+"""
+Cached identities for Flask-Login
+Every request that touches current_user used to load the full User row. The
+loader now serves a detached snapshot of the few fields requests read, from a
+bounded per-process cache whose entries expire after USER_CACHE_TTL seconds.
+Commits that update or delete a user drop that user's entry at once in the
+process that made them; other processes pick the change up within the TTL.
+Funding totals are not part of the snapshot (they live in the funding ledger,
+see funding.py), so investing and compaction never leave it stale.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from models import User
+
+
+# Columns of the snapshot; everything requests read from current_user
+IDENTITY_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.first_name,
+    User.last_name,
+    User.is_investor,
+    User.created_at
+)
+
+
+class CachedUser(UserMixin):
+    """The identity fields of a user, detached from any session"""
+
+    def __init__(self, row):
+        for column in IDENTITY_COLUMNS:
+            setattr(self, column.key, getattr(row, column.key))
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+
+class IdentityCache:
+    """Bounded, thread-safe LRU of CachedUser entries that expire after a TTL"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, user, ttl):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def load_identity(user_id):
+    """CachedUser of a user id, or None if there is no such user"""
+    user = identity_cache.get(user_id)
+    if user is not None:
+        return user
+    row = db.session.execute(db.select(*IDENTITY_COLUMNS).where(User.id == user_id)).first()
+    if row is None:
+        return None
+    user = CachedUser(row)
+    ttl = current_app.config.get('USER_CACHE_TTL', 60)
+    if ttl > 0:
+        identity_cache.put(user_id, user, ttl)
+    return user
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = {obj.id for obj in chain(session.dirty, session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('changed_user_ids', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    # After the commit, so a concurrent load cannot cache the old row again
+    identity_cache.invalidate(session.info.pop('changed_user_ids', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
@@ -0,0 +1,366 @@
+"""
+Bulk streaming ingestion of FarmPerformance feeds
+Reads CSV or NDJSON files record by record, validates them, and upserts them on
+(farm_id, date) in fixed-size batches. Each batch is written with one executemany
+INSERT ... ON CONFLICT DO UPDATE against the unique (farm_id, date) index inside
+its own transaction, so concurrent uploads of the same days cannot duplicate
+rows, and the rollups (and with them the farm data versions HTTP caches key on)
+are refreshed once per batch rather than per row. A record without weather
+conditions or notes leaves the stored ones in place, so re-ingesting an NDJSON
+export (which has no notes) does not wipe them.
+
+Usage:
+    python ingestion.py feed.csv [--format ndjson] [--batch-size 5000]
+    flask --app main ingest-performance feed.csv
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import math
+import time
+from datetime import date, datetime
+from itertools import islice
+
+import click
+import sqlalchemy as sa
+from flask.cli import with_appcontext
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Add the current directory to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from models import Farm, FarmPerformance
+import rollups
+import segments
+
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Only the first few validation errors are kept in the report
+MAX_REPORTED_ERRORS = 50
+
+FORMATS = ('csv', 'ndjson')
+
+performance_table = FarmPerformance.__table__
+
+# Dialects whose insert() supports ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+# Columns of a validated record, and the upsert conflict target (the unique (farm_id, date) index)
+INGESTED_COLUMNS = ('farm_id', 'date', 'yield_amount', 'revenue', 'expenses', 'profit', 'weather_conditions',
+                    'notes')
+UPSERT_KEYS = ('farm_id', 'date')
+
+# Optional text columns an upsert leaves alone when the record has no value (NDJSON exports carry no notes)
+KEPT_WHEN_MISSING = ('weather_conditions', 'notes')
+
+# Longest weather_conditions value the column holds
+MAX_WEATHER_LENGTH = 128
+
+# Keys per existing-row lookup, keeping its IN lists well below the bound-parameter limits
+CHUNK_SIZE = 400
+
+
+class IngestionError(Exception):
+    """Raised for a feed that cannot be read at all (unknown format, bad header, not UTF-8 or CSV)"""
+
+
+class RecordError(ValueError):
+    """Raised for a single invalid record; the record is skipped and reported"""
+
+
+class IngestionReport:
+    """Counts and timing of one ingestion run"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.batches = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'line {line}: {message}')
+
+    @property
+    def rows_per_second(self):
+        written = self.inserted + self.updated
+        return written / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'rows_read': self.rows_read,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': self.errors
+        }
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the feed format from a filename or content type (CSV by default)"""
+    name = (filename or '').lower()
+    mimetype = (content_type or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in mimetype or 'jsonlines' in mimetype:
+        return 'ndjson'
+    return 'csv'
+
+
+def _text_stream(stream):
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    if not hasattr(stream, 'readinto'):
+        stream = io.BufferedReader(stream)
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def _unreadable(error, line_number):
+    """IngestionError for a feed that stopped decoding or parsing after line_number"""
+    if isinstance(error, UnicodeDecodeError):
+        return IngestionError(f'feed is not valid UTF-8 after line {line_number}')
+    return IngestionError(f'malformed CSV after line {line_number}: {error}')
+
+
+def iter_csv_records(stream):
+    """Yield (line_number, record) pairs from a CSV stream with a header row"""
+    reader = csv.DictReader(_text_stream(stream))
+    try:
+        fieldnames = reader.fieldnames
+        if not fieldnames or not {'farm_id', 'date'} <= set(fieldnames):
+            raise IngestionError('CSV header must include farm_id and date')
+        for record in reader:
+            yield reader.line_num, record
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise _unreadable(e, reader.line_num) from e
+
+
+def iter_ndjson_records(stream):
+    """Yield (line_number, record) pairs from a newline-delimited JSON stream"""
+    line_number = 0
+    try:
+        for line_number, line in enumerate(_text_stream(stream), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                # Passed through so the validator reports it against its line
+                record = {'_invalid': line[:80]}
+            yield line_number, record
+    except UnicodeDecodeError as e:
+        raise _unreadable(e, line_number) from e
+
+
+def _parse_float(record, field, required):
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise RecordError(f'{field} is required')
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RecordError(f'{field} is not a number: {value!r}')
+    if not math.isfinite(number):
+        raise RecordError(f'{field} must be finite')
+    return number
+
+
+def _parse_text(record, field, max_length=None):
+    value = record.get(field)
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str):
+        raise RecordError(f'{field} is not a string: {value!r}')
+    if max_length is not None and len(value) > max_length:
+        raise RecordError(f'{field} is longer than {max_length} characters')
+    return value
+
+
+def validate_record(record):
+    """Normalize one raw record into FarmPerformance column values"""
+    if '_invalid' in record:
+        raise RecordError(f'not a JSON object: {record["_invalid"]!r}')
+
+    try:
+        farm_id = int(record.get('farm_id'))
+    except (TypeError, ValueError):
+        raise RecordError(f'farm_id is not an integer: {record.get("farm_id")!r}')
+
+    raw_date = record.get('date')
+    try:
+        day = raw_date if isinstance(raw_date, date) else datetime.strptime(str(raw_date).strip()[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise RecordError(f'date is not YYYY-MM-DD: {raw_date!r}')
+
+    values = {
+        'farm_id': farm_id,
+        'date': day,
+        'yield_amount': _parse_float(record, 'yield_amount', required=True),
+        'revenue': _parse_float(record, 'revenue', required=True),
+        'expenses': _parse_float(record, 'expenses', required=True),
+        'profit': _parse_float(record, 'profit', required=False),
+        'weather_conditions': _parse_text(record, 'weather_conditions', MAX_WEATHER_LENGTH),
+        'notes': _parse_text(record, 'notes')
+    }
+    if values['profit'] is None:
+        values['profit'] = values['revenue'] - values['expenses']
+    return values
+
+
+def _existing_days(connection, keys):
+    """The (farm_id, date) keys that already have a row, looked up in chunks"""
+    keys = sorted(keys)
+    existing = set()
+    for i in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[i:i + CHUNK_SIZE]
+        existing.update(
+            connection.execute(
+                sa.select(performance_table.c.farm_id, performance_table.c.date)
+                .where(performance_table.c.farm_id.in_({farm_id for farm_id, _ in chunk}),
+                       performance_table.c.date.in_({day for _, day in chunk}))
+            ).tuples()
+        )
+    return existing & set(keys)
+
+
+def _upsert_statement(connection):
+    insert = UPSERT_INSERTS.get(connection.dialect.name)
+    if insert is None:
+        raise IngestionError(f'upserts are not supported on {connection.dialect.name}')
+    statement = insert(performance_table)
+    updates = {name: statement.excluded[name] for name in INGESTED_COLUMNS if name not in UPSERT_KEYS}
+    for name in KEPT_WHEN_MISSING:
+        updates[name] = sa.func.coalesce(statement.excluded[name], performance_table.c[name])
+    return statement.on_conflict_do_update(index_elements=UPSERT_KEYS, set_=updates)
+
+
+def _write_batch(connection, rows):
+    """Upsert a batch of validated rows; returns (inserted, updated)
+
+    The counts come from a lookup before the write, so rows another upload
+    inserts in between are counted as inserted; the data itself is never
+    duplicated.
+    """
+    # The last row wins for a (farm_id, date) the batch repeats
+    rows = list({(row['farm_id'], row['date']): row for row in rows}.values())
+    updated = len(_existing_days(connection, [(row['farm_id'], row['date']) for row in rows]))
+    connection.execute(_upsert_statement(connection), rows)
+
+    # Downstream rollups, packed histories and cache versions, once for the whole batch
+    touched = {(row['farm_id'], row['date'].year, row['date'].month) for row in rows}
+    rollups.refresh(connection, touched)
+    segments.refresh(connection, touched)
+    return len(rows) - updated, updated
+
+
+def ingest(records, batch_size=DEFAULT_BATCH_SIZE, owner_id=None, report=None):
+    """Validate and upsert (line_number, record) pairs in batches
+
+    With owner_id set, rows for farms owned by anyone else are rejected.
+    """
+    report = report or IngestionReport()
+    engine = db.engine
+    started = time.perf_counter()
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        report.rows_read += len(chunk)
+
+        # Validate, keeping the last occurrence of each (farm_id, date) in the batch
+        valid = {}
+        for line, record in chunk:
+            try:
+                row = validate_record(record)
+            except RecordError as e:
+                report.reject(line, str(e))
+                continue
+            valid[(row['farm_id'], row['date'])] = (line, row)
+
+        with engine.begin() as connection:
+            farm_query = sa.select(Farm.id).where(Farm.id.in_({key[0] for key in valid}))
+            if owner_id is not None:
+                farm_query = farm_query.where(Farm.owner_id == owner_id)
+            known_farms = set(connection.execute(farm_query).scalars())
+
+            rows = []
+            for (farm_id, _), (line, row) in valid.items():
+                if farm_id in known_farms:
+                    rows.append(row)
+                else:
+                    report.reject(line, f'unknown or unauthorized farm_id {farm_id}')
+
+            if rows:
+                inserted, updated = _write_batch(connection, rows)
+                report.inserted += inserted
+                report.updated += updated
+        report.batches += 1
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def ingest_stream(stream, fmt='csv', batch_size=DEFAULT_BATCH_SIZE, owner_id=None):
+    """Ingest a binary or text stream of the given format"""
+    if fmt not in FORMATS:
+        raise IngestionError(f'unsupported format {fmt!r}; expected one of {", ".join(FORMATS)}')
+    records = iter_csv_records(stream) if fmt == 'csv' else iter_ndjson_records(stream)
+    return ingest(records, batch_size=batch_size, owner_id=owner_id)
+
+
+@click.command('ingest-performance')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Feed format (default: from the file extension)')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def ingest_performance_command(path, fmt, batch_size):
+    """Bulk upsert FarmPerformance rows from a CSV or NDJSON file."""
+    run_file(path, fmt, batch_size)
+
+
+def run_file(path, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    fmt = fmt or detect_format(path)
+    with open(path, 'rb') as stream:
+        report = ingest_stream(stream, fmt, batch_size)
+    print(f"Read {report.rows_read} rows in {report.batches} batch(es): "
+          f"{report.inserted} inserted, {report.updated} updated, {report.rejected} rejected")
+    print(f"{report.seconds:.2f}s, {report.rows_per_second:.0f} rows/sec")
+    for error in report.errors:
+        print(f"  {error}")
+    return report
+
+
+def init_app(app):
+    app.cli.add_command(ingest_performance_command)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk upsert FarmPerformance rows from a CSV or NDJSON file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, default=None)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app import create_app
+    with create_app().app_context():
+        run_file(args.path, args.format, args.batch_size)
@@ -1,5 +1,10 @@
-from app import app  # noqa: F401
-import routes  # noqa: F401
+from app import create_app
+import migrations
+
+# The application gunicorn serves (gunicorn main:app) and flask --app main uses
+app = create_app()
 
 if __name__ == "__main__":
+    with app.app_context():
+        migrations.upgrade()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,236 @@
+"""
+Per-request SQL and latency instrumentation for the Smart Agri Investment platform
+SQLAlchemy engine events count queries and time spent in the database, Flask
+request hooks record per-endpoint latency, Flask's template signals time every
+render_template() per template (cached fragment hits and misses are counted by
+fragments.py), and everything is rendered in the Prometheus text exposition
+format for the /metrics route
+
+Metrics are kept per process; under gunicorn each worker reports its own
+counters, so scrape every worker (or aggregate across them) for totals.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import request, before_render_template, template_rendered
+from sqlalchemy import event
+
+
+# Request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Queries-per-request buckets, useful for spotting N+1 query patterns
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Template render time buckets in seconds
+RENDER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# [query_count, db_seconds] for the request currently being served
+_request_stats = ContextVar('request_stats', default=None)
+
+# Start times of the templates being rendered, innermost last
+_render_starts = ContextVar('render_starts', default=())
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Thread-safe store of per-endpoint request and database metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.query_counts = {}
+        self.requests = {}
+        self.db_queries = {}
+        self.db_seconds = {}
+        self.render_times = {}
+        self.fragments = {}
+
+    def record(self, endpoint, method, status, duration, queries, db_seconds):
+        key = (endpoint, method)
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.query_counts[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.db_queries[key] = 0
+                self.db_seconds[key] = 0.0
+            self.latency[key].observe(duration)
+            self.query_counts[key].observe(queries)
+            self.db_queries[key] += queries
+            self.db_seconds[key] += db_seconds
+            status_key = (endpoint, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+    def record_render(self, template, duration):
+        key = (template,)
+        with self._lock:
+            if key not in self.render_times:
+                self.render_times[key] = Histogram(RENDER_BUCKETS)
+            self.render_times[key].observe(duration)
+
+    def record_fragment(self, name, hit):
+        key = (str(name), 'hit' if hit else 'miss')
+        with self._lock:
+            self.fragments[key] = self.fragments.get(key, 0) + 1
+
+    def render(self):
+        """Render all metrics in Prometheus text format"""
+        lines = []
+        with self._lock:
+            lines += _render_counter(
+                'agri_http_requests_total', 'Total HTTP requests.',
+                self.requests, ('endpoint', 'method', 'status'))
+            lines += _render_histogram(
+                'agri_http_request_duration_seconds', 'HTTP request latency in seconds.',
+                self.latency)
+            lines += _render_histogram(
+                'agri_db_queries_per_request', 'SQL queries issued per request.',
+                self.query_counts)
+            lines += _render_counter(
+                'agri_db_queries_total', 'Total SQL queries issued.',
+                self.db_queries, ('endpoint', 'method'))
+            lines += _render_counter(
+                'agri_db_query_duration_seconds_total', 'Total time spent executing SQL queries.',
+                self.db_seconds, ('endpoint', 'method'))
+            lines += _render_histogram(
+                'agri_template_render_seconds', 'render_template() time in seconds per template.',
+                self.render_times, ('template',))
+            lines += _render_counter(
+                'agri_template_fragments_total', 'Cached template fragment lookups.',
+                self.fragments, ('fragment', 'result'))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def _labels(names, values):
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return ','.join(pairs)
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _render_counter(name, help_text, values, label_names):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+    for key, value in sorted(values.items()):
+        lines.append(f'{name}{{{_labels(label_names, key)}}} {value}')
+    return lines
+
+
+def _render_histogram(name, help_text, histograms, label_names=('endpoint', 'method')):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for key, histogram in sorted(histograms.items()):
+        labels = _labels(label_names, key)
+        for bound, total in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels},le="{_format_bound(bound)}"}} {total}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats.get() is not None:
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    starts = conn.info.get('query_start_time')
+    if starts:
+        stats[1] += time.perf_counter() - starts.pop()
+    stats[0] += 1
+
+
+def _start_request():
+    request.environ['agri.metrics.start'] = time.perf_counter()
+    request.environ['agri.metrics.token'] = _request_stats.set([0, 0.0])
+    # Drops starts left behind by a template that raised in an earlier request on this thread
+    _render_starts.set(())
+
+
+def _finish_request(status, response=None):
+    environ = request.environ
+    started = environ.pop('agri.metrics.start', None)
+    if started is None:
+        return
+    token = environ.pop('agri.metrics.token')
+    endpoint, method = request.endpoint or 'unmatched', request.method
+    if response is not None and response.is_streamed:
+        # A streamed body runs its queries after the view returns; record once it has been sent
+        response.call_on_close(lambda: _record_request(endpoint, method, status, started, token))
+        return
+    _record_request(endpoint, method, status, started, token)
+
+
+def _record_request(endpoint, method, status, started, token):
+    duration = time.perf_counter() - started
+    stats = _request_stats.get() or [0, 0.0]
+    _request_stats.reset(token)
+    registry.record(endpoint, method, status, duration, stats[0], stats[1])
+
+
+def _before_render_template(sender, template, context, **extra):
+    _render_starts.set(_render_starts.get() + (time.perf_counter(),))
+
+
+def _template_rendered(sender, template, context, **extra):
+    starts = _render_starts.get()
+    if starts:
+        _render_starts.set(starts[:-1])
+        registry.record_render(template.name or 'string', time.perf_counter() - starts[-1])
+
+
+def init_app(app, engine):
+    """Attach the engine listeners, template signals and request hooks to the app"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+
+    @app.before_request
+    def start_request_metrics():
+        _start_request()
+
+    @app.after_request
+    def record_request_metrics(response):
+        _finish_request(response.status_code, response)
+        return response
+
+    @app.teardown_request
+    def record_failed_request_metrics(exc):
+        # Only reached with the start marker still set if after_request never ran
+        if exc is not None:
+            _finish_request(500)
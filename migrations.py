@@ -0,0 +1,226 @@
+"""
+Schema migrations for the Smart Agri Investment platform
+Each migration runs once, in order, inside a transaction, and is recorded in the
+schema_migrations table. Databases created by the old import-time db.create_all()
+are adopted in place: the initial migration only creates tables that are missing.
+
+Usage:
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending migrations
+    flask --app main db-upgrade     # same as the first, via the Flask CLI
+"""
+
+import os
+import sys
+import logging
+from datetime import datetime
+
+import click
+import sqlalchemy as sa
+from flask.cli import with_appcontext
+
+# Add the current directory to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from models import User, Farm, InvestmentOpportunity, Investment, FarmPerformance, FarmPerformanceRollup, FundingEvent, \
+    FarmSeriesSegment
+import rollups
+import segments
+
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = sa.Table(
+    'schema_migrations', sa.MetaData(),
+    sa.Column('version', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(128), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False)
+)
+
+
+def _create_tables(connection, *models):
+    for model in models:
+        model.__table__.create(connection, checkfirst=True)
+
+
+def _create_indexes(connection, *models, unique=False):
+    # IF NOT EXISTS rather than checkfirst: reflection skips expression indexes
+    for model in models:
+        existing = {column['name'] for column in sa.inspect(connection).get_columns(model.__table__.name)}
+        for index in model.__table__.indexes:
+            # Indexes over columns that a later migration adds are created by that migration
+            if not {column.name for column in index.columns} <= existing:
+                continue
+            # Unique indexes may need the table deduplicated first, which the migration adding them does
+            if index.unique and not unique:
+                continue
+            connection.execute(sa.schema.CreateIndex(index, if_not_exists=True))
+
+
+def _add_columns(connection, model, *names):
+    """ALTER TABLE ... ADD COLUMN for model columns the table does not have yet"""
+    table = model.__table__
+    existing = {column['name'] for column in sa.inspect(connection).get_columns(table.name)}
+    preparer = connection.dialect.identifier_preparer
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+              f"{column.type.compile(dialect=connection.dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        connection.execute(sa.text(ddl))
+
+
+def initial_schema(connection):
+    """Tables originally created by db.create_all()"""
+    _create_tables(connection, User, Farm, InvestmentOpportunity, Investment, FarmPerformance)
+
+
+def hot_query_indexes(connection):
+    """Composite indexes for the hot query shapes"""
+    _create_indexes(connection, InvestmentOpportunity, Investment, FarmPerformance)
+
+
+def performance_rollups(connection):
+    """Per-farm performance rollup table, backfilled from existing rows"""
+    _create_tables(connection, FarmPerformanceRollup)
+    # Farm data versions do not exist yet at this point (see migration 4)
+    rollups.rebuild(connection, bump_versions=False)
+
+
+def farm_data_versions(connection):
+    """Per-farm data version used as the HTTP cache key"""
+    _add_columns(connection, Farm, 'data_version', 'data_updated_at')
+    connection.execute(
+        Farm.__table__.update().values(data_updated_at=sa.func.coalesce(
+            Farm.__table__.c.data_updated_at, Farm.__table__.c.created_at))
+    )
+
+
+def listing_sort_indexes(connection):
+    """Indexes backing the keyset-paginated farm and opportunity listings"""
+    _create_indexes(connection, Farm, InvestmentOpportunity)
+
+
+def funding_ledger(connection):
+    """Append-only funding ledger; existing totals become its compacted state"""
+    _create_tables(connection, FundingEvent)
+
+
+def farm_series_segments(connection):
+    """Packed per-year history segments, backfilled from existing rows"""
+    _create_tables(connection, FarmSeriesSegment)
+    segments.rebuild(connection)
+
+
+def opportunity_updated_at(connection):
+    """Write stamp of opportunities, followed by the in-memory listing index"""
+    _add_columns(connection, InvestmentOpportunity, 'updated_at')
+    table = InvestmentOpportunity.__table__
+    connection.execute(
+        table.update().values(updated_at=sa.func.coalesce(table.c.updated_at, table.c.created_at))
+    )
+    _create_indexes(connection, InvestmentOpportunity)
+
+
+def unique_performance_days(connection):
+    """One FarmPerformance row per farm and day, the newest of any duplicates"""
+    table = FarmPerformance.__table__
+    keep = sa.select(sa.func.max(table.c.id)).group_by(table.c.farm_id, table.c.date)
+    duplicates = connection.execute(
+        sa.select(table.c.farm_id, table.c.date).where(table.c.id.not_in(keep))
+    ).all()
+    if duplicates:
+        connection.execute(table.delete().where(table.c.id.not_in(keep)))
+        touched = {(farm_id, day.year, day.month) for farm_id, day in duplicates}
+        rollups.refresh(connection, touched)
+        segments.refresh(connection, touched)
+    # Superseded by the unique index
+    connection.execute(sa.text('DROP INDEX IF EXISTS ix_farm_performance_farm_id_date'))
+    _create_indexes(connection, FarmPerformance, unique=True)
+
+
+def farm_updated_at(connection):
+    """Catalogue edit stamp of farms, which cached fragments key on"""
+    _add_columns(connection, Farm, 'updated_at')
+    table = Farm.__table__
+    connection.execute(
+        table.update().values(updated_at=sa.func.coalesce(table.c.updated_at, table.c.created_at))
+    )
+    _create_indexes(connection, Farm)
+
+
+# (version, name, function) in the order they must be applied
+MIGRATIONS = [
+    (1, 'initial schema', initial_schema),
+    (2, 'hot query indexes', hot_query_indexes),
+    (3, 'performance rollups', performance_rollups),
+    (4, 'farm data versions', farm_data_versions),
+    (5, 'listing sort indexes', listing_sort_indexes),
+    (6, 'funding ledger', funding_ledger),
+    (7, 'farm series segments', farm_series_segments),
+    (8, 'opportunity updated at', opportunity_updated_at),
+    (9, 'unique performance days', unique_performance_days),
+    (10, 'farm updated at', farm_updated_at),
+]
+
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return {row.version for row in connection.execute(sa.select(schema_migrations.c.version))}
+
+
+def upgrade(engine=None):
+    """Apply every pending migration; returns the names of those applied"""
+    engine = engine or db.engine
+    applied = []
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+        for version, name, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            migrate(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()))
+            applied.append(name)
+    return applied
+
+
+def status(engine=None):
+    """List (version, name, applied) for every known migration"""
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+def report_upgrade():
+    applied = upgrade()
+    print(f"Applied {len(applied)} migration(s)" + (f": {', '.join(applied)}" if applied else ""))
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    report_upgrade()
+
+
+def init_app(app):
+    app.cli.add_command(db_upgrade_command)
+
+
+if __name__ == "__main__":
+    from app import create_app
+    with create_app().app_context():
+        if "--status" in sys.argv:
+            for version, name, done in status():
+                print(f"{version:4d}  {'applied' if done else 'pending':8s} {name}")
+        else:
+            report_upgrade()
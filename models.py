@@ -1,7 +1,16 @@
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, needs_rehash
+
+
+def zero_if_null(column):
+    """Sort key that orders missing numbers as zero
+
+    Indexes and queries must build it the same way (with a literal, not a bound
+    parameter) for the database to match the indexed expression.
+    """
+    return db.func.coalesce(column, db.literal_column('0'))
 
 
 class User(UserMixin, db.Model):
@@ -13,16 +22,19 @@ class User(UserMixin, db.Model):
     last_name = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_investor = db.Column(db.Boolean, default=True)  # True for investors, False for farm managers
-    total_investment = db.Column(db.Float, default=0.0)
+    total_investment = db.Column(db.Float, default=0.0)  # Compacted from the funding ledger
     
     # Relationships
     investments = db.relationship('Investment', backref='investor', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -40,13 +52,29 @@ class Farm(db.Model):
     
     # Financial metrics
     total_funding_needed = db.Column(db.Float, default=0.0)
-    current_funding = db.Column(db.Float, default=0.0)
+    current_funding = db.Column(db.Float, default=0.0)  # Compacted from the funding ledger
     expected_roi = db.Column(db.Float)  # Percentage
     risk_level = db.Column(db.String(20))  # "Low", "Medium", "High"
     
     # Farm performance
     yield_history = db.Column(db.Text)  # Stored as JSON string
     
+    # Bumped whenever the farm's performance data changes; HTTP caches key on it
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    data_updated_at = db.Column(db.DateTime)
+    
+    # Stamped when the farm is added or its catalogue fields are edited; cached fragments key on it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Keyset pagination of the farm listing, one per sort order (see pagination.py)
+        db.Index('ix_farm_created_at_id', 'created_at', 'id'),
+        db.Index('ix_farm_expected_roi_sort', zero_if_null(expected_roi), 'id'),
+        db.Index('ix_farm_current_funding_sort', zero_if_null(current_funding), 'id'),
+        # Latest catalogue edit (see fragments.catalog_version())
+        db.Index('ix_farm_updated_at', 'updated_at'),
+    )
+    
     # Relationships
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     investment_opportunities = db.relationship('InvestmentOpportunity', backref='farm', lazy='dynamic')
@@ -55,7 +83,7 @@ class Farm(db.Model):
     def funding_percentage(self):
         if self.total_funding_needed == 0:
             return 0
-        return (self.current_funding / self.total_funding_needed) * 100
+        return (self.funded / self.total_funding_needed) * 100
     
     def __repr__(self):
         return f'<Farm {self.name}>'
@@ -67,7 +95,7 @@ class InvestmentOpportunity(db.Model):
     title = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text)
     amount_needed = db.Column(db.Float, nullable=False)
-    amount_raised = db.Column(db.Float, default=0.0)
+    amount_raised = db.Column(db.Float, default=0.0)  # Compacted from the funding ledger
     minimum_investment = db.Column(db.Float, default=0.0)
     expected_roi = db.Column(db.Float)  # Percentage
     duration_months = db.Column(db.Integer)  # Investment duration in months
@@ -76,6 +104,20 @@ class InvestmentOpportunity(db.Model):
     end_date = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default="Open")  # "Open", "Closed", "Completed"
+    # Stamped by every write, Core UPDATEs included; the in-memory listing index follows it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Open opportunities, newest first (index page)
+        db.Index('ix_investment_opportunity_status_created_at', 'status', 'created_at'),
+        # Open opportunities of one farm (farm detail)
+        db.Index('ix_investment_opportunity_farm_id_status', 'farm_id', 'status'),
+        # Keyset pagination of open opportunities by ROI and by amount raised
+        db.Index('ix_investment_opportunity_status_roi_sort', 'status', zero_if_null(expected_roi), 'id'),
+        db.Index('ix_investment_opportunity_status_raised_sort', 'status', zero_if_null(amount_raised), 'id'),
+        # Changes since the last sync of opportunity_index.py
+        db.Index('ix_investment_opportunity_updated_at', 'updated_at'),
+    )
     
     # Relationships
     investments = db.relationship('Investment', backref='opportunity', lazy='dynamic')
@@ -83,7 +125,7 @@ class InvestmentOpportunity(db.Model):
     def funding_percentage(self):
         if self.amount_needed == 0:
             return 0
-        return (self.amount_raised / self.amount_needed) * 100
+        return (self.raised / self.amount_needed) * 100
     
     def __repr__(self):
         return f'<InvestmentOpportunity {self.title}>'
@@ -97,14 +139,80 @@ class Investment(db.Model):
     date_invested = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default="Active")  # "Active", "Completed", "Cancelled"
     
+    __table_args__ = (
+        # A user's portfolio (dashboard, investment summary)
+        db.Index('ix_investment_user_id', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<Investment {self.id} of {self.amount}>'
 
 
-class FarmPerformance(db.Model):
+def pending_index(name, *columns):
+    """Partial index over the funding ledger events not compacted yet"""
+    pending = db.text('compacted_at IS NULL')
+    return db.Index(name, *columns, sqlite_where=pending, postgresql_where=pending)
+
+
+class FundingEvent(db.Model):
+    """Append-only ledger of the amounts invested, kept apart from the hot total rows
+
+    Investing only inserts an event; funding.compact_funding() periodically folds
+    pending events into Farm.current_funding, InvestmentOpportunity.amount_raised
+    and User.total_investment and stamps them compacted.
+    """
     id = db.Column(db.Integer, primary_key=True)
+    opportunity_id = db.Column(db.Integer, db.ForeignKey('investment_opportunity.id'), nullable=False)
     farm_id = db.Column(db.Integer, db.ForeignKey('farm.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    compacted_at = db.Column(db.DateTime)  # NULL while pending
+    
+    __table_args__ = (
+        # Pending events of one total; partial, so they stay small however long the ledger grows
+        pending_index('ix_funding_event_pending_opportunity', 'opportunity_id'),
+        pending_index('ix_funding_event_pending_farm', 'farm_id'),
+        pending_index('ix_funding_event_pending_user', 'user_id'),
+        # Compaction order
+        pending_index('ix_funding_event_pending', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<FundingEvent {self.id} of {self.amount}>'
+
+
+def pending_funding(key):
+    """Correlated sum of the pending ledger events matching `key`"""
+    return (
+        db.select(db.func.coalesce(db.func.sum(FundingEvent.amount), db.literal_column('0.0')))
+        .where(key, FundingEvent.compacted_at.is_(None))
+        .correlate_except(FundingEvent)
+        .scalar_subquery()
+    )
+
+
+# Exact totals: the compacted column plus the pending ledger delta, read in the same statement
+Farm.funded = db.column_property(
+    zero_if_null(Farm.current_funding) + pending_funding(FundingEvent.farm_id == Farm.id)
+)
+InvestmentOpportunity.raised = db.column_property(
+    zero_if_null(InvestmentOpportunity.amount_raised)
+    + pending_funding(FundingEvent.opportunity_id == InvestmentOpportunity.id)
+)
+User.invested = db.column_property(
+    zero_if_null(User.total_investment) + pending_funding(FundingEvent.user_id == User.id),
+    deferred=True  # Only the portfolio views need it, not every user load
+)
+
+
+class FarmPerformance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # The old values are loaded before a change, so the derived rollups and
+    # segments of the period a row moves out of are refreshed too
+    farm_id = db.column_property(db.Column(db.Integer, db.ForeignKey('farm.id'), nullable=False),
+                                 active_history=True)
+    date = db.column_property(db.Column(db.Date, nullable=False), active_history=True)
     yield_amount = db.Column(db.Float)  # e.g., tons of crops or livestock count
     revenue = db.Column(db.Float)
     expenses = db.Column(db.Float)
@@ -112,6 +220,12 @@ class FarmPerformance(db.Model):
     weather_conditions = db.Column(db.String(128))
     notes = db.Column(db.Text)
     
+    __table_args__ = (
+        # One row per farm and day: a farm's history in date order (charts, analytics
+        # APIs) and the conflict target of ingestion upserts
+        db.Index('ux_farm_performance_farm_id_date', 'farm_id', 'date', unique=True),
+    )
+    
     def profit_margin(self):
         if self.revenue == 0:
             return 0
@@ -119,3 +233,95 @@ class FarmPerformance(db.Model):
     
     def __repr__(self):
         return f'<FarmPerformance {self.date}>'
+
+
+class FarmPerformanceRollup(db.Model):
+    """Per-farm aggregates of FarmPerformance rows, kept up to date by rollups.py
+
+    One row per farm and period: "YYYY-MM" (month), "YYYY" (year) or "all".
+    Each metric keeps its sum, sum of squared deviations from the mean (m2),
+    min and max, so means and variances merge exactly across periods.
+    """
+    METRICS = ('yield', 'revenue', 'expenses', 'profit')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    farm_id = db.Column(db.Integer, db.ForeignKey('farm.id'), nullable=False)
+    granularity = db.Column(db.String(5), nullable=False)  # "month", "year", "all"
+    period = db.Column(db.String(7), nullable=False)  # "2024-05", "2024", "all"
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    first_date = db.Column(db.Date)
+    last_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    yield_sum = db.Column(db.Float, default=0.0)
+    yield_m2 = db.Column(db.Float, default=0.0)
+    yield_min = db.Column(db.Float)
+    yield_max = db.Column(db.Float)
+    revenue_sum = db.Column(db.Float, default=0.0)
+    revenue_m2 = db.Column(db.Float, default=0.0)
+    revenue_min = db.Column(db.Float)
+    revenue_max = db.Column(db.Float)
+    expenses_sum = db.Column(db.Float, default=0.0)
+    expenses_m2 = db.Column(db.Float, default=0.0)
+    expenses_min = db.Column(db.Float)
+    expenses_max = db.Column(db.Float)
+    profit_sum = db.Column(db.Float, default=0.0)
+    profit_m2 = db.Column(db.Float, default=0.0)
+    profit_min = db.Column(db.Float)
+    profit_max = db.Column(db.Float)
+    
+    # Figures of the latest performance row in the period
+    last_yield = db.Column(db.Float)
+    last_revenue = db.Column(db.Float)
+    last_expenses = db.Column(db.Float)
+    last_profit = db.Column(db.Float)
+    
+    __table_args__ = (
+        db.UniqueConstraint('farm_id', 'period', name='uq_farm_performance_rollup_farm_id_period'),
+    )
+    
+    def mean(self, metric):
+        if not self.row_count:
+            return 0
+        return getattr(self, f'{metric}_sum') / self.row_count
+    
+    def variance(self, metric):
+        """Sample variance of a metric over the period"""
+        if self.row_count < 2:
+            return 0
+        return getattr(self, f'{metric}_m2') / (self.row_count - 1)
+    
+    def profit_margin(self):
+        if not self.revenue_sum:
+            return 0
+        return (self.profit_sum / self.revenue_sum) * 100
+    
+    def __repr__(self):
+        return f'<FarmPerformanceRollup {self.farm_id} {self.period}>'
+
+
+class FarmSeriesSegment(db.Model):
+    """One calendar year of a farm's FarmPerformance rows packed into arrays, kept up to date by segments.py
+
+    Dates are little-endian int32 days since 1970-01-01 and the metrics
+    little-endian float64 (NaN where the row has no value), so a segment decodes
+    into NumPy arrays without copying or hydrating any rows.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    farm_id = db.Column(db.Integer, db.ForeignKey('farm.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    days = db.Column(db.LargeBinary, nullable=False)
+    yields = db.Column(db.LargeBinary, nullable=False)
+    revenues = db.Column(db.LargeBinary, nullable=False)
+    expenses = db.Column(db.LargeBinary, nullable=False)
+    profits = db.Column(db.LargeBinary, nullable=False)
+    weather_conditions = db.Column(db.Text, nullable=False)  # JSON list, aligned with the arrays
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('farm_id', 'year', name='uq_farm_series_segment_farm_id_year'),
+    )
+    
+    def __repr__(self):
+        return f'<FarmSeriesSegment {self.farm_id} {self.year}>'
@@ -0,0 +1,277 @@
+"""
+In-memory faceted index of the open investment opportunities
+Each process keeps the open opportunities in numbered slots. Every farm type,
+risk level and search token has a bitmap of its slots (a Python int, one bit per
+slot), and the ROI and minimum investment are kept in sorted lists for range
+filters. A search is a few bitmap ANDs, facet counts are popcounts, and a page
+walks the pre-sorted keys of its sort order from the cursor, so the database is
+only asked for the rows of the page itself.
+
+The index follows the table through InvestmentOpportunity.updated_at, which
+every write stamps (closing by fund_opportunity() and compaction included). At
+most every SYNC_INTERVAL seconds a request reads the rows changed since the last
+sync, one indexed range query that is usually empty, so opportunities created,
+funded or closed in any process show up here within the interval. Deleted rows
+leave no stamp, so each sync also counts the open rows and, when the count
+disagrees with the index, drops the ids that are no longer open.
+
+Searches, pages and facet counts of one listing are taken together by find(),
+under the lock that apply() takes, so slots cannot be reused in between.
+"""
+
+import re
+import time
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+from app import db
+from models import Farm, InvestmentOpportunity
+
+
+# Attributes with a bitmap per value, offered as facets
+FACETS = ('farm_type', 'risk_level')
+
+# Seconds between syncs with the table
+SYNC_INTERVAL = 1.0
+
+# Rows stamped up to this long before a sync are read again by the next one, so
+# a transaction that commits after its timestamp was taken is not missed
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# Range filter bitmaps kept between writes, least recently used dropped first
+RANGE_CACHE_SIZE = 64
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+INDEX_COLUMNS = (
+    InvestmentOpportunity.id,
+    InvestmentOpportunity.title,
+    InvestmentOpportunity.description,
+    InvestmentOpportunity.risk_level,
+    InvestmentOpportunity.expected_roi,
+    InvestmentOpportunity.minimum_investment,
+    InvestmentOpportunity.amount_raised,
+    InvestmentOpportunity.created_at,
+    InvestmentOpportunity.status,
+    Farm.farm_type
+)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a title, description or search string"""
+    return set(TOKEN_PATTERN.findall(text.lower())) if text else set()
+
+
+def _sort_key(values):
+    """Sort key values with NULLs first, so None is never compared with a value"""
+    return tuple((value is not None, value) for value in values)
+
+
+def _bitmap(slots):
+    bitmap = 0
+    for slot in slots:
+        bitmap |= 1 << slot
+    return bitmap
+
+
+class OpportunityIndex:
+    """Bitmaps, sorted ranges and sort orders over the open opportunities of this process"""
+
+    def __init__(self, sorts, sync_interval=SYNC_INTERVAL):
+        self.sorts = sorts
+        self.sync_interval = sync_interval
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._slots = {}  # opportunity id -> slot
+        self._entries = {}  # slot -> (facet values, tokens, range values, sort keys)
+        self._free = []
+        self._all = 0
+        self._facets = {name: defaultdict(int) for name in FACETS}
+        self._tokens = defaultdict(int)
+        self._ranges = {'expected_roi': [], 'minimum_investment': []}
+        self._orders = {name: [] for name in self.sorts}
+        self._range_cache = OrderedDict()
+        self._watermark = None
+        self._synced_at = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    # Maintenance
+
+    def sync(self, force=False):
+        """Apply the opportunities written since the last sync (all open ones the first time)"""
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            started = datetime.utcnow()
+            query = db.select(*INDEX_COLUMNS).join(Farm, InvestmentOpportunity.farm_id == Farm.id)
+            if self._watermark is None:
+                query = query.where(InvestmentOpportunity.status == "Open")
+            else:
+                query = query.where(InvestmentOpportunity.updated_at >= self._watermark - SYNC_OVERLAP)
+            for row in db.session.execute(query):
+                self.apply(row)
+            open_count = db.session.execute(
+                db.select(db.func.count(InvestmentOpportunity.id))
+                .where(InvestmentOpportunity.status == "Open")
+            ).scalar()
+            if open_count != len(self._slots):
+                self._drop_deleted()
+            self._watermark = started
+            self._synced_at = now
+
+    def _drop_deleted(self):
+        """Remove the indexed opportunities that are no longer open rows, deleted ones included"""
+        open_ids = set(db.session.execute(
+            db.select(InvestmentOpportunity.id).where(InvestmentOpportunity.status == "Open")).scalars())
+        for opportunity_id in set(self._slots) - open_ids:
+            self._remove(opportunity_id)
+        self._range_cache.clear()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def apply(self, row):
+        """Index an opportunity row while it is open, drop it once it is not"""
+        with self._lock:
+            self._remove(row.id)
+            if row.status == "Open":
+                self._add(row)
+            self._range_cache.clear()
+
+    def _add(self, row):
+        slot = self._free.pop() if self._free else len(self._entries)
+        bit = 1 << slot
+        facets = {name: getattr(row, name) for name in FACETS}
+        tokens = tokenize(row.title) | tokenize(row.description)
+        ranges = {name: getattr(row, name) for name in self._ranges}
+        keys = {name: _sort_key(sort.values(row)) + (slot,) for name, sort in self.sorts.items()}
+
+        self._slots[row.id] = slot
+        self._entries[slot] = (facets, tokens, ranges, keys)
+        self._all |= bit
+        for name, value in facets.items():
+            if value is not None:
+                self._facets[name][value] |= bit
+        for token in tokens:
+            self._tokens[token] |= bit
+        for name, value in ranges.items():
+            if value is not None:
+                insort(self._ranges[name], (value, slot))
+        for name, key in keys.items():
+            insort(self._orders[name], key)
+
+    def _remove(self, opportunity_id):
+        slot = self._slots.pop(opportunity_id, None)
+        if slot is None:
+            return
+        facets, tokens, ranges, keys = self._entries.pop(slot)
+        mask = ~(1 << slot)
+        self._all &= mask
+        for name, value in facets.items():
+            if value is not None:
+                self._discard(self._facets[name], value, mask)
+        for token in tokens:
+            self._discard(self._tokens, token, mask)
+        for name, value in ranges.items():
+            if value is not None:
+                values = self._ranges[name]
+                del values[bisect_left(values, (value, slot))]
+        for name, key in keys.items():
+            order = self._orders[name]
+            del order[bisect_left(order, key)]
+        self._free.append(slot)
+
+    @staticmethod
+    def _discard(bitmaps, value, mask):
+        bitmaps[value] &= mask
+        if not bitmaps[value]:
+            del bitmaps[value]
+
+    # Queries
+
+    def _range(self, name, low=None, high=None):
+        """Bitmap of the slots whose value lies within [low, high]"""
+        cache_key = (name, low, high)
+        bitmap = self._range_cache.get(cache_key)
+        if bitmap is not None:
+            self._range_cache.move_to_end(cache_key)
+            return bitmap
+        values = self._ranges[name]
+        start = bisect_left(values, (low,)) if low is not None else 0
+        end = bisect_left(values, (high, float('inf'))) if high is not None else len(values)
+        bitmap = self._range_cache[cache_key] = _bitmap(slot for _, slot in values[start:end])
+        if len(self._range_cache) > RANGE_CACHE_SIZE:
+            self._range_cache.popitem(last=False)
+        return bitmap
+
+    def _mask(self, filters, skip=None):
+        mask = self._all
+        for name in FACETS:
+            if name != skip and filters.get(name):
+                mask &= self._facets[name].get(filters[name], 0)
+        for token in tokenize(filters.get('q')):
+            mask &= self._tokens.get(token, 0)
+        if filters.get('min_roi'):
+            mask &= self._range('expected_roi', low=filters['min_roi'])
+        if filters.get('max_investment'):
+            mask &= self._range('minimum_investment', high=filters['max_investment'])
+        return mask
+
+    def search(self, filters):
+        """Bitmap of the open opportunities matching the filters"""
+        with self._lock:
+            return self._mask(filters)
+
+    def facet_counts(self, filters):
+        """Matches per value of each facet, under every filter except that facet's own"""
+        with self._lock:
+            counts = {}
+            for name in FACETS:
+                mask = self._mask(filters, skip=name)
+                counts[name] = {value: (mask & bitmap).bit_count()
+                                for value, bitmap in sorted(self._facets[name].items())}
+            return counts
+
+    def page(self, matches, sort, limit, after=None, before=None):
+        """Ids of the matching page in display order, and whether more lie beyond it
+
+        `after` and `before` are decoded cursor key values of the sort, as in
+        pagination.paginate(): the page holds the keys just below `after` (or the
+        first keys) going down, or the keys just above `before`.
+        """
+        with self._lock:
+            order = self._orders[sort.name]
+            if before is not None:
+                position = bisect_left(order, _sort_key(before) + (float('inf'),))
+                positions = range(position, len(order))
+            else:
+                position = bisect_left(order, _sort_key(after)) if after is not None else len(order)
+                positions = range(position - 1, -1, -1)
+
+            ids = []
+            for position in positions:
+                slot = order[position][-1]
+                if matches >> slot & 1:
+                    ids.append(order[position][-2][1])
+                    if len(ids) > limit:
+                        break
+        more = len(ids) > limit
+        ids = ids[:limit]
+        if before is not None:
+            ids.reverse()
+        return ids, more
+
+    def find(self, filters, sort, limit, after=None, before=None):
+        """(ids, more, total, facet counts) of a listing page, all from one state of the index"""
+        with self._lock:
+            matches = self.search(filters)
+            ids, more = self.page(matches, sort, limit, after, before)
+            return ids, more, matches.bit_count(), self.facet_counts(filters)
@@ -0,0 +1,272 @@
+"""
+Keyset (cursor) pagination for the farm and opportunity listings
+A page is selected by comparing the sort key with the key of the last row shown,
+(key, id) < (cursor key, cursor id), instead of skipping rows with OFFSET, so
+every page is one bounded index range scan however deep the reader goes. Each
+sort ends on the primary key to make the order total; cursors are opaque,
+URL-safe tokens that are only valid for the sort that produced them. Open
+opportunities are filtered and ordered by the in-memory opportunity_index.py
+instead, with the same cursors, and only the rows of the page are fetched.
+"""
+
+import json
+import base64
+from datetime import datetime
+from operator import attrgetter
+
+import sqlalchemy as sa
+from sqlalchemy.orm import contains_eager
+
+from models import Farm, InvestmentOpportunity, zero_if_null
+from opportunity_index import OpportunityIndex
+
+
+DEFAULT_PAGE_SIZE = 12
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised for a malformed cursor or one from a different sort order"""
+
+
+class Sort:
+    """A named descending order over (expression, value getter) keys, primary key last"""
+
+    def __init__(self, name, label, *keys):
+        self.name = name
+        self.label = label
+        self.keys = keys
+
+    @property
+    def expressions(self):
+        return [expression for expression, _ in self.keys]
+
+    def values(self, item):
+        return [getter(item) for _, getter in self.keys]
+
+
+def _zero_if_none(name):
+    return lambda item: getattr(item, name) or 0.0
+
+
+# "Most funded" orders by the indexed, compacted totals; pending ledger events
+# only show up in the order after the next compaction (see funding.py)
+FARM_SORTS = {sort.name: sort for sort in (
+    Sort('newest', 'Newest', (Farm.created_at, attrgetter('created_at')), (Farm.id, attrgetter('id'))),
+    Sort('roi', 'Highest ROI', (zero_if_null(Farm.expected_roi), _zero_if_none('expected_roi')),
+         (Farm.id, attrgetter('id'))),
+    Sort('funded', 'Most Funded', (zero_if_null(Farm.current_funding), _zero_if_none('current_funding')),
+         (Farm.id, attrgetter('id'))),
+)}
+
+OPPORTUNITY_SORTS = {sort.name: sort for sort in (
+    Sort('newest', 'Newest', (InvestmentOpportunity.created_at, attrgetter('created_at')),
+         (InvestmentOpportunity.id, attrgetter('id'))),
+    Sort('roi', 'Highest ROI', (zero_if_null(InvestmentOpportunity.expected_roi), _zero_if_none('expected_roi')),
+         (InvestmentOpportunity.id, attrgetter('id'))),
+    Sort('funded', 'Most Funded', (zero_if_null(InvestmentOpportunity.amount_raised), _zero_if_none('amount_raised')),
+         (InvestmentOpportunity.id, attrgetter('id'))),
+)}
+
+
+# Per-process index behind opportunity_page()
+opportunity_index = OpportunityIndex(OPPORTUNITY_SORTS)
+
+
+class Page:
+    """One page of results with the cursors of its neighbours (None at either end)
+
+    Index-backed pages also carry the number of matches and the facet counts.
+    """
+
+    def __init__(self, items, sort, limit, next_cursor=None, prev_cursor=None, total=None, facets=None):
+        self.items = items
+        self.sort = sort
+        self.limit = limit
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.facets = facets
+
+
+def encode_cursor(sort, item):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in sort.values(item)]
+    payload = json.dumps({'s': sort.name, 'k': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort, token):
+    """Sort key values of a cursor, typed like the sort expressions"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values = payload['k']
+        if payload['s'] != sort.name or len(values) != len(sort.keys):
+            raise InvalidCursor(token)
+        return [_typed(expression, value) for expression, value in zip(sort.expressions, values)]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(token)
+
+
+def _typed(expression, value):
+    if value is None:
+        return None
+    python_type = expression.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def page_size(value):
+    """Requested page size clamped to 1..MAX_PAGE_SIZE"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(value, MAX_PAGE_SIZE))
+
+
+def paginate(query, sort, limit=DEFAULT_PAGE_SIZE, after=None, before=None):
+    """Fetch the page of a query that follows the `after` cursor or precedes `before`"""
+    key = sa.tuple_(*sort.expressions)
+    backwards = before is not None
+    cursor = before if backwards else after
+    if cursor is not None:
+        values = [sa.literal(value, expression.type)
+                  for expression, value in zip(sort.expressions, decode_cursor(sort, cursor))]
+        bound = sa.tuple_(*values)
+        # The redundant bound on the leading key lets SQLite seek expression indexes;
+        # it does not use a row-value comparison on them as a range
+        leading = sort.expressions[0]
+        if backwards:
+            query = query.filter(leading >= values[0], key > bound)
+        else:
+            query = query.filter(leading <= values[0], key < bound)
+
+    # Walk the index backwards for the previous page, then restore display order
+    order = [expression.asc() if backwards else expression.desc() for expression in sort.expressions]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    items = rows[:limit]
+    more = len(rows) > limit
+    if backwards:
+        items.reverse()
+    return _page(items, sort, limit, cursor is not None, backwards, more)
+
+
+def _page(items, sort, limit, has_cursor, backwards, more, **extra):
+    """Page of items in display order; `more` tells whether rows lie beyond it in the walk direction"""
+    has_next = has_cursor if backwards else more
+    has_prev = more if backwards else has_cursor
+    return Page(
+        items, sort, limit,
+        next_cursor=encode_cursor(sort, items[-1]) if items and has_next else None,
+        prev_cursor=encode_cursor(sort, items[0]) if items and has_prev else None,
+        **extra
+    )
+
+
+def farm_page(args):
+    """Filtered, sorted page of the farm listing for request args"""
+    query = Farm.query
+    if args.get('farm_type'):
+        query = query.filter(Farm.farm_type == args['farm_type'])
+    if args.get('risk_level'):
+        query = query.filter(Farm.risk_level == args['risk_level'])
+    min_roi = args.get('min_roi', type=float)
+    if min_roi:
+        query = query.filter(Farm.expected_roi >= min_roi)
+    if args.get('location'):
+        query = query.filter(Farm.location.ilike(f"%{args['location']}%"))
+
+    sort = FARM_SORTS.get(args.get('sort'), FARM_SORTS['newest'])
+    return paginate(query, sort, page_size(args.get('limit', type=int)), args.get('after'), args.get('before'))
+
+
+def opportunity_filters(args):
+    """Opportunity listing filters of request args, as opportunity_index.py takes them"""
+    return {
+        'farm_type': args.get('farm_type'),
+        'risk_level': args.get('risk_level'),
+        'min_roi': args.get('min_roi', type=float),
+        'max_investment': args.get('max_investment', type=float),
+        'q': args.get('q')
+    }
+
+
+def opportunity_page(args):
+    """Filtered, sorted page of open investment opportunities for request args, with facet counts
+
+    Matching and ordering happen in the in-memory index; the database only
+    loads the page's rows, by primary key.
+    """
+    sort = OPPORTUNITY_SORTS.get(args.get('sort'), OPPORTUNITY_SORTS['newest'])
+    limit = page_size(args.get('limit', type=int))
+    after, before = args.get('after'), args.get('before')
+    backwards = before is not None
+    cursor = before if backwards else after
+    values = decode_cursor(sort, cursor) if cursor is not None else None
+
+    opportunity_index.sync()
+    filters = opportunity_filters(args)
+    ids, more, total, facets = opportunity_index.find(filters, sort, limit, None if backwards else values,
+                                                      values if backwards else None)
+
+    # The farm is shown with every opportunity, so load it with the same query
+    rows = (
+        InvestmentOpportunity.query
+        .join(Farm)
+        .options(contains_eager(InvestmentOpportunity.farm))
+        .filter(InvestmentOpportunity.id.in_(ids))
+        .all()
+    ) if ids else []
+    by_id = {opportunity.id: opportunity for opportunity in rows}
+    items = [by_id[opportunity_id] for opportunity_id in ids if opportunity_id in by_id]
+    return _page(items, sort, limit, cursor is not None, backwards, more,
+                 total=total, facets=facets)
+
+
+def listing_args(args):
+    """Request args to carry over to the previous/next page links"""
+    return {name: value for name, value in args.items() if name not in ('after', 'before') and value}
+
+
+def farm_to_dict(farm):
+    return {
+        'id': farm.id,
+        'name': farm.name,
+        'location': farm.location,
+        'farm_type': farm.farm_type,
+        'size_hectares': farm.size_hectares,
+        'expected_roi': farm.expected_roi,
+        'risk_level': farm.risk_level,
+        'total_funding_needed': farm.total_funding_needed,
+        'current_funding': farm.funded,
+        'funding_percentage': farm.funding_percentage(),
+        'created_at': farm.created_at.isoformat() if farm.created_at else None
+    }
+
+
+def opportunity_to_dict(opportunity):
+    return {
+        'id': opportunity.id,
+        'title': opportunity.title,
+        'farm_id': opportunity.farm_id,
+        'farm_name': opportunity.farm.name,
+        'farm_type': opportunity.farm.farm_type,
+        'location': opportunity.farm.location,
+        'amount_needed': opportunity.amount_needed,
+        'amount_raised': opportunity.raised,
+        'minimum_investment': opportunity.minimum_investment,
+        'expected_roi': opportunity.expected_roi,
+        'duration_months': opportunity.duration_months,
+        'risk_level': opportunity.risk_level,
+        'funding_percentage': opportunity.funding_percentage(),
+        'created_at': opportunity.created_at.isoformat() if opportunity.created_at else None
+    }
+
+
+def page_to_dict(page, serialize):
+    return {
+        'items': [serialize(item) for item in page.items],
+        'sort': page.sort.name,
+        'limit': page.limit,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }
@@ -0,0 +1,99 @@
+"""
+Password hashing off the request threads
+Key derivation is deliberately slow, so a burst of logins could occupy every
+request thread. Hashes are computed on a small per-process pool instead
+(hashlib releases the GIL while it derives keys), with a bounded number of
+requests allowed to wait for it: with gthread workers (gunicorn.conf.py) the
+other threads keep serving pages, and a login beyond the bound fails fast with
+HashingBusy rather than queueing without limit.
+
+The hash method is configurable; a login whose stored hash used other parameters
+rehashes the password with the current ones, so changing PASSWORD_HASH_METHOD
+migrates users as they log in.
+
+Environment variables:
+    PASSWORD_HASH_METHOD    werkzeug method, e.g. scrypt:32768:8:1 (default) or pbkdf2:sha256:1000000
+    PASSWORD_HASH_WORKERS   hashing threads per process, 0 to hash on the request thread (default 2)
+    PASSWORD_HASH_QUEUE     hashes allowed in flight or waiting per process (default 16)
+    PASSWORD_HASH_TIMEOUT   seconds a request waits for a free slot (default 5)
+"""
+
+import os
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+DEFAULT_HASH_WORKERS = 2
+DEFAULT_HASH_QUEUE = 16
+DEFAULT_HASH_TIMEOUT = 5
+
+
+class HashingBusy(Exception):
+    """Raised when too many passwords are already being hashed in this process"""
+
+
+_executor = None
+_slots = None
+_setup_lock = threading.Lock()
+
+
+def init_app(app, environ=os.environ):
+    """Hashing settings for the app, where its config does not set them already"""
+    app.config.setdefault("PASSWORD_HASH_METHOD", environ.get("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD))
+    app.config.setdefault("PASSWORD_HASH_WORKERS", int(environ.get("PASSWORD_HASH_WORKERS", DEFAULT_HASH_WORKERS)))
+    app.config.setdefault("PASSWORD_HASH_QUEUE", int(environ.get("PASSWORD_HASH_QUEUE", DEFAULT_HASH_QUEUE)))
+    app.config.setdefault("PASSWORD_HASH_TIMEOUT",
+                          float(environ.get("PASSWORD_HASH_TIMEOUT", DEFAULT_HASH_TIMEOUT)))
+
+
+def _pool(config):
+    # Created on first use, so each forked worker gets its own threads
+    global _executor, _slots
+    with _setup_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config["PASSWORD_HASH_WORKERS"],
+                                           thread_name_prefix="password-hash")
+            _slots = threading.BoundedSemaphore(config.get("PASSWORD_HASH_QUEUE", DEFAULT_HASH_QUEUE))
+        return _executor, _slots
+
+
+def _run(function, *args):
+    config = current_app.config
+    if not config.get("PASSWORD_HASH_WORKERS"):
+        return function(*args)
+    executor, slots = _pool(config)
+    if not slots.acquire(timeout=config.get("PASSWORD_HASH_TIMEOUT", DEFAULT_HASH_TIMEOUT)):
+        raise HashingBusy()
+    try:
+        return executor.submit(function, *args).result()
+    finally:
+        slots.release()
+
+
+def _method():
+    return current_app.config.get("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD)
+
+
+@lru_cache(maxsize=None)
+def _stored_method(method):
+    # The method as hashes record it, with werkzeug's defaults filled in ("scrypt" -> "scrypt:32768:8:1")
+    return generate_password_hash("", method).split("$", 1)[0]
+
+
+def hash_password(password):
+    """Hash with the configured method"""
+    return _run(generate_password_hash, password, _method())
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """Whether a stored hash was made with other parameters than the configured method"""
+    return pwhash.split("$", 1)[0] != _stored_method(_method())
@@ -0,0 +1,147 @@
+"""
+Portfolio valuation over time
+Lines a user's investments up with the monthly performance of their farms on a
+common month grid and values them all in one pass, as investments x months
+matrices summed over the investments. Expected value accrues each opportunity's
+expected ROI linearly over its term, as the invest page projects it. Realized
+value accrues the same monthly share scaled by how the farm did that month
+against its average month (read from the month rollups), up to the current month.
+Results are cached per user under a fingerprint of their holdings and of their
+farms' data versions, so they are only recomputed when either changes.
+"""
+
+import json
+from datetime import datetime
+
+import numpy as np
+
+from app import db
+from models import Investment, InvestmentOpportunity, Farm, FarmPerformanceRollup
+from http_cache import ResponseCache
+
+
+# Serialized payloads by user id
+portfolio_cache = ResponseCache(max_entries=4096)
+
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def _month_label(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def holdings_fingerprint(user_id):
+    """(count, last id, total amount, sum of farm data versions) of a user's investments"""
+    return tuple(db.session.execute(
+        db.select(
+            db.func.count(Investment.id),
+            db.func.max(Investment.id),
+            db.func.sum(Investment.amount),
+            db.func.sum(Farm.data_version)
+        )
+        .join(Investment.opportunity)
+        .join(InvestmentOpportunity.farm)
+        .where(Investment.user_id == user_id)
+    ).one())
+
+
+def _load_positions(user_id):
+    return db.session.execute(
+        db.select(
+            Investment.amount,
+            Investment.date_invested,
+            InvestmentOpportunity.duration_months,
+            InvestmentOpportunity.expected_roi,
+            InvestmentOpportunity.farm_id
+        )
+        .join(Investment.opportunity)
+        .where(Investment.user_id == user_id, Investment.date_invested.is_not(None))
+        .order_by(Investment.id)
+    ).all()
+
+
+def _performance_index(farm_ids, grid):
+    """farms x months matrix of each month's profit over the farm's average monthly profit
+
+    Months without data, and farms that have not been profitable on average, earn nothing.
+    """
+    rows = db.session.execute(
+        db.select(FarmPerformanceRollup.farm_id, FarmPerformanceRollup.period, FarmPerformanceRollup.profit_sum)
+        .where(FarmPerformanceRollup.farm_id.in_(farm_ids), FarmPerformanceRollup.granularity == 'month')
+    ).all()
+    index = np.zeros((len(farm_ids), len(grid)))
+    if not rows:
+        return index
+
+    farm_rows = {farm_id: i for i, farm_id in enumerate(farm_ids)}
+    farms = np.array([farm_rows[row[0]] for row in rows])
+    months = np.array([int(row[1][:4]) * 12 + int(row[1][5:7]) - 1 for row in rows])
+    profits = np.nan_to_num(np.array([row[2] for row in rows], dtype=float))
+
+    counts = np.bincount(farms, minlength=len(farm_ids))
+    averages = np.bincount(farms, weights=profits, minlength=len(farm_ids)) / np.maximum(counts, 1)
+    on_grid = (months >= grid[0]) & (months <= grid[-1])
+    relative = np.divide(profits, averages[farms], out=np.zeros_like(profits), where=averages[farms] > 0)
+    index[farms[on_grid], months[on_grid] - grid[0]] = relative[on_grid]
+    return index
+
+
+def _rounded(values):
+    # NaN marks months that have not happened yet
+    return [None if np.isnan(value) else round(value, 2) for value in values.tolist()]
+
+
+def portfolio_timeseries(user_id, today=None):
+    """Month-by-month invested amount, expected and realized value and ROI of a user's portfolio"""
+    positions = _load_positions(user_id)
+    current = _month_index(today or datetime.utcnow())
+    if not positions:
+        return {'months': [], 'current_month': _month_label(current), 'invested': [],
+                'expected_value': [], 'realized_value': [], 'expected_roi': [], 'realized_roi': []}
+
+    amounts = np.array([position.amount for position in positions], dtype=float)
+    starts = np.array([_month_index(position.date_invested) for position in positions])
+    durations = np.array([max(position.duration_months or 0, 1) for position in positions])
+    rois = np.nan_to_num(np.array([position.expected_roi for position in positions], dtype=float))
+    farm_ids = sorted({position.farm_id for position in positions})
+    farm_rows = np.searchsorted(farm_ids, [position.farm_id for position in positions])
+
+    # Common grid: the first investment's month through the later of today and the last maturity
+    grid = np.arange(starts.min(), max(current, int((starts + durations).max())) + 1)
+    offset = grid[None, :] - starts[:, None]
+    held = offset >= 0
+    accruing = (offset > 0) & (offset <= durations[:, None])
+    monthly_return = amounts * rois / 100 / durations
+
+    invested = (amounts[:, None] * held).sum(axis=0)
+    expected = invested + (monthly_return[:, None] * accruing).cumsum(axis=1).sum(axis=0)
+    performance = _performance_index(farm_ids, grid)[farm_rows]
+    realized = invested + np.cumsum((monthly_return[:, None] * performance * accruing).sum(axis=0))
+    realized[grid > current] = np.nan
+
+    def roi(values):
+        return np.divide(values - invested, invested, out=np.full(len(grid), np.nan), where=invested > 0) * 100
+
+    return {
+        'months': [_month_label(month) for month in grid.tolist()],
+        'current_month': _month_label(current),
+        'invested': _rounded(invested),
+        'expected_value': _rounded(expected),
+        'realized_value': _rounded(realized),
+        'expected_roi': _rounded(roi(expected)),
+        'realized_roi': _rounded(roi(realized))
+    }
+
+
+def cached_portfolio_timeseries(user_id):
+    """JSON body of portfolio_timeseries(), recomputed only when the user's holdings or farms change"""
+    today = datetime.utcnow()
+    version = holdings_fingerprint(user_id) + (_month_index(today),)
+    entry = portfolio_cache.get(('portfolio_timeseries', user_id), version)
+    if entry is not None:
+        return entry[2]
+    body = json.dumps(portfolio_timeseries(user_id, today))
+    portfolio_cache.put(('portfolio_timeseries', user_id), version, None, body, 'application/json')
+    return body
@@ -0,0 +1,103 @@
+"""
+Monte Carlo ROI projections for the invest page
+Simulates thousands of monthly paths of an opportunity's return over its term.
+Each simulated month replays a month drawn at random from the farm's history
+(its profit against the average month, which carries that month's weather, so
+paths follow the farm's weather mix), scaled by the farm's profit trend. A path
+accrues the opportunity's monthly share of its expected ROI times that factor.
+All paths are drawn and accumulated as one paths x months array, and reduced to
+percentile bands per month.
+
+Bands are cached per opportunity and farm data version. With PROJECTION_WORKERS
+set, the simulation runs in a process pool so large path counts do not hold a
+request thread's GIL.
+"""
+
+import json
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from flask import current_app
+
+from http_cache import ResponseCache
+
+
+# Percentiles reported per month, and their payload keys
+BANDS = ((5, 'p5'), (25, 'p25'), (50, 'median'), (75, 'p75'), (95, 'p95'))
+
+# Bounds on the monthly profit trend, so short noisy histories cannot compound without limit
+MAX_MONTHLY_TREND = 0.05
+
+# Serialized bands by opportunity id
+projection_cache = ResponseCache(max_entries=1024)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def profit_trend(profits):
+    """Average monthly profit growth: the least-squares slope over the mean profit, bounded"""
+    profits = profits[np.isfinite(profits)]
+    mean = profits.mean() if profits.size else 0
+    if profits.size < 2 or mean <= 0:
+        return 0.0
+    slope = np.polyfit(np.arange(profits.size), profits, 1)[0]
+    return float(np.clip(slope / mean, -MAX_MONTHLY_TREND, MAX_MONTHLY_TREND))
+
+
+def simulate(relative_profits, trend, monthly_roi, months, paths, seed):
+    """Percentiles of cumulative ROI per month over bootstrapped paths, one row per band"""
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, relative_profits.size, size=(paths, months))
+    growth = (1 + trend) ** np.arange(1, months + 1)
+    roi_paths = np.cumsum(relative_profits[draws] * (monthly_roi * growth), axis=1)
+    return np.percentile(roi_paths, [percentile for percentile, _ in BANDS], axis=0)
+
+
+def _pool(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+
+def roi_projections(opportunity, history, paths):
+    """Per-month linear expected ROI and Monte Carlo percentile bands, or [] without enough history"""
+    months = opportunity.duration_months or 0
+    profits = history.profits[np.isfinite(history.profits)]
+    mean = profits.mean() if profits.size else 0
+    if months < 1 or profits.size < 2 or mean <= 0:
+        return []
+
+    expected_roi = opportunity.expected_roi or 0
+    arguments = (profits / mean, profit_trend(history.profits), expected_roi / months, months, paths,
+                 opportunity.id)
+    workers = current_app.config.get('PROJECTION_WORKERS', 0)
+    if workers:
+        bands = _pool(workers).submit(simulate, *arguments).result()
+    else:
+        bands = simulate(*arguments)
+
+    rounded = {key: [round(value, 2) for value in band.tolist()] for (_, key), band in zip(BANDS, bands)}
+    return [
+        dict({key: values[month - 1] for key, values in rounded.items()},
+             month=month, projected_roi=expected_roi * (month / months))
+        for month in range(1, months + 1)
+    ]
+
+
+def cached_roi_projections(opportunity, farm, history):
+    """roi_projections() of an opportunity, simulated again only when its farm's data or terms change"""
+    paths = current_app.config.get('PROJECTION_PATHS', 5000)
+    version = (farm.data_version, opportunity.expected_roi, opportunity.duration_months, paths)
+    entry = projection_cache.get(('roi_projections', opportunity.id), version)
+    if entry is not None:
+        return json.loads(entry[2])
+    projections = roi_projections(opportunity, history, paths)
+    projection_cache.put(('roi_projections', opportunity.id), version, None, json.dumps(projections),
+                         'application/json')
+    return projections
@@ -0,0 +1,292 @@
+"""
+Incrementally maintained per-farm performance rollups
+Whenever FarmPerformance rows are inserted, updated or deleted through the ORM,
+the touched months are recomputed from their own rows and merged upward into the
+year and all-time rollups, so farm summaries never rescan a farm's history.
+Writers that bypass the ORM (bulk inserts) call refresh() once per batch.
+The same hook keeps the packed history segments of segments.py current.
+"""
+
+import math
+from collections import defaultdict
+from datetime import date, datetime
+from itertools import chain
+
+import sqlalchemy as sa
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import FarmPerformance, FarmPerformanceRollup
+from http_cache import bump_farm_data_versions
+import segments
+
+
+METRICS = FarmPerformanceRollup.METRICS
+
+ROW_COLUMNS = (
+    FarmPerformance.date,
+    FarmPerformance.yield_amount,
+    FarmPerformance.revenue,
+    FarmPerformance.expenses,
+    FarmPerformance.profit
+)
+
+# Keeps IN lists well below the bound-parameter limits of SQLite and PostgreSQL
+CHUNK_SIZE = 400
+
+rollup_table = FarmPerformanceRollup.__table__
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _month_period(year, month):
+    return f'{year:04d}-{month:02d}'
+
+
+def _next_month(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+def _stats_from_rows(farm_id, period, rows):
+    """Month rollup values from (date, yield, revenue, expenses, profit) rows in date order
+
+    Missing metric values count as zero. Months hold a handful of rows, so plain
+    Python beats numpy's per-call overhead here (it dominates bulk rebuilds).
+    """
+    stats = {
+        'farm_id': farm_id,
+        'granularity': 'month',
+        'period': period,
+        'row_count': len(rows),
+        'first_date': rows[0][0],
+        'last_date': rows[-1][0],
+    }
+    for i, metric in enumerate(METRICS, 1):
+        values = [_metric_value(row[i]) for row in rows]
+        total = math.fsum(values)
+        mean = total / len(values)
+        stats[f'{metric}_sum'] = total
+        stats[f'{metric}_m2'] = math.fsum((value - mean) ** 2 for value in values)
+        stats[f'{metric}_min'] = min(values)
+        stats[f'{metric}_max'] = max(values)
+        stats[f'last_{metric}'] = values[-1]
+    return stats
+
+
+def _metric_value(value):
+    value = float(value) if value is not None else 0.0
+    return value if math.isfinite(value) else 0.0
+
+
+def _merge(farm_id, granularity, period, parts):
+    """Combine rollups of consecutive periods (given in period order)
+
+    Means and m2 are merged with the parallel variance formula of Chan et al.,
+    so no raw rows are needed.
+    """
+    merged = dict(parts[0])
+    merged.update(farm_id=farm_id, granularity=granularity, period=period)
+    for part in parts[1:]:
+        n_a, n_b = merged['row_count'], part['row_count']
+        n = n_a + n_b
+        for metric in METRICS:
+            sum_a, sum_b = merged[f'{metric}_sum'], part[f'{metric}_sum']
+            delta = sum_b / n_b - sum_a / n_a
+            merged[f'{metric}_m2'] += part[f'{metric}_m2'] + delta * delta * n_a * n_b / n
+            merged[f'{metric}_sum'] = sum_a + sum_b
+            merged[f'{metric}_min'] = min(merged[f'{metric}_min'], part[f'{metric}_min'])
+            merged[f'{metric}_max'] = max(merged[f'{metric}_max'], part[f'{metric}_max'])
+            merged[f'last_{metric}'] = part[f'last_{metric}']
+        merged['row_count'] = n
+        merged['last_date'] = part['last_date']
+    return merged
+
+
+def _replace(connection, keys, rows):
+    """Delete the rollups for (farm_id, period) keys and insert their new values"""
+    for chunk in _chunks(keys):
+        connection.execute(
+            rollup_table.delete().where(
+                sa.tuple_(rollup_table.c.farm_id, rollup_table.c.period).in_(chunk)
+            )
+        )
+    if rows:
+        now = datetime.utcnow()
+        for row in rows:
+            row['updated_at'] = now
+        connection.execute(rollup_table.insert(), rows)
+
+
+def _select_rollups(connection, farm_ids, granularity, first_period=None, last_period=None):
+    columns = [column for column in rollup_table.c if column.name not in ('id', 'updated_at')]
+    query = (
+        sa.select(*columns)
+        .where(rollup_table.c.farm_id.in_(farm_ids), rollup_table.c.granularity == granularity)
+        .order_by(rollup_table.c.farm_id, rollup_table.c.period)
+    )
+    if first_period is not None:
+        query = query.where(rollup_table.c.period.between(first_period, last_period))
+    return [dict(row._mapping) for row in connection.execute(query)]
+
+
+def refresh(connection, touched, bump_versions=True):
+    """Recompute the rollups affected by changes to (farm_id, year, month) periods"""
+    touched = set(touched)
+    by_farm = defaultdict(set)
+    for farm_id, year, month in touched:
+        by_farm[farm_id].add((year, month))
+    for farm_ids in _chunks(sorted(by_farm)):
+        _refresh_farms(connection, {farm_id: by_farm[farm_id] for farm_id in farm_ids})
+        if bump_versions:
+            # Derived caches key on the farm's data version
+            bump_farm_data_versions(connection, farm_ids)
+
+
+def _refresh_farms(connection, months_by_farm):
+    farm_ids = list(months_by_farm)
+    all_months = set(chain.from_iterable(months_by_farm.values()))
+    start = date(*min(all_months), 1)
+    end = _next_month(date(*max(all_months), 1))
+
+    # Months: recompute from the raw rows of the touched months only
+    rows = connection.execute(
+        sa.select(FarmPerformance.farm_id, *ROW_COLUMNS)
+        .where(
+            FarmPerformance.farm_id.in_(farm_ids),
+            FarmPerformance.date >= start,
+            FarmPerformance.date < end
+        )
+        .order_by(FarmPerformance.farm_id, FarmPerformance.date)
+    ).all()
+    grouped = defaultdict(list)
+    for row in rows:
+        key = (row[1].year, row[1].month)
+        if key in months_by_farm[row[0]]:
+            grouped[(row[0], key)].append(row[1:])
+
+    month_keys = [(farm_id, _month_period(*month))
+                  for farm_id, months in months_by_farm.items() for month in months]
+    month_rows = [_stats_from_rows(farm_id, _month_period(*month), farm_rows)
+                  for (farm_id, month), farm_rows in grouped.items()]
+    _replace(connection, month_keys, month_rows)
+
+    # Years: merge the month rollups of each touched year
+    years = {year for year, _ in all_months}
+    months = _select_rollups(connection, farm_ids, 'month', f'{min(years):04d}-01', f'{max(years):04d}-12')
+    year_keys = {(farm_id, year) for farm_id, touched in months_by_farm.items() for year, _ in touched}
+    parts = defaultdict(list)
+    for rollup in months:
+        key = (rollup['farm_id'], int(rollup['period'][:4]))
+        if key in year_keys:
+            parts[key].append(rollup)
+    year_rows = [_merge(farm_id, 'year', f'{year:04d}', parts[(farm_id, year)])
+                 for farm_id, year in year_keys if parts[(farm_id, year)]]
+    _replace(connection, [(farm_id, f'{year:04d}') for farm_id, year in year_keys], year_rows)
+
+    # All time: merge every year rollup of the farm
+    parts = defaultdict(list)
+    for rollup in _select_rollups(connection, farm_ids, 'year'):
+        parts[rollup['farm_id']].append(rollup)
+    all_rows = [_merge(farm_id, 'all', 'all', parts[farm_id]) for farm_id in farm_ids if parts[farm_id]]
+    _replace(connection, [(farm_id, 'all') for farm_id in farm_ids], all_rows)
+
+
+def rebuild(connection, bump_versions=True):
+    """Recompute every rollup from scratch (backfill, or after bulk deletes)"""
+    connection.execute(rollup_table.delete())
+    farm_ids = connection.execute(sa.select(FarmPerformance.farm_id).distinct()).scalars().all()
+    for chunk in _chunks(farm_ids):
+        dates = connection.execute(
+            sa.select(FarmPerformance.farm_id, FarmPerformance.date)
+            .where(FarmPerformance.farm_id.in_(chunk))
+        )
+        refresh(connection, {(farm_id, day.year, day.month) for farm_id, day in dates}, bump_versions)
+
+
+def _touched_periods(obj):
+    """(farm_id, year, month) keys for both the old and new values of a row"""
+    state = inspect(obj)
+    values = {}
+    for name in ('farm_id', 'date'):
+        history = state.attrs[name].history
+        values[name] = {value for value in chain(history.added, history.unchanged, history.deleted)
+                        if value is not None}
+    return {(farm_id, day.year, day.month) for farm_id in values['farm_id'] for day in values['date']}
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_touched_rollups(session, flush_context):
+    touched = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, FarmPerformance):
+            touched.update(_touched_periods(obj))
+    if touched:
+        refresh(session.connection(), touched)
+        # The packed histories of the same farms and years
+        segments.refresh(session.connection(), touched)
+
+
+def _metric_figures(rollup, reducer):
+    return {metric: reducer(rollup, metric) for metric in METRICS}
+
+
+def farm_summary(farm_id):
+    """O(1) performance summary of a farm read from its rollups, or None without data"""
+    rollups = (
+        FarmPerformanceRollup.query
+        .filter(
+            FarmPerformanceRollup.farm_id == farm_id,
+            FarmPerformanceRollup.granularity.in_(('all', 'year'))
+        )
+        .order_by(FarmPerformanceRollup.period.desc())  # "all" sorts after the years
+        .limit(3)
+        .all()
+    )
+    if not rollups or rollups[0].period != 'all':
+        return None
+    overall, years = rollups[0], rollups[1:]
+
+    # Year-over-year growth of the average monthly profit
+    profit_growth = None
+    if len(years) == 2 and years[1].mean('profit') > 0:
+        profit_growth = (years[0].mean('profit') / years[1].mean('profit') - 1) * 100
+
+    return {
+        'periods': overall.row_count,
+        'first_date': overall.first_date.strftime('%Y-%m-%d'),
+        'last_date': overall.last_date.strftime('%Y-%m-%d'),
+        'totals': _metric_figures(overall, lambda r, m: getattr(r, f'{m}_sum')),
+        'averages': _metric_figures(overall, FarmPerformanceRollup.mean),
+        'std_devs': _metric_figures(overall, lambda r, m: math.sqrt(r.variance(m))),
+        'minimums': _metric_figures(overall, lambda r, m: getattr(r, f'{m}_min')),
+        'maximums': _metric_figures(overall, lambda r, m: getattr(r, f'{m}_max')),
+        'profit_margin': overall.profit_margin(),
+        'latest': dict(_metric_figures(overall, lambda r, m: getattr(r, f'last_{m}')),
+                       date=overall.last_date.strftime('%Y-%m-%d')),
+        'latest_year': years[0].period if years else None,
+        'yoy_profit_growth': profit_growth
+    }
+
+
+def farm_periods(farm_id, granularity):
+    """Per-period aggregates ("month" or "year") of a farm in period order"""
+    rollups = (
+        FarmPerformanceRollup.query
+        .filter_by(farm_id=farm_id, granularity=granularity)
+        .order_by(FarmPerformanceRollup.period)
+        .all()
+    )
+    return [
+        {
+            'period': rollup.period,
+            'count': rollup.row_count,
+            'totals': _metric_figures(rollup, lambda r, m: getattr(r, f'{m}_sum')),
+            'averages': _metric_figures(rollup, FarmPerformanceRollup.mean),
+            'profit_margin': rollup.profit_margin()
+        }
+        for rollup in rollups
+    ]
@@ -1,33 +1,57 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, Response, stream_with_context
 from flask_login import login_user, logout_user, current_user, login_required
-from datetime import datetime, date
+from datetime import datetime
 import json
 import math
-import numpy as np
-import pandas as pd
-from app import app, db
+from sqlalchemy.orm import joinedload
+from app import db
+import metrics
+from fragments import catalog_version, DeferredRows
 from models import User, Farm, InvestmentOpportunity, Investment, FarmPerformance
+from funding import fund_opportunity, FundingError
+from passwords import HashingBusy
+from rollups import farm_summary, farm_periods
+from http_cache import farm_cached
+from pagination import (farm_page, opportunity_page, listing_args, page_to_dict, farm_to_dict,
+                        opportunity_to_dict, InvalidCursor, FARM_SORTS, OPPORTUNITY_SORTS)
+from ingestion import ingest_stream, detect_format, IngestionError, DEFAULT_BATCH_SIZE
+# analytics pulls in numpy, so the views that need it import it when first called;
+# workers boot without it (gunicorn.conf.py warms it up when the app is preloaded)
 
+# The pages and the JSON API; create_app() registers it
+bp = Blueprint('main', __name__)
 
-@app.route('/')
+# Points per line in the charts embedded in pages; longer histories are downsampled
+CHART_POINTS = 120
+
+
+@bp.route('/')
 def index():
     """Home page route"""
-    # Get featured farms
-    featured_farms = Farm.query.order_by(Farm.created_at.desc()).limit(3).all()
-    
-    # Get open investment opportunities
-    opportunities = InvestmentOpportunity.query.filter_by(status="Open").order_by(InvestmentOpportunity.created_at.desc()).limit(4).all()
+    # Both sections are cached fragments (see fragments.py); their rows are only
+    # loaded when the catalogue changed since they were last rendered
+    featured_farms = DeferredRows(Farm.query.order_by(Farm.created_at.desc()).limit(3))
+    
+    # Open investment opportunities, with the farm each card names
+    opportunities = DeferredRows(
+        InvestmentOpportunity.query
+        .options(joinedload(InvestmentOpportunity.farm))
+        .filter_by(status="Open")
+        .order_by(InvestmentOpportunity.created_at.desc())
+        .limit(4)
+    )
     
     return render_template('index.html', 
                           featured_farms=featured_farms, 
-                          opportunities=opportunities)
+                          opportunities=opportunities,
+                          catalog_version=catalog_version())
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login route"""
     if current_user.is_authenticated:
-        return redirect(url_for('investor_dashboard'))
+        return redirect(url_for('main.investor_dashboard'))
     
     if request.method == 'POST':
         username = request.form.get('username')
@@ -35,15 +59,24 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user is None or not user.check_password(password):
-            flash('Invalid username or password', 'danger')
-            return redirect(url_for('login'))
+        try:
+            if user is None or not user.check_password(password):
+                flash('Invalid username or password', 'danger')
+                return redirect(url_for('main.login'))
+            
+            # Move the password to the current hash parameters while we have it
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+        except HashingBusy:
+            flash('We are handling a lot of sign-ins right now, please try again in a moment', 'warning')
+            return render_template('auth/login.html'), 503
         
         login_user(user, remember=True)
         next_page = request.args.get('next')
         
         if not next_page or not next_page.startswith('/'):
-            next_page = url_for('investor_dashboard')
+            next_page = url_for('main.investor_dashboard')
             
         flash('Login successful!', 'success')
         return redirect(next_page)
@@ -51,11 +84,11 @@ def login():
     return render_template('auth/login.html')
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """User registration route"""
     if current_user.is_authenticated:
-        return redirect(url_for('investor_dashboard'))
+        return redirect(url_for('main.investor_dashboard'))
     
     if request.method == 'POST':
         username = request.form.get('username')
@@ -68,53 +101,61 @@ def register():
         # Form validation
         if password != confirm_password:
             flash('Passwords do not match', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         if User.query.filter_by(username=username).first():
             flash('Username already exists', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
             
         if User.query.filter_by(email=email).first():
             flash('Email already registered', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         # Create new user
         user = User(username=username, email=email, first_name=first_name, last_name=last_name)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingBusy:
+            flash('We are handling a lot of sign-ups right now, please try again in a moment', 'warning')
+            return render_template('auth/register.html'), 503
         
         db.session.add(user)
         db.session.commit()
         
         flash('Registration successful! Please login.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('auth/register.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """User logout route"""
     logout_user()
     flash('You have been logged out', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def investor_dashboard():
     """Investor dashboard route"""
-    # Get user investments
-    investments = Investment.query.filter_by(user_id=current_user.id).all()
+    # Get user investments with their opportunity and farm in a single query
+    investments = db.session.execute(
+        db.select(Investment, InvestmentOpportunity, Farm)
+        .join(Investment.opportunity)
+        .join(InvestmentOpportunity.farm)
+        .where(Investment.user_id == current_user.id)
+        .order_by(Investment.id)
+    ).all()
     
     # Calculate total invested amount
-    total_invested = sum(investment.amount for investment in investments)
+    total_invested = sum(investment.amount for investment, _, _ in investments)
     
     # Get investment opportunities the user has invested in
     investment_opportunities = []
-    for investment in investments:
-        opportunity = investment.opportunity
-        farm = opportunity.farm
+    for investment, opportunity, farm in investments:
         investment_opportunities.append({
             'id': opportunity.id,
             'title': opportunity.title,
@@ -125,20 +166,20 @@ def investor_dashboard():
             'date_invested': investment.date_invested
         })
     
-    # Get performance data for chart
+    # Get performance data for chart, loading every farm's history in one query
+    from analytics import load_farm_histories, json_values
+    histories = load_farm_histories(farm.id for _, _, farm in investments)
     performance_data = []
-    for investment in investments:
-        opportunity = investment.opportunity
-        farm = opportunity.farm
-        farm_performances = FarmPerformance.query.filter_by(farm_id=farm.id).order_by(FarmPerformance.date).all()
+    for _, _, farm in investments:
+        history = histories[farm.id].downsampled(CHART_POINTS)
         
-        if farm_performances:
+        if len(history):
             performance_data.append({
                 'farm_name': farm.name,
-                'dates': [performance.date.strftime('%Y-%m-%d') for performance in farm_performances],
-                'profits': [performance.profit for performance in farm_performances],
-                'revenues': [performance.revenue for performance in farm_performances],
-                'expenses': [performance.expenses for performance in farm_performances]
+                'dates': history.date_labels(),
+                'profits': json_values(history.profits),
+                'revenues': json_values(history.revenues),
+                'expenses': json_values(history.expenses)
             })
     
     return render_template('dashboard/investor.html', 
@@ -146,7 +187,7 @@ def investor_dashboard():
                           total_invested=total_invested,
                           performance_data=json.dumps(performance_data))
 
-@app.route('/analytics')
+@bp.route('/analytics')
 @login_required
 def analytics_dashboard():
     """Analytics dashboard route with dynamic charts"""
@@ -171,20 +212,34 @@ def analytics_dashboard():
                           farm_opportunities=json.dumps(farm_opportunities))
 
 
-@app.route('/farms')
+@bp.route('/farms')
 def farms():
-    """List all farms"""
-    all_farms = Farm.query.all()
-    return render_template('farms.html', farms=all_farms)
-
-
-@app.route('/farm/<int:farm_id>')
+    """List farms, one keyset-paginated page at a time"""
+    try:
+        page = farm_page(request.args)
+    except InvalidCursor:
+        abort(400)
+    return render_template('farms.html',
+                          farms=page.items,
+                          page=page,
+                          sorts=FARM_SORTS.values(),
+                          page_args=listing_args(request.args))
+
+
+@bp.route('/farm/<int:farm_id>')
 def farm_detail(farm_id):
     """Farm detail page"""
     farm = Farm.query.get_or_404(farm_id)
     
     # Get farm performance data for charts
     performances = FarmPerformance.query.filter_by(farm_id=farm_id).order_by(FarmPerformance.date).all()
+    if len(performances) > CHART_POINTS:
+        from downsample import downsample_indices, take
+        performances = take(performances, downsample_indices([
+            [performance.profit for performance in performances],
+            [performance.revenue for performance in performances],
+            [performance.expenses for performance in performances]
+        ], CHART_POINTS))
     
     performance_data = {
         'dates': [performance.date.strftime('%Y-%m-%d') for performance in performances],
@@ -200,44 +255,29 @@ def farm_detail(farm_id):
     return render_template('dashboard/farm_detail.html', 
                           farm=farm,
                           performance_data=json.dumps(performance_data),
+                          performance_summary=farm_summary(farm_id),
                           opportunities=opportunities)
 
 
-@app.route('/opportunities')
+@bp.route('/opportunities')
 def investment_opportunities():
-    """List all investment opportunities"""
-    # Get filter parameters
-    farm_type = request.args.get('farm_type')
-    risk_level = request.args.get('risk_level')
-    min_roi = request.args.get('min_roi', type=float)
-    max_investment = request.args.get('max_investment', type=float)
-    
-    # Base query
-    query = InvestmentOpportunity.query.filter_by(status="Open").join(Farm)
-    
-    # Apply filters
-    if farm_type:
-        query = query.filter(Farm.farm_type == farm_type)
-    if risk_level:
-        query = query.filter(InvestmentOpportunity.risk_level == risk_level)
-    if min_roi:
-        query = query.filter(InvestmentOpportunity.expected_roi >= min_roi)
-    if max_investment:
-        query = query.filter(InvestmentOpportunity.minimum_investment <= max_investment)
-    
-    opportunities = query.all()
-    
-    # Get unique farm types and risk levels for filters
-    farm_types = db.session.query(Farm.farm_type).distinct().all()
-    risk_levels = db.session.query(InvestmentOpportunity.risk_level).distinct().all()
+    """List open investment opportunities, one keyset-paginated page at a time"""
+    try:
+        page = opportunity_page(request.args)
+    except InvalidCursor:
+        abort(400)
     
+    # Filter options and their match counts come from the listing index
     return render_template('investments/opportunities.html', 
-                          opportunities=opportunities,
-                          farm_types=[ft[0] for ft in farm_types],
-                          risk_levels=[rl[0] for rl in risk_levels])
+                          opportunities=page.items,
+                          page=page,
+                          sorts=OPPORTUNITY_SORTS.values(),
+                          page_args=listing_args(request.args),
+                          farm_types=page.facets['farm_type'],
+                          risk_levels=page.facets['risk_level'])
 
 
-@app.route('/invest/<int:opportunity_id>', methods=['GET', 'POST'])
+@bp.route('/invest/<int:opportunity_id>', methods=['GET', 'POST'])
 @login_required
 def invest(opportunity_id):
     """Investment page for a specific opportunity"""
@@ -246,93 +286,197 @@ def invest(opportunity_id):
     
     if opportunity.status != "Open":
         flash('This investment opportunity is no longer open', 'warning')
-        return redirect(url_for('investment_opportunities'))
+        return redirect(url_for('main.investment_opportunities'))
     
     if request.method == 'POST':
         try:
             amount = float(request.form.get('amount'))
+            if not math.isfinite(amount) or amount <= 0:
+                raise ValueError(amount)
             
             # Validate investment amount
             if amount < opportunity.minimum_investment:
                 flash(f'Minimum investment amount is ${opportunity.minimum_investment:.2f}', 'danger')
-                return redirect(url_for('invest', opportunity_id=opportunity_id))
+                return redirect(url_for('main.invest', opportunity_id=opportunity_id))
             
-            remaining = opportunity.amount_needed - opportunity.amount_raised
-            # Format the number to two decimal places
-            if amount > remaining:
-                flash(f'Maximum available investment is ${remaining:.2f}', 'danger')
-                return redirect(url_for('invest', opportunity_id=opportunity_id))
-            
-            # Create new investment
-            investment = Investment(
-                user_id=current_user.id,
-                opportunity_id=opportunity_id,
-                amount=amount
-            )
-            
-            # Update opportunity's raised amount
-            opportunity.amount_raised += amount
-            
-            # Update farm's current funding
-            farm.current_funding += amount
-            
-            # Update user's total investment
-            current_user.total_investment += amount
-            
-            # Check if opportunity is now fully funded
-            if opportunity.amount_raised >= opportunity.amount_needed:
-                opportunity.status = "Closed"
-            
-            db.session.add(investment)
-            db.session.commit()
+            # Reserve capacity atomically; concurrent requests cannot oversubscribe
+            try:
+                fund_opportunity(opportunity_id, current_user.id, amount)
+            except FundingError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('main.invest', opportunity_id=opportunity_id))
             
             flash('Investment successful!', 'success')
-            return redirect(url_for('investor_dashboard'))
+            return redirect(url_for('main.investor_dashboard'))
             
         except ValueError:
             flash('Please enter a valid amount', 'danger')
-            return redirect(url_for('invest', opportunity_id=opportunity_id))
+            return redirect(url_for('main.invest', opportunity_id=opportunity_id))
     
     # Calculate remaining investment amount
-    remaining = opportunity.amount_needed - opportunity.amount_raised
+    remaining = opportunity.amount_needed - opportunity.raised
     
     # Get farm performance data for risk assessment
-    performances = FarmPerformance.query.filter_by(farm_id=farm.id).order_by(FarmPerformance.date).all()
+    from analytics import load_farm_history, json_values
+    from projections import cached_roi_projections
+    full_history = load_farm_history(farm.id)
+    history = full_history.downsampled(CHART_POINTS)
     
     performance_data = {
-        'dates': [performance.date.strftime('%Y-%m-%d') for performance in performances],
-        'profits': [performance.profit for performance in performances]
+        'dates': history.date_labels(),
+        'profits': json_values(history.profits)
     }
     
-    # Calculate ROI projections based on historical data
+    # Summary statistics come from the farm's rollups rather than its full history
+    performance_summary = farm_summary(farm.id)
+    
+    # Simulated ROI bands once there is enough historical data
     roi_projections = []
-    if performances:
-        # Simple projection based on average profit growth
-        profits = [p.profit for p in performances]
-        if len(profits) > 1:
-            avg_growth = np.mean([(profits[i] / profits[i-1]) - 1 for i in range(1, len(profits))])
-            for month in range(1, opportunity.duration_months + 1):
-                projected_roi = opportunity.expected_roi * (month / opportunity.duration_months)
-                roi_projections.append({
-                    'month': month,
-                    'projected_roi': projected_roi
-                })
+    if performance_summary and performance_summary['periods'] > 1:
+        roi_projections = cached_roi_projections(opportunity, farm, full_history)
     
     return render_template('investments/invest.html', 
                           opportunity=opportunity,
                           farm=farm,
                           remaining=remaining,
                           performance_data=json.dumps(performance_data),
+                          performance_summary=performance_summary,
                           roi_projections=roi_projections)
 
 
 # API Routes for AJAX requests
 
-@app.route('/api/farm-performance/<int:farm_id>')
+@bp.route('/api/farms')
+def api_farms():
+    """API endpoint for the keyset-paginated farm listing"""
+    try:
+        page = farm_page(request.args)
+    except InvalidCursor:
+        return jsonify({'error': 'invalid cursor'}), 400
+    return jsonify(page_to_dict(page, farm_to_dict))
+
+
+@bp.route('/api/opportunities')
+def api_opportunities():
+    """API endpoint for the keyset-paginated listing of open investment opportunities, with facet counts"""
+    try:
+        page = opportunity_page(request.args)
+    except InvalidCursor:
+        return jsonify({'error': 'invalid cursor'}), 400
+    data = page_to_dict(page, opportunity_to_dict)
+    data['total'] = page.total
+    data['facets'] = page.facets
+    return jsonify(data)
+
+
+# Rows fetched per round trip when streaming a farm's history
+PERFORMANCE_STREAM_BATCH = 1000
+
+# Streamed rows use the field names of the NDJSON upload feed, so exports can be re-ingested
+PERFORMANCE_EXPORT_COLUMNS = (
+    FarmPerformance.farm_id,
+    FarmPerformance.date,
+    FarmPerformance.yield_amount,
+    FarmPerformance.revenue,
+    FarmPerformance.expenses,
+    FarmPerformance.profit,
+    FarmPerformance.weather_conditions
+)
+
+
+def _resolution_args():
+    """(points, method) of the points/downsample request args; raises ValueError when malformed"""
+    from downsample import METHODS, MIN_POINTS, MAX_POINTS
+    points = request.args.get('points')
+    method = request.args.get('downsample', 'lttb')
+    if method not in METHODS:
+        raise ValueError(f"downsample must be one of {', '.join(METHODS)}")
+    if points is None:
+        return None, method
+    if not points.isdigit() or not MIN_POINTS <= int(points) <= MAX_POINTS:
+        raise ValueError(f'points must be between {MIN_POINTS} and {MAX_POINTS}')
+    return int(points), method
+
+
+def _date_arg(name):
+    """Optional YYYY-MM-DD request argument; raises ValueError when malformed"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{name} must be YYYY-MM-DD')
+
+
+def _performance_query(farm_id, columns):
+    """Date-ordered performance rows of a farm, narrowed by the start/end/limit request args"""
+    start, end = _date_arg('start'), _date_arg('end')
+    limit = request.args.get('limit')
+    if limit is not None and (not limit.isdigit() or int(limit) < 1):
+        raise ValueError('limit must be a positive integer')
+    
+    query = db.select(*columns).where(FarmPerformance.farm_id == farm_id).order_by(FarmPerformance.date)
+    if start:
+        query = query.where(FarmPerformance.date >= start)
+    if end:
+        query = query.where(FarmPerformance.date <= end)
+    if limit is not None:
+        query = query.limit(int(limit))
+    return query
+
+
+def _performance_ndjson(query):
+    """NDJSON lines of a performance query, fetched in batches through a server-side cursor"""
+    names = [column.key for column in PERFORMANCE_EXPORT_COLUMNS]
+    result = db.session.execute(query.execution_options(yield_per=PERFORMANCE_STREAM_BATCH))
+    try:
+        for rows in result.partitions():
+            lines = []
+            for row in rows:
+                record = dict(zip(names, row))
+                record['date'] = record['date'].strftime('%Y-%m-%d')
+                lines.append(json.dumps(record))
+            yield '\n'.join(lines) + '\n'
+    finally:
+        result.close()
+
+
+@bp.route('/api/farm-performance/<int:farm_id>')
+@farm_cached
 def api_farm_performance(farm_id):
-    """API endpoint for farm performance data"""
+    """API endpoint for farm performance data, optionally a date range streamed as NDJSON
+
+    The JSON body holds every row of the requested range in memory, and without
+    start/end/limit that is the whole history; format=ndjson streams it instead.
+    """
     farm = Farm.query.get_or_404(farm_id)
-    performances = FarmPerformance.query.filter_by(farm_id=farm_id).order_by(FarmPerformance.date).all()
+    try:
+        points, method = _resolution_args()
+        if request.args.get('format') == 'ndjson':
+            query = _performance_query(farm_id, PERFORMANCE_EXPORT_COLUMNS)
+            # Rows go out as they are read, so memory stays flat however long the history is
+            return Response(stream_with_context(_performance_ndjson(query)), mimetype='application/x-ndjson')
+        query = _performance_query(farm_id, (
+            FarmPerformance.date,
+            FarmPerformance.profit,
+            FarmPerformance.revenue,
+            FarmPerformance.expenses,
+            FarmPerformance.yield_amount
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    performances = db.session.execute(query).all()
+    
+    # Thin long histories to the requested chart resolution
+    if points:
+        from downsample import downsample_indices, take
+        indices = downsample_indices([[row.profit for row in performances],
+                                      [row.revenue for row in performances],
+                                      [row.expenses for row in performances],
+                                      [row.yield_amount for row in performances]], points, method)
+        if indices is not None:
+            performances = take(performances, indices)
     
     data = {
         'farm_name': farm.name,
@@ -346,28 +490,74 @@ def api_farm_performance(farm_id):
     return jsonify(data)
 
 
-@app.route('/api/investment-summary')
+@bp.route('/api/farm-performance/upload', methods=['POST'])
+@login_required
+def api_farm_performance_upload():
+    """API endpoint for bulk CSV/NDJSON performance feed uploads by farm managers"""
+    if current_user.is_investor:
+        abort(403)
+    
+    # Either a multipart file field or the raw request body
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or detect_format(content_type=request.mimetype)
+    batch_size = min(request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int), DEFAULT_BATCH_SIZE)
+    
+    try:
+        report = ingest_stream(stream, fmt, max(batch_size, 1), owner_id=current_user.id)
+    except IngestionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(report.to_dict())
+
+
+@bp.route('/api/farm-summary/<int:farm_id>')
+def api_farm_summary(farm_id):
+    """API endpoint for a farm's rolled-up performance statistics"""
+    farm = Farm.query.get_or_404(farm_id)
+    granularity = request.args.get('granularity', 'year')
+    if granularity not in ('month', 'year'):
+        abort(400)
+    
+    data = {
+        'farm_name': farm.name,
+        'summary': farm_summary(farm_id),
+        'granularity': granularity,
+        'periods': farm_periods(farm_id, granularity)
+    }
+    
+    return jsonify(data)
+
+
+@bp.route('/api/investment-summary')
 @login_required
 def api_investment_summary():
     """API endpoint for investment summary data"""
-    investments = Investment.query.filter_by(user_id=current_user.id).all()
-    
-    # Group investments by farm type
-    farm_type_investments = {}
-    for investment in investments:
-        farm_type = investment.opportunity.farm.farm_type
-        if farm_type not in farm_type_investments:
-            farm_type_investments[farm_type] = 0
-        farm_type_investments[farm_type] += investment.amount
+    # Group investments by farm type and sum amounts and ROI in SQL
+    first_investment = db.func.min(Investment.id)
+    rows = db.session.execute(
+        db.select(
+            Farm.farm_type,
+            db.func.sum(Investment.amount),
+            db.func.sum(Investment.amount * (InvestmentOpportunity.expected_roi / 100))
+        )
+        .join(Investment.opportunity)
+        .join(InvestmentOpportunity.farm)
+        .where(Investment.user_id == current_user.id)
+        .group_by(Farm.farm_type)
+        .order_by(first_investment)
+    ).all()
     
     # Prepare data for charts
-    farm_types = list(farm_type_investments.keys())
-    investment_amounts = list(farm_type_investments.values())
+    farm_types = [row[0] for row in rows]
+    investment_amounts = [row[1] for row in rows]
     
     # Calculate total ROI
-    total_roi = 0
-    for investment in investments:
-        total_roi += investment.amount * (investment.opportunity.expected_roi / 100)
+    total_roi = sum(row[2] for row in rows)
     
     data = {
         'farm_types': farm_types,
@@ -379,284 +569,125 @@ def api_investment_summary():
     return jsonify(data)
 
 
+@bp.route('/api/portfolio-timeseries')
+@login_required
+def api_portfolio_timeseries():
+    """API endpoint for the value and ROI of the user's portfolio month by month"""
+    from portfolio import cached_portfolio_timeseries
+    return Response(cached_portfolio_timeseries(current_user.id), mimetype='application/json')
+
+
 # New API Routes for Dynamic Charts & Analytics
 
-@app.route('/api/roi-trends/<int:opportunity_id>')
+@bp.route('/api/roi-trends/<int:opportunity_id>')
 @login_required
 def api_roi_trends(opportunity_id):
     """API endpoint for ROI trends over time"""
+    from analytics import load_farm_history, roi_trends_data
     opportunity = InvestmentOpportunity.query.get_or_404(opportunity_id)
     farm = opportunity.farm
-    
-    # Get farm performance data
-    performances = FarmPerformance.query.filter_by(farm_id=farm.id).order_by(FarmPerformance.date).all()
-    
-    # Calculate ROI for each period based on profits and investment amount
-    dates = [performance.date.strftime('%Y-%m-%d') for performance in performances]
-    
-    # Calculate monthly ROI values based on profit margins
-    roi_values = []
-    cumulative_roi = 0
-    target_roi = opportunity.expected_roi
-    
-    for performance in performances:
-        # For demo purposes, we'll simulate ROI growth trend
-        if performance.revenue > 0:
-            period_roi = (performance.profit / performance.revenue) * 100
-            # Adjust based on target ROI
-            adjusted_roi = period_roi * (target_roi / 15)  # Scaling factor
-            roi_values.append(round(adjusted_roi, 2))
-            cumulative_roi += adjusted_roi
-        else:
-            roi_values.append(0)
-    
-    # Project future ROI if needed to extend the chart
-    if len(dates) < 12:
-        # Calculate simple trend for projection
-        avg_period_roi = target_roi / 12
-        for i in range(len(dates), 12):
-            projected_date = datetime.strptime(dates[-1], '%Y-%m-%d')
-            projected_date = projected_date.replace(month=projected_date.month + (i - len(dates) + 1))
-            dates.append(projected_date.strftime('%Y-%m-%d'))
-            roi_values.append(round(roi_values[-1] * 1.05, 2))  # 5% growth each period
-    
-    data = {
-        'opportunity_name': opportunity.title,
-        'farm_name': farm.name,
-        'target_roi': target_roi,
-        'dates': dates,
-        'roi_values': roi_values,
-        'cumulative_roi': round(cumulative_roi, 2)
-    }
-    
-    return jsonify(data)
+    try:
+        points, method = _resolution_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(roi_trends_data(opportunity, farm, load_farm_history(farm.id), points, method))
 
 
-@app.route('/api/weather-yield/<int:farm_id>')
+@bp.route('/api/weather-yield/<int:farm_id>')
+@farm_cached
 def api_weather_yield(farm_id):
     """API endpoint for weather vs. yield prediction data"""
+    from analytics import load_farm_history, weather_yield_data
     farm = Farm.query.get_or_404(farm_id)
-    performances = FarmPerformance.query.filter_by(farm_id=farm_id).order_by(FarmPerformance.date).all()
-    
-    # Extract dates, yields and weather data
-    dates = [performance.date.strftime('%Y-%m-%d') for performance in performances]
-    yields_actual = [performance.yield_amount for performance in performances]
-    weather_conditions = [performance.weather_conditions for performance in performances]
-    
-    # Generate predicted yields based on weather correlation
-    # For demo purposes, we'll create a simple weather-to-yield relationship
-    yields_predicted = []
-    
-    # Weather impact scores (simplified)
-    weather_impact = {
-        'Sunny': 1.1,
-        'Cloudy': 0.9,
-        'Rainy': 0.8,
-        'Storm': 0.6,
-        'Drought': 0.5,
-        'Ideal': 1.2,
-        'Cold': 0.7,
-        'Hot': 0.85
-    }
-    
-    # Calculate predicted yields based on weather
-    base_yield = sum(yields_actual) / len(yields_actual) if yields_actual else 0
-    for condition in weather_conditions:
-        # Default impact if weather condition not in dictionary
-        impact = weather_impact.get(condition, 1.0)
-        predicted = base_yield * impact
-        yields_predicted.append(round(predicted, 2))
-    
-    # Project future yields based on seasonal patterns
-    # This would use more sophisticated models in a real application
-    future_dates = []
-    future_predictions = []
-    
-    # For demo purposes, project 3 months ahead
-    if dates:
-        last_date = datetime.strptime(dates[-1], '%Y-%m-%d')
-        for i in range(1, 4):
-            future_date = last_date.replace(month=last_date.month + i)
-            future_dates.append(future_date.strftime('%Y-%m-%d'))
-            
-            # Simple yield prediction based on seasonality
-            month_factor = 1 + (0.1 * ((future_date.month % 12) / 12))
-            future_yield = base_yield * month_factor
-            future_predictions.append(round(future_yield, 2))
-    
-    data = {
-        'farm_name': farm.name,
-        'dates': dates,
-        'future_dates': future_dates,
-        'yields_actual': yields_actual,
-        'yields_predicted': yields_predicted,
-        'future_predictions': future_predictions,
-        'weather_conditions': weather_conditions
-    }
-    
-    return jsonify(data)
+    try:
+        points, method = _resolution_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(weather_yield_data(farm, load_farm_history(farm_id), points, method))
 
 
-@app.route('/api/market-price-prediction/<int:farm_id>')
+@bp.route('/api/market-price-prediction/<int:farm_id>')
+@farm_cached
 def api_market_price_prediction(farm_id):
     """API endpoint for market price prediction data"""
+    from analytics import load_farm_history, market_price_data
     farm = Farm.query.get_or_404(farm_id)
-    performances = FarmPerformance.query.filter_by(farm_id=farm_id).order_by(FarmPerformance.date).all()
-    
-    # Extract dates and revenue data
-    dates = [performance.date.strftime('%Y-%m-%d') for performance in performances]
-    revenues = [performance.revenue for performance in performances]
-    yields_actual = [performance.yield_amount for performance in performances]
-    
-    # Calculate historical price per unit
-    prices = []
-    for i in range(len(revenues)):
-        if yields_actual[i] > 0:
-            price = revenues[i] / yields_actual[i]
-            prices.append(round(price, 2))
-        else:
-            # If yield is zero, use previous price or a default
-            previous_price = prices[-1] if prices else 10.0
-            prices.append(previous_price)
-    
-    # For prediction, we'll use a simple time series forecast
-    # In a real app, this would use a more sophisticated model
-    future_dates = []
-    future_prices = []
-    
-    if prices:
-        # Calculate trend
-        if len(prices) >= 2:
-            avg_change = sum([(prices[i] - prices[i-1]) for i in range(1, len(prices))]) / (len(prices) - 1)
-        else:
-            avg_change = 0
-            
-        # Add seasonality factor
-        last_date = datetime.strptime(dates[-1], '%Y-%m-%d') if dates else datetime.now()
-        last_price = prices[-1] if prices else 10.0
-        
-        # Project 6 months ahead
-        for i in range(1, 7):
-            projected_date = last_date.replace(month=((last_date.month - 1 + i) % 12) + 1)
-            if projected_date.month == 1:
-                projected_date = projected_date.replace(year=projected_date.year + 1)
-                
-            future_dates.append(projected_date.strftime('%Y-%m-%d'))
-            
-            # Seasonal factor (highest in summer, lowest in winter)
-            month = projected_date.month
-            seasonal_factor = 1 + 0.1 * math.sin(math.pi * (month - 3) / 6)
-            
-            # Project price with trend and seasonality
-            projected_price = last_price + (avg_change * i * seasonal_factor)
-            future_prices.append(round(max(projected_price, 0.1), 2))  # Ensure no negative prices
-    
-    data = {
-        'farm_name': farm.name,
-        'farm_type': farm.farm_type,
-        'dates': dates,
-        'historical_prices': prices,
-        'future_dates': future_dates,
-        'predicted_prices': future_prices
-    }
-    
-    return jsonify(data)
+    try:
+        points, method = _resolution_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(market_price_data(farm, load_farm_history(farm_id), points, method))
 
 
-@app.route('/api/risk-levels/<int:opportunity_id>')
+@bp.route('/api/risk-levels/<int:opportunity_id>')
 @login_required
 def api_risk_levels(opportunity_id):
     """API endpoint for investment risk levels over time"""
+    from analytics import load_farm_history, risk_levels_data
     opportunity = InvestmentOpportunity.query.get_or_404(opportunity_id)
     farm = opportunity.farm
-    
-    # Get farm performance data
-    performances = FarmPerformance.query.filter_by(farm_id=farm.id).order_by(FarmPerformance.date).all()
-    
-    # Extract dates
-    dates = [performance.date.strftime('%Y-%m-%d') for performance in performances]
-    
-    # Calculate risk factors based on multiple indicators
-    volatility_risks = []
-    weather_risks = []
-    financial_risks = []
-    overall_risks = []
-    
-    # Weather risk mapping
-    weather_risk = {
-        'Sunny': 10,
-        'Cloudy': 25,
-        'Rainy': 40,
-        'Storm': 75,
-        'Drought': 90,
-        'Ideal': 5,
-        'Cold': 50,
-        'Hot': 60
-    }
-    
-    # Calculate initial base risk from opportunity
-    if opportunity.risk_level == "Low":
-        base_risk = 20
-    elif opportunity.risk_level == "Medium":
-        base_risk = 50
-    else:  # High
-        base_risk = 75
-    
-    for i, performance in enumerate(performances):
-        # Volatility risk based on profit variability
-        if i > 0 and performances[i-1].profit > 0:
-            profit_change = abs((performance.profit - performances[i-1].profit) / performances[i-1].profit)
-            vol_risk = min(int(profit_change * 100), 100)
-        else:
-            vol_risk = base_risk
-        volatility_risks.append(vol_risk)
-        
-        # Weather risk based on conditions
-        w_risk = weather_risk.get(performance.weather_conditions, 30)
-        weather_risks.append(w_risk)
-        
-        # Financial risk based on profit margin
-        if performance.revenue > 0:
-            profit_margin = performance.profit / performance.revenue
-            fin_risk = max(min(int((1 - profit_margin) * 100), 100), 0)
-        else:
-            fin_risk = base_risk
-        financial_risks.append(fin_risk)
-        
-        # Calculate weighted overall risk
-        overall_risk = int(0.3 * vol_risk + 0.3 * w_risk + 0.4 * fin_risk)
-        overall_risks.append(overall_risk)
-    
-    # Risk category mapping
-    risk_categories = []
-    for risk in overall_risks:
-        if risk < 30:
-            risk_categories.append("Low")
-        elif risk < 60:
-            risk_categories.append("Medium")
-        else:
-            risk_categories.append("High")
-    
-    data = {
-        'opportunity_name': opportunity.title,
-        'farm_name': farm.name,
-        'dates': dates,
-        'volatility_risks': volatility_risks,
-        'weather_risks': weather_risks,
-        'financial_risks': financial_risks,
-        'overall_risks': overall_risks,
-        'risk_categories': risk_categories,
-        'base_risk_level': opportunity.risk_level
-    }
+    try:
+        points, method = _resolution_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(risk_levels_data(opportunity, farm, load_farm_history(farm.id), points, method))
+
+
+@bp.route('/api/analytics/<int:farm_id>')
+@login_required
+def api_analytics_bundle(farm_id):
+    """API endpoint for several analytics series of a farm from one history load"""
+    from analytics import (load_farm_history, roi_trends_data, weather_yield_data, market_price_data,
+                           risk_levels_data, FARM_SERIES, OPPORTUNITY_SERIES)
+    farm = Farm.query.get_or_404(farm_id)
+    opportunity_id = request.args.get('opportunity_id', type=int)
+    
+    # Farm series by default, plus the opportunity series when a project is selected
+    requested = request.args.get('series')
+    if requested:
+        series = [name.strip() for name in requested.split(',') if name.strip()]
+    else:
+        series = list(FARM_SERIES) + (list(OPPORTUNITY_SERIES) if opportunity_id else [])
+    unknown = [name for name in series if name not in FARM_SERIES + OPPORTUNITY_SERIES]
+    if unknown:
+        return jsonify({'error': f"unknown series: {', '.join(unknown)}"}), 400
+    try:
+        points, method = _resolution_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    opportunity = None
+    if any(name in OPPORTUNITY_SERIES for name in series):
+        if opportunity_id is None:
+            return jsonify({'error': 'opportunity_id is required for ' + ', '.join(OPPORTUNITY_SERIES)}), 400
+        opportunity = InvestmentOpportunity.query.filter_by(id=opportunity_id, farm_id=farm_id).first_or_404()
+    
+    # One performance query serves every requested series
+    history = load_farm_history(farm_id)
+    data = {}
+    if 'roi_trends' in series:
+        data['roi_trends'] = roi_trends_data(opportunity, farm, history, points, method)
+    if 'weather_yield' in series:
+        data['weather_yield'] = weather_yield_data(farm, history, points, method)
+    if 'market_price_prediction' in series:
+        data['market_price_prediction'] = market_price_data(farm, history, points, method)
+    if 'risk_levels' in series:
+        data['risk_levels'] = risk_levels_data(opportunity, farm, history, points, method)
     
     return jsonify(data)
 
 
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint for request latency and SQL query metrics"""
+    return Response(metrics.registry.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
 # Error handlers
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_server_error(e):
     return render_template('500.html'), 500
@@ -0,0 +1,125 @@
+"""
+Packed per-year arrays of farm performance histories
+Every farm's FarmPerformance rows are mirrored as one FarmSeriesSegment per
+calendar year: the dates and each metric packed into a binary column, so the
+analytics read a farm's history as a few blobs and decode them straight into
+NumPy arrays instead of fetching and converting one row per period. The
+segments of the touched years are repacked from their rows in the same
+transaction as the write (see rollups.py for the ORM hook); writers that bypass
+the ORM call refresh() once per batch, like they do for the rollups.
+Packing uses the array module, so writers never import NumPy.
+"""
+
+import sys
+import json
+import math
+from array import array
+from collections import defaultdict
+from datetime import date, datetime
+
+import sqlalchemy as sa
+
+from models import FarmPerformance, FarmSeriesSegment
+
+
+# Dtypes of the packed columns, as NumPy spells them for decoding
+DAY_DTYPE = '<i4'
+VALUE_DTYPE = '<f8'
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+ROW_COLUMNS = (
+    FarmPerformance.date,
+    FarmPerformance.yield_amount,
+    FarmPerformance.revenue,
+    FarmPerformance.expenses,
+    FarmPerformance.profit,
+    FarmPerformance.weather_conditions
+)
+
+# Farms per repack query, well below the bound-parameter limits
+CHUNK_SIZE = 400
+
+segment_table = FarmSeriesSegment.__table__
+
+
+def _pack(typecode, values):
+    packed = array(typecode, values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _value(value):
+    return float(value) if value is not None else math.nan
+
+
+def pack_rows(farm_id, year, rows):
+    """Segment values from (date, yield, revenue, expenses, profit, weather) rows in date order"""
+    return {
+        'farm_id': farm_id,
+        'year': year,
+        'row_count': len(rows),
+        'days': _pack('i', [row[0].toordinal() - EPOCH_ORDINAL for row in rows]),
+        'yields': _pack('d', [_value(row[1]) for row in rows]),
+        'revenues': _pack('d', [_value(row[2]) for row in rows]),
+        'expenses': _pack('d', [_value(row[3]) for row in rows]),
+        'profits': _pack('d', [_value(row[4]) for row in rows]),
+        'weather_conditions': json.dumps([row[5] for row in rows])
+    }
+
+
+def refresh(connection, touched):
+    """Repack the segments of the years touched by changes to (farm_id, year, month) periods"""
+    years_by_farm = defaultdict(set)
+    for farm_id, year, _ in touched:
+        years_by_farm[farm_id].add(year)
+    farm_ids = sorted(years_by_farm)
+    for i in range(0, len(farm_ids), CHUNK_SIZE):
+        _refresh_farms(connection, {farm_id: years_by_farm[farm_id] for farm_id in farm_ids[i:i + CHUNK_SIZE]})
+
+
+def _refresh_farms(connection, years_by_farm):
+    all_years = set().union(*years_by_farm.values())
+    rows = connection.execute(
+        sa.select(FarmPerformance.farm_id, *ROW_COLUMNS)
+        .where(
+            FarmPerformance.farm_id.in_(list(years_by_farm)),
+            FarmPerformance.date >= date(min(all_years), 1, 1),
+            FarmPerformance.date < date(max(all_years) + 1, 1, 1)
+        )
+        .order_by(FarmPerformance.farm_id, FarmPerformance.date, FarmPerformance.id)
+    ).all()
+    grouped = defaultdict(list)
+    for row in rows:
+        if row[1].year in years_by_farm[row[0]]:
+            grouped[(row[0], row[1].year)].append(row[1:])
+
+    # One delete per year keeps the IN list to the farms of this chunk
+    farms_by_year = defaultdict(list)
+    for farm_id, years in years_by_farm.items():
+        for year in years:
+            farms_by_year[year].append(farm_id)
+    for year, farm_ids in farms_by_year.items():
+        connection.execute(
+            segment_table.delete().where(segment_table.c.year == year, segment_table.c.farm_id.in_(farm_ids))
+        )
+
+    if grouped:
+        now = datetime.utcnow()
+        connection.execute(segment_table.insert(), [
+            dict(pack_rows(farm_id, year, year_rows), updated_at=now)
+            for (farm_id, year), year_rows in grouped.items()
+        ])
+
+
+def rebuild(connection):
+    """Repack every segment from scratch (backfill, or after bulk deletes)"""
+    connection.execute(segment_table.delete())
+    farm_ids = connection.execute(sa.select(FarmPerformance.farm_id).distinct()).scalars().all()
+    for i in range(0, len(farm_ids), CHUNK_SIZE):
+        chunk = farm_ids[i:i + CHUNK_SIZE]
+        dates = connection.execute(
+            sa.select(FarmPerformance.farm_id, FarmPerformance.date).where(FarmPerformance.farm_id.in_(chunk))
+        )
+        refresh(connection, {(farm_id, day.year, day.month) for farm_id, day in dates})
@@ -12,6 +12,49 @@ let riskLevelsChart = null;
 // Chart type configuration (line is default)
 let chartType = 'line';
 
+// Series of the /api/analytics bundle: per farm, and per selected project
+const FARM_SERIES = ['weather_yield', 'market_price_prediction'];
+const OPPORTUNITY_SERIES = ['roi_trends', 'risk_levels'];
+
+// Points per chart line; the server downsamples longer histories to this
+const CHART_POINTS = 200;
+
+// How each bundle series updates (or resets) its chart, summary and insights
+const SERIES_HANDLERS = {
+    roi_trends: {
+        update: data => {
+            updateROITrendsChart(data);
+            updateROITrendsSummary(data);
+            generateROIInsights(data);
+        },
+        reset: () => resetROIChart()
+    },
+    weather_yield: {
+        update: data => {
+            updateWeatherYieldChart(data);
+            updateWeatherYieldSummary(data);
+            generateWeatherInsights(data);
+        },
+        reset: () => resetWeatherChart()
+    },
+    market_price_prediction: {
+        update: data => {
+            updateMarketPriceChart(data);
+            updateMarketPriceSummary(data);
+            generateMarketPriceInsights(data);
+        },
+        reset: () => resetMarketPriceChart()
+    },
+    risk_levels: {
+        update: data => {
+            updateRiskLevelsChart(data);
+            updateRiskLevelsSummary(data);
+            generateRiskInsights(data);
+        },
+        reset: () => resetRiskChart()
+    }
+};
+
 // Modal information content
 const chartInfo = {
     roi: `<p>This chart displays Return on Investment (ROI) trends over time, showing actual returns compared to target ROI.</p>
@@ -83,8 +126,7 @@ function setupEventListeners() {
         const farmId = this.value;
         if (farmId) {
             fetchFarmOpportunities(farmId);
-            loadWeatherYieldData(farmId);
-            loadMarketPriceData(farmId);
+            loadAnalyticsBundle(farmId, null, FARM_SERIES);
         } else {
             // Reset opportunity select
             const opportunitySelect = document.getElementById('opportunitySelect');
@@ -100,8 +142,8 @@ function setupEventListeners() {
     document.getElementById('opportunitySelect').addEventListener('change', function() {
         const opportunityId = this.value;
         if (opportunityId) {
-            loadROITrendsData(opportunityId);
-            loadRiskLevelsData(opportunityId);
+            const farmId = document.getElementById('farmSelect').value;
+            loadAnalyticsBundle(farmId, opportunityId, OPPORTUNITY_SERIES);
         } else {
             // Reset ROI and Risk charts
             resetROIChart();
@@ -279,19 +321,34 @@ function updateOpportunitySelect(opportunities) {
 }
 
 /**
- * Load ROI trends data for a specific opportunity
+ * Load several analytics series for a farm (and project) in one request
  */
-function loadROITrendsData(opportunityId) {
-    fetch(`/api/roi-trends/${opportunityId}`)
-        .then(response => response.json())
+function loadAnalyticsBundle(farmId, opportunityId, series) {
+    const params = new URLSearchParams({ series: series.join(','), points: CHART_POINTS });
+    if (opportunityId) {
+        params.set('opportunity_id', opportunityId);
+    }
+    
+    fetch(`/api/analytics/${farmId}?${params}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
         .then(data => {
-            updateROITrendsChart(data);
-            updateROITrendsSummary(data);
-            generateROIInsights(data);
+            series.forEach(name => {
+                const handler = SERIES_HANDLERS[name];
+                if (data[name]) {
+                    handler.update(data[name]);
+                } else {
+                    handler.reset();
+                }
+            });
         })
         .catch(error => {
-            console.error('Error loading ROI trends data:', error);
-            resetROIChart();
+            console.error('Error loading analytics data:', error);
+            series.forEach(name => SERIES_HANDLERS[name].reset());
         });
 }
 
@@ -382,23 +439,6 @@ function updateROITrendsSummary(data) {
         '</span>';
 }
 
-/**
- * Load weather vs. yield data for a specific farm
- */
-function loadWeatherYieldData(farmId) {
-    fetch(`/api/weather-yield/${farmId}`)
-        .then(response => response.json())
-        .then(data => {
-            updateWeatherYieldChart(data);
-            updateWeatherYieldSummary(data);
-            generateWeatherInsights(data);
-        })
-        .catch(error => {
-            console.error('Error loading weather vs. yield data:', error);
-            resetWeatherChart();
-        });
-}
-
 /**
  * Update the weather vs. yield chart with data
  */
@@ -546,23 +586,6 @@ function updateWeatherYieldSummary(data) {
     });
 }
 
-/**
- * Load market price prediction data for a specific farm
- */
-function loadMarketPriceData(farmId) {
-    fetch(`/api/market-price-prediction/${farmId}`)
-        .then(response => response.json())
-        .then(data => {
-            updateMarketPriceChart(data);
-            updateMarketPriceSummary(data);
-            generateMarketPriceInsights(data);
-        })
-        .catch(error => {
-            console.error('Error loading market price prediction data:', error);
-            resetMarketPriceChart();
-        });
-}
-
 /**
  * Update the market price chart with data
  */
@@ -678,23 +701,6 @@ function updateMarketPriceSummary(data) {
     }
 }
 
-/**
- * Load risk levels data for a specific opportunity
- */
-function loadRiskLevelsData(opportunityId) {
-    fetch(`/api/risk-levels/${opportunityId}`)
-        .then(response => response.json())
-        .then(data => {
-            updateRiskLevelsChart(data);
-            updateRiskLevelsSummary(data);
-            generateRiskInsights(data);
-        })
-        .catch(error => {
-            console.error('Error loading risk levels data:', error);
-            resetRiskChart();
-        });
-}
-
 /**
  * Update the risk levels chart with data
  */
@@ -979,13 +985,9 @@ function refreshAllCharts() {
     const opportunityId = document.getElementById('opportunitySelect').value;
     
     if (farmId) {
-        loadWeatherYieldData(farmId);
-        loadMarketPriceData(farmId);
-        
-        if (opportunityId) {
-            loadROITrendsData(opportunityId);
-            loadRiskLevelsData(opportunityId);
-        }
+        // One request for every chart on screen
+        const series = opportunityId ? FARM_SERIES.concat(OPPORTUNITY_SERIES) : FARM_SERIES;
+        loadAnalyticsBundle(farmId, opportunityId, series);
     }
 }
 
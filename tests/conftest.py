@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """An app on a fresh, migrated SQLite database, with the per-process caches emptied
+
+    No app context is left pushed, so each test request gets its own, as in production.
+    """
+    from app import create_app, db
+    import migrations
+    from fragments import fragment_cache
+    from http_cache import response_cache
+    from identity import identity_cache
+    from pagination import opportunity_index
+
+    app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}"})
+    for cache in (fragment_cache, response_cache, identity_cache, opportunity_index):
+        cache.clear()
+    with app.app_context():
+        migrations.upgrade()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def farm_id(app):
+    """Id of a farm with a year of daily performance rows, owned by a farm manager"""
+    from datetime import date, timedelta
+    from app import db
+    from models import User, Farm, FarmPerformance
+
+    with app.app_context():
+        owner = User(username="manager", email="manager@example.com", password_hash="x", is_investor=False)
+        db.session.add(owner)
+        db.session.flush()
+        farm = Farm(name="Test Farm", location="Nakuru", description="Maize and beans", farm_type="Crop",
+                    total_funding_needed=10000, expected_roi=12.0, risk_level="Low", owner_id=owner.id)
+        db.session.add(farm)
+        for day in range(365):
+            revenue = 100.0 + day
+            db.session.add(FarmPerformance(farm=farm, date=date(2024, 1, 1) + timedelta(days=day),
+                                           yield_amount=10 + day % 7, revenue=revenue, expenses=60.0,
+                                           profit=revenue - 60.0, weather_conditions='{"rainfall": 3}'))
+        db.session.commit()
+        return farm.id
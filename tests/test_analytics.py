@@ -0,0 +1,42 @@
+import json
+from datetime import date
+
+import pytest
+
+from app import db
+from models import FarmPerformance
+
+
+def _strict_json(response):
+    """The response body parsed as standard JSON, which has no NaN or Infinity"""
+    def reject(constant):
+        raise ValueError(f"{constant} is not valid JSON")
+    return json.loads(response.get_data(as_text=True), parse_constant=reject)
+
+
+@pytest.fixture
+def missing_yield(app, farm_id):
+    """A performance row of the farm with a NULL yield"""
+    with app.app_context():
+        db.session.add(FarmPerformance(farm_id=farm_id, date=date(2025, 1, 1), yield_amount=None, revenue=150.0,
+                                       expenses=60.0, profit=90.0, weather_conditions='{"rainfall": 3}'))
+        db.session.commit()
+
+
+def test_missing_yield_is_null_in_weather_yield(client, farm_id, missing_yield):
+    data = _strict_json(client.get(f"/api/weather-yield/{farm_id}"))
+    assert data["dates"][-1] == "2025-01-01"
+    assert data["yields_actual"][-1] is None
+    assert all(value is not None for value in data["yields_actual"][:-1])
+
+
+def test_missing_yield_keeps_market_prices_finite(client, farm_id, missing_yield):
+    data = _strict_json(client.get(f"/api/market-price-prediction/{farm_id}"))
+    # The period without a yield carries the previous price forward
+    assert data["historical_prices"][-1] == data["historical_prices"][-2]
+
+
+def test_missing_yield_downsampled(client, farm_id, missing_yield):
+    data = _strict_json(client.get(f"/api/weather-yield/{farm_id}?points=50"))
+    assert len(data["dates"]) <= 50
+    assert data["yields_actual"][-1] is None
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import assets
+
+
+def _write(static_dir, name, content):
+    path = static_dir / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+def test_build_fails_without_the_vendored_assets(tmp_path):
+    static_dir = tmp_path / "static"
+    _write(static_dir, "css/custom.css", b"body { color: red; }")
+    with pytest.raises(assets.BuildError, match="not vendored"):
+        assets.build(str(static_dir), str(static_dir / "dist"))
+    assert not (static_dir / "dist").exists()
+
+
+def test_build_with_the_vendored_assets(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, "icon_variants", lambda: {})
+    monkeypatch.setattr(assets, "_manifest", None)
+    static_dir = tmp_path / "static"
+    for name in assets.VENDOR_ASSETS:
+        _write(static_dir, name, b"/* vendored */")
+    manifest = assets.build(str(static_dir), str(static_dir / "dist"))
+    assert set(assets.VENDOR_ASSETS) <= set(manifest)
+    assert json.loads((static_dir / "dist" / assets.MANIFEST_NAME).read_text()) == manifest
+
+
+def test_unvendored_assets_never_point_at_a_cdn(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(assets, "_manifest", {})
+    monkeypatch.setattr(assets, "STATIC_DIR", str(tmp_path))
+    with app.test_request_context():
+        assert all(assets.asset_url(name) is None for name in assets.VENDOR_ASSETS)
+        _write(tmp_path, "vendor/chart.js/chart.umd.js", b"")
+        assert assets.asset_url("vendor/chart.js/chart.umd.js") == "/static/vendor/chart.js/chart.umd.js"
@@ -0,0 +1,29 @@
+from flask import Flask
+
+import database
+from app import create_app, db
+
+
+def test_configured_uri_gets_its_own_engine_options(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///agri_investment.db")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "postgresql+psycopg2://user@db.example.com/agri"
+    assert database.init_app(app) == "postgresql+psycopg2://user@db.example.com/agri"
+    assert app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_recycle"] == 300
+
+
+def test_create_app_builds_the_engine_for_the_configured_database(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://user@db.example.com/agri")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'override.db'}"})
+    with app.app_context():
+        assert "pool_recycle" not in app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+        with db.engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        db.engine.dispose()
+
+
+def test_config_overrides_environment_settings(monkeypatch):
+    monkeypatch.setenv("API_CACHE_MAX_AGE", "5")
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", "3")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://", "API_CACHE_MAX_AGE": 0, "PASSWORD_HASH_WORKERS": 0})
+    assert (app.config["API_CACHE_MAX_AGE"], app.config["PASSWORD_HASH_WORKERS"]) == (0, 0)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from downsample import MIN_POINTS, downsample_indices
+
+
+def _series(count, n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.normal(size=n).cumsum().tolist() for _ in range(count)]
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+@pytest.mark.parametrize("points", [MIN_POINTS, 5, 11, 12, 120])
+def test_never_keeps_more_than_the_requested_points(method, points):
+    indices = downsample_indices(_series(4), points, method)
+    assert len(indices) <= points
+    assert indices[0] == 0 and indices[-1] == 999
+
+
+def test_too_few_points_for_every_series_thins_the_leading_ones():
+    series = _series(4)
+    assert downsample_indices(series, MIN_POINTS).tolist() == downsample_indices(series[:1], MIN_POINTS).tolist()
+
+
+def test_short_series_are_kept_whole():
+    assert downsample_indices(_series(4, n=10), 10) is None
+
+
+def test_farm_performance_points_below_one_per_series(client, farm_id):
+    data = client.get(f"/api/farm-performance/{farm_id}?points={MIN_POINTS}").get_json()
+    assert len(data["dates"]) <= MIN_POINTS
+    assert data["dates"][0] == "2024-01-01" and data["dates"][-1] == "2024-12-30"
@@ -0,0 +1,45 @@
+import io
+
+from app import db
+from fragments import catalog_version
+from ingestion import ingest_stream
+from models import Farm, User, InvestmentOpportunity
+
+
+def test_home_page_shows_uncompacted_investments(app, client, farm_id):
+    with app.app_context():
+        opportunity = InvestmentOpportunity(farm_id=farm_id, title="Irrigation", amount_needed=1000,
+                                            amount_raised=680, minimum_investment=10, expected_roi=12.0)
+        investor = User(username="investor", email="investor@example.com", password_hash="x")
+        db.session.add_all([opportunity, investor])
+        db.session.commit()
+        opportunity_id, investor_id = opportunity.id, investor.id
+
+    assert "Funding: 68.0%" in client.get("/").get_data(as_text=True)
+
+    # Investing only appends a ledger event; the cached card must still change
+    with client.session_transaction() as session:
+        session["_user_id"] = str(investor_id)
+    response = client.post(f"/invest/{opportunity_id}", data={"amount": "50"})
+    assert response.status_code == 302 and response.headers["Location"].endswith("/dashboard")
+
+    page = client.get("/").get_data(as_text=True)
+    assert "Funding: 73.0%" in page
+    assert "Funding: 68.0%" not in page
+
+
+def test_catalog_version_ignores_performance_data(app, farm_id):
+    with app.app_context():
+        before = catalog_version()
+        report = ingest_stream(io.BytesIO(b"farm_id,date,yield_amount,revenue,expenses\n"
+                                          + f"{farm_id},2025-06-01,5,100,40\n".encode()), "csv")
+        assert report.inserted == 1
+        assert catalog_version() == before
+
+
+def test_catalog_version_follows_farm_edits(app, farm_id):
+    with app.app_context():
+        before = catalog_version()
+        db.session.get(Farm, farm_id).name = "Renamed Farm"
+        db.session.commit()
+        assert catalog_version() != before
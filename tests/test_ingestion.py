@@ -0,0 +1,65 @@
+import io
+import json
+from datetime import date
+
+import pytest
+
+from app import db
+from ingestion import IngestionError, RecordError, ingest_stream, validate_record
+from models import FarmPerformance
+
+
+def _record(**fields):
+    record = {"farm_id": 1, "date": "2025-01-01", "yield_amount": 10, "revenue": 150, "expenses": 60}
+    record.update(fields)
+    return record
+
+
+def _ndjson(*records):
+    return io.BytesIO("".join(json.dumps(record) + "\n" for record in records).encode())
+
+
+@pytest.mark.parametrize("field, value", [("weather_conditions", 5), ("notes", {"a": 1}), ("notes", ["x"])])
+def test_text_fields_must_be_strings(field, value):
+    with pytest.raises(RecordError, match=f"{field} is not a string"):
+        validate_record(_record(**{field: value}))
+
+
+def test_non_string_text_fields_are_rejected_per_record(app, farm_id):
+    with app.app_context():
+        report = ingest_stream(_ndjson(_record(farm_id=farm_id, weather_conditions=5),
+                                       _record(farm_id=farm_id, date="2025-01-02", notes={"a": 1}),
+                                       _record(farm_id=farm_id, date="2025-01-03")), "ndjson")
+    assert (report.inserted, report.rejected) == (1, 2)
+    assert [error.split(":")[0] for error in report.errors] == ["line 1", "line 2"]
+
+
+def test_reingesting_an_export_keeps_notes(app, farm_id):
+    with app.app_context():
+        ingest_stream(_ndjson(_record(farm_id=farm_id, notes="Irrigated", weather_conditions="Sunny")), "ndjson")
+        report = ingest_stream(_ndjson(_record(farm_id=farm_id, revenue=200)), "ndjson")
+        row = db.session.execute(
+            db.select(FarmPerformance).filter_by(farm_id=farm_id, date=date(2025, 1, 1))
+        ).scalar_one()
+        assert report.updated == 1
+        assert (row.revenue, row.notes, row.weather_conditions) == (200, "Irrigated", "Sunny")
+
+
+@pytest.mark.parametrize("fmt, body, message", [
+    ("csv", b"farm_id,date,yield_amount,revenue,expenses\n1,2025-01-01,1,2,\xff\n", "not valid UTF-8"),
+    ("ndjson", b'{"farm_id": 1}\n\xff\xfe\n', "not valid UTF-8"),
+    ("csv", b'farm_id,date,notes\n1,2025-01-01,"' + b"x" * 200000 + b'"\n', "field larger than field limit"),
+])
+def test_unreadable_feeds_raise_ingestion_error(app, fmt, body, message):
+    with app.app_context(), pytest.raises(IngestionError, match=message):
+        ingest_stream(io.BytesIO(body), fmt)
+
+
+def test_upload_of_unreadable_feed_is_a_bad_request(client, farm_id):
+    # The farm fixture's owner, a farm manager, is the first user
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+    response = client.post("/api/farm-performance/upload?format=csv", data=b"farm_id,date\n\xff\xfe\n",
+                           content_type="text/csv")
+    assert response.status_code == 400
+    assert "not valid UTF-8" in response.get_json()["error"]
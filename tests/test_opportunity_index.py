@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from app import db
+from models import Farm, InvestmentOpportunity
+from opportunity_index import OpportunityIndex, INDEX_COLUMNS, RANGE_CACHE_SIZE
+from pagination import OPPORTUNITY_SORTS
+
+
+@pytest.fixture
+def index(app):
+    """An index that syncs on every call, used within an app context (no requests are made)"""
+    with app.app_context():
+        yield OpportunityIndex(OPPORTUNITY_SORTS, sync_interval=0)
+
+
+def _opportunity(farm_id, title, **columns):
+    opportunity = InvestmentOpportunity(farm_id=farm_id, title=title, amount_needed=1000, expected_roi=10.0,
+                                        minimum_investment=100, risk_level="Low", **columns)
+    db.session.add(opportunity)
+    db.session.commit()
+    return opportunity
+
+
+def _listing(index, sort="newest", limit=10, after=None, before=None):
+    return index.find({}, OPPORTUNITY_SORTS[sort], limit, after, before)
+
+
+def test_deleted_opportunities_are_dropped(index, farm_id):
+    kept = _opportunity(farm_id, "Kept")
+    deleted = _opportunity(farm_id, "Deleted")
+    index.sync()
+    assert sorted(_listing(index)[0]) == [kept.id, deleted.id]
+
+    db.session.delete(deleted)
+    db.session.commit()
+    index.sync()
+    assert _listing(index)[0] == [kept.id]
+    assert len(index) == 1
+
+
+def test_null_created_at_sorts_last_in_newest(index, farm_id):
+    dated = _opportunity(farm_id, "Dated")
+    undated = _opportunity(farm_id, "Undated")
+    db.session.execute(db.update(InvestmentOpportunity).where(InvestmentOpportunity.id == undated.id)
+                       .values(created_at=None))
+    db.session.commit()
+    index.sync()
+
+    ids, more, total, _ = _listing(index, limit=1)
+    assert (ids, more, total) == ([dated.id], True, 2)
+    after = [dated.created_at, dated.id]
+    assert _listing(index, after=after)[0] == [undated.id]
+    assert _listing(index, before=[None, undated.id])[0] == [dated.id]
+
+
+def test_range_cache_is_bounded(index, farm_id):
+    _opportunity(farm_id, "Ranged")
+    index.sync()
+    for step in range(RANGE_CACHE_SIZE * 2):
+        assert index.find({"min_roi": 5 + step / 1000}, OPPORTUNITY_SORTS["roi"], 10)[2] == 1
+    assert len(index._range_cache) == RANGE_CACHE_SIZE
+
+
+def test_find_is_consistent_while_applying(index, farm_id):
+    opportunities = [_opportunity(farm_id, f"Opportunity {number}") for number in range(20)]
+    index.sync()
+    rows = db.session.execute(
+        db.select(*INDEX_COLUMNS)
+        .join(Farm)
+        .where(InvestmentOpportunity.id.in_([opportunity.id for opportunity in opportunities]))
+    ).all()
+    ids = {opportunity.id for opportunity in opportunities}
+    stop = threading.Event()
+
+    def churn():
+        while not stop.is_set():
+            for row in rows:
+                index.apply(row)
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        for _ in range(200):
+            page, _, total, _ = _listing(index, limit=100)
+            assert set(page) == ids and total == len(ids)
+    finally:
+        stop.set()
+        thread.join()